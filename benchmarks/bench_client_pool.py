@@ -0,0 +1,76 @@
+"""
+Benchmark connection reuse of pooled clients against a local stand-in server.
+
+Usage:
+    python benchmarks/bench_client_pool.py -n 200 --sections 5 --latency 0.05
+"""
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+from mock_server import MockLLMServer, mock_settings
+from sequencer.clients import ClientRegistry
+from sequencer.config import PoolConfig
+from sequencer.runner import SequenceRunner
+from sequencer.reader import read_sequence
+
+MODEL = "gpt-4o-2024-08-06"
+
+def write_blueprint(directory: Path, sections: int) -> Path:
+    path = directory / "bench.md"
+    parts = ["# System Prompt\n```\nYou are a benchmark.\n```"]
+    parts += [f"# Section {i}\n```\nQuestion number {i}?\n```" for i in range(1, sections + 1)]
+    path.write_text("\n\n---\n".join(parts) + "\n")
+    return path
+
+async def run_scenario(shared: bool, num_runs: int, sequence_file: Path, latency: float) -> dict:
+    sections = read_sequence(sequence_file)
+    async with MockLLMServer(latency=latency) as server:
+        settings = mock_settings(server.base_url)
+        registries = []
+        if shared:
+            registry = ClientRegistry()
+            registries.append(registry)
+            runners = [SequenceRunner(settings, clients=registry)] * num_runs
+        else:
+            # One client per run, as before the registry existed
+            registries = [ClientRegistry(PoolConfig(shards=1)) for _ in range(num_runs)]
+            runners = [SequenceRunner(settings, clients=registry) for registry in registries]
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            runner._run_model(MODEL, sections, run_id=i)
+            for i, runner in enumerate(runners)
+        ))
+        elapsed = time.perf_counter() - start
+        for registry in registries:
+            await registry.aclose()
+        return {
+            "clients": "shared" if shared else "per-run",
+            "requests": server.requests,
+            "connections": server.connections,
+            "seconds": elapsed,
+        }
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--num-runs", type=int, default=200)
+    parser.add_argument("--sections", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sequence_file = write_blueprint(Path(tmp), args.sections)
+        for shared in (False, True):
+            stats = await run_scenario(shared, args.num_runs, sequence_file, args.latency)
+            print(
+                f"{stats['clients']:>8}: {stats['requests']} requests over "
+                f"{stats['connections']} connections in {stats['seconds']:.2f}s"
+            )
+
+if __name__ == "__main__":
+    asyncio.run(main())
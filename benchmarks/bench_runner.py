@@ -0,0 +1,254 @@
+"""
+Benchmark SequenceRunner.run_sequence end to end against a local stand-in server.
+
+Each scenario runs models x runs x sections through the runner, with the
+server in a separate process so its work does not count against the
+runner's event loop. Reports throughput, tail latency, peak memory and
+event-loop lag, and can compare against a saved baseline to catch
+regressions.
+
+Usage:
+    python benchmarks/bench_runner.py
+    python benchmarks/bench_runner.py --scenario streaming --json out.json
+    python benchmarks/bench_runner.py --compare baseline.json --tolerance 0.2
+"""
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from mock_server import mock_settings
+from sequencer.clients import ClientRegistry
+from sequencer.runner import RunResult, SequenceRunner
+from sequencer.writer import StreamWriter
+
+MODELS = {
+    "openai": "gpt-4o-2024-08-06",
+    "anthropic": "claude-3-5-sonnet-20241022",
+    "cerebras": "llama-3.3-70b",
+    "together": "meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo",
+}
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "baseline": dict(
+        models=["openai", "anthropic", "cerebras"], num_runs=50, sections=5,
+        server=["--latency", "lognormal:0.05,0.5", "--output-tokens", "32"],
+    ),
+    "streaming": dict(
+        models=["openai", "anthropic"], num_runs=50, sections=5, stream=True,
+        server=["--latency", "lognormal:0.05,0.5", "--output-tokens", "64", "--tokens-per-second", "400"],
+    ),
+    "rate-limited": dict(
+        models=["openai", "together"], num_runs=20, sections=3,
+        server=["--latency", "0.02", "--error-rate", "0.1", "--retry-after", "0.5"],
+    ),
+    "flaky": dict(
+        models=["openai", "anthropic"], num_runs=20, sections=3,
+        server=["--latency", "0.02", "--server-error-rate", "0.05"],
+    ),
+    "fan-out": dict(
+        models=["openai"], num_runs=500, sections=3,
+        server=["--latency", "uniform:0.05,0.15", "--output-tokens", "16"],
+    ),
+    # Long sequences where prefill dominates, with and without Anthropic cache breakpoints
+    "long-context": dict(
+        models=["anthropic"], num_runs=10, sections=12, section_words=1500, stream=True,
+        server=["--latency", "0.05", "--prefill-tokens-per-second", "20000", "--output-tokens", "200"],
+    ),
+    "long-context-uncached": dict(
+        models=["anthropic"], num_runs=10, sections=12, section_words=1500, stream=True, prompt_caching=False,
+        server=["--latency", "0.05", "--prefill-tokens-per-second", "20000", "--output-tokens", "200"],
+    ),
+    # Many samples of one sequence, the shared first turn fetched with a single n-choice request
+    "n-sampling": dict(
+        models=["openai"], num_runs=20, sections=3, section_words=1500, n_sampling=True,
+        server=["--latency", "0.05", "--prefill-tokens-per-second", "20000", "--output-tokens", "64"],
+    ),
+}
+
+# Higher is better for these, lower for every other compared metric
+HIGHER_IS_BETTER = {"sections_per_second", "output_tokens_per_second"}
+COMPARED = ("sections_per_second", "output_tokens_per_second", "latency_p99", "loop_lag_p99_ms")
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of unsorted values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))]
+
+def write_blueprint(directory: Path, sections: int, words: int = 0) -> Path:
+    path = directory / "bench.md"
+    parts = ["# System Prompt\n```\nYou are a benchmark.\n```"]
+    parts += [
+        f"# Section {i}\n```\n{'lorem ' * words}Question number {i}, answer briefly?\n```"
+        for i in range(1, sections + 1)
+    ]
+    path.write_text("\n\n---\n".join(parts) + "\n")
+    return path
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a task sleeping at a fixed interval"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def __enter__(self) -> "LoopLagMonitor":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._task.cancel()
+
+class ServerProcess:
+    """Stand-in server running in a child process"""
+
+    def __init__(self, args: List[str]):
+        self.args = args
+        self.base_url = ""
+        self._process: Optional[asyncio.subprocess.Process] = None
+
+    async def __aenter__(self) -> "ServerProcess":
+        self._process = await asyncio.create_subprocess_exec(
+            sys.executable, str(Path(__file__).parent / "mock_server.py"), *self.args,
+            stdout=asyncio.subprocess.PIPE
+        )
+        self.base_url = (await self._process.stdout.readline()).decode().strip()
+        if not self.base_url:
+            raise RuntimeError("Stand-in server failed to start")
+        return self
+
+    async def stats(self) -> Dict[str, int]:
+        async with httpx.AsyncClient() as client:
+            return (await client.get(f"{self.base_url}/v1/stats")).json()
+
+    async def __aexit__(self, *exc) -> None:
+        self._process.terminate()
+        await self._process.wait()
+
+async def run_scenario(name: str, scenario: Dict[str, Any], scale: float = 1.0) -> Dict[str, Any]:
+    models = [MODELS[provider] for provider in scenario["models"]]
+    num_runs = max(1, int(scenario["num_runs"] * scale))
+    with tempfile.TemporaryDirectory() as tmp:
+        sequence_file = write_blueprint(Path(tmp), scenario["sections"], scenario.get("section_words", 0))
+        async with ServerProcess(scenario["server"]) as server:
+            clients = ClientRegistry()
+            settings = mock_settings(server.base_url)
+            settings.prompt_caching = scenario.get("prompt_caching", True)
+            settings.n_sampling = scenario.get("n_sampling", False)
+            runner = SequenceRunner(
+                settings,
+                stream_writer=StreamWriter(tmp) if scenario.get("stream") else None,
+                clients=clients
+            )
+            results: List[RunResult] = []
+            start = time.perf_counter()
+            with LoopLagMonitor() as monitor:
+                async for batch in runner.run_sequence(sequence_file, models, num_runs):
+                    results.extend(batch)
+            elapsed = time.perf_counter() - start
+            await clients.aclose()
+            server_stats = await server.stats()
+
+    ok = [r for r in results if not r.error]
+    latencies = [r.duration_seconds.total_seconds() for r in ok]
+    ttfts = [r.time_to_first_token.total_seconds() for r in ok if r.time_to_first_token is not None]
+    output_tokens = sum(r.output_tokens or 0 for r in ok)
+    lags = [lag * 1000 for lag in monitor.lags]
+    return {
+        "scenario": name,
+        "requests": len(models) * num_runs * scenario["sections"],
+        "completed": len(ok),
+        "errors": len(results) - len(ok),
+        "server_requests": server_stats["requests"],
+        "rate_limited": server_stats["rate_limited"],
+        "server_errors": server_stats["server_errors"],
+        "cache_read_tokens": sum(r.cache_read_tokens or 0 for r in ok),
+        "connections": server_stats["connections"],
+        "seconds": elapsed,
+        "sections_per_second": len(ok) / elapsed,
+        "output_tokens_per_second": output_tokens / elapsed,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p99": percentile(ttfts, 99),
+        # ru_maxrss is in KiB on Linux, bytes on macOS
+        "rss_peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+        "loop_lag_p99_ms": percentile(lags, 99),
+        "loop_lag_max_ms": max(lags, default=None),
+    }
+
+def format_report(stats: Dict[str, Any]) -> str:
+    def seconds(value: Optional[float]) -> str:
+        return f"{value:.3f}s" if value is not None else "-"
+
+    return (
+        f"{stats['scenario']:>13}: {stats['completed']}/{stats['requests']} sections in {stats['seconds']:.2f}s "
+        f"({stats['sections_per_second']:.1f}/s, {stats['output_tokens_per_second']:.0f} tok/s), "
+        f"latency p50 {seconds(stats['latency_p50'])} p95 {seconds(stats['latency_p95'])} "
+        f"p99 {seconds(stats['latency_p99'])}, ttft p50 {seconds(stats['ttft_p50'])}, "
+        f"{stats['server_requests']} server requests, {stats['rate_limited']} rate limited, {stats['server_errors']} server errors, {stats['errors']} failed, "
+        f"rss {stats['rss_peak_mb']:.0f}MB, loop lag p99 {stats['loop_lag_p99_ms']:.1f}ms "
+        f"max {stats['loop_lag_max_ms']:.1f}ms"
+    )
+
+def compare(current: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Regressions of more than `tolerance` (relative) against a baseline report"""
+    previous = {stats["scenario"]: stats for stats in baseline}
+    regressions = []
+    for stats in current:
+        before = previous.get(stats["scenario"])
+        if not before:
+            continue
+        for metric in COMPARED:
+            old, new = before.get(metric), stats.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change < -tolerance) if metric in HIGHER_IS_BETTER else (change > tolerance):
+                regressions.append(f"{stats['scenario']} {metric}: {old:.3f} -> {new:.3f} ({change:+.0%})")
+    return regressions
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the runs of every scenario")
+    parser.add_argument("--json", type=Path, default=None, help="Write the report to a JSON file")
+    parser.add_argument("--compare", type=Path, default=None, help="Baseline JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default: 0.2)")
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)
+
+    report = []
+    for name in args.scenario:
+        stats = await run_scenario(name, SCENARIOS[name], args.scale)
+        print(format_report(stats))
+        report.append(stats)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,150 @@
+"""
+Benchmark CLI cold start and import cost, to track them over time.
+
+Every measurement runs in a fresh interpreter: wall time of commands
+that exit right after parsing their arguments, and the time it takes to
+import each module, with the provider SDKs it pulls in. The median of
+`--repeat` runs is reported. With `--history`, every report is appended
+to a JSONL file with the time and git commit, so startup regressions show
+up as a trend.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --importtime 15
+    python benchmarks/bench_startup.py --history results/startup.jsonl --compare baseline.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+COMMANDS: Dict[str, List[str]] = {
+    "interpreter": ["-c", "pass"],
+    "sequencer --help": ["-m", "sequencer", "--help"],
+    "sequencer remote --help": ["-m", "sequencer", "remote", "--help"],
+    "sequencer.remote --help": ["-m", "sequencer.remote", "--help"],
+}
+
+MODULES = ["sequencer.main", "sequencer.providers", "sequencer.runner", "sequencer.service", "sequencer.remote"]
+SDKS = ["openai", "anthropic", "httpx"]
+
+# Loads a module and reports how long it took and which SDKs came with it
+IMPORT_PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - start, "sdks": [name for name in {sdks!r} if name in sys.modules]}}))
+"""
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    # Run against this checkout whether or not the package is installed
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT / "src"), env.get("PYTHONPATH")]))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+def time_command(args: List[str], repeat: int) -> float:
+    """Median wall time of running the interpreter with `args`, in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def time_import(module: str, repeat: int) -> Dict[str, Any]:
+    """Median time to import `module` in a fresh interpreter, with the SDKs it loads"""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE.format(module=module, sdks=SDKS)],
+            env=_env(), capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output))
+    return {"seconds": statistics.median(run["seconds"] for run in runs), "sdks": runs[-1]["sdks"]}
+
+def slowest_imports(module: str, count: int) -> List[Dict[str, Any]]:
+    """Modules with the highest own import time when importing `module`, from `python -X importtime`"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=_env(), capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append({"module": name, "self_ms": int(own) / 1000, "cumulative_ms": int(cumulative) / 1000})
+    return sorted(rows, key=lambda row: row["self_ms"], reverse=True)[:count]
+
+def _commit() -> Optional[str]:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Startup times more than `tolerance` (relative) slower than a baseline report"""
+    regressions = []
+    for group in ("commands", "imports"):
+        for name, stats in current[group].items():
+            old = baseline.get(group, {}).get(name)
+            new = stats["seconds"] if isinstance(stats, dict) else stats
+            old = old["seconds"] if isinstance(old, dict) else old
+            if not old:
+                continue
+            change = (new - old) / old
+            if change > tolerance:
+                regressions.append(f"{name}: {old * 1000:.0f}ms -> {new * 1000:.0f}ms ({change:+.0%})")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement, the median is reported (default: 5)")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="Also list the N slowest imports of sequencer.main")
+    parser.add_argument("--json", type=Path, default=None, help="Write the report to a JSON file")
+    parser.add_argument("--history", type=Path, default=None, help="Append the report to a JSONL file")
+    parser.add_argument("--compare", type=Path, default=None, help="Baseline JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default: 0.2)")
+    args = parser.parse_args()
+
+    report: Dict[str, Any] = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": sys.version.split()[0],
+        "commands": {},
+        "imports": {},
+    }
+    for name, command in COMMANDS.items():
+        report["commands"][name] = seconds = time_command(command, args.repeat)
+        print(f"{name:>26}: {seconds * 1000:6.0f}ms")
+    for module in MODULES:
+        report["imports"][module] = stats = time_import(module, args.repeat)
+        print(f"{'import ' + module:>26}: {stats['seconds'] * 1000:6.0f}ms, SDKs loaded: {', '.join(stats['sdks']) or 'none'}")
+    if args.importtime:
+        report["slowest_imports"] = slowest_imports("sequencer.main", args.importtime)
+        print("Slowest imports of sequencer.main (own time):")
+        for row in report["slowest_imports"]:
+            print(f"  {row['self_ms']:7.1f}ms  {row['module']}")
+
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+    if args.history:
+        args.history.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report) + "\n")
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
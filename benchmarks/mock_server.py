@@ -0,0 +1,645 @@
+"""
+Local stand-in for LLM provider APIs, used by the benchmarks.
+
+Serves OpenAI-compatible chat completions (`/v1/chat/completions`) and
+Anthropic messages (`/v1/messages`), streamed or not, with simulated
+latency, prefill and generation speed, prompt caching and rate limits,
+and both providers' batch APIs (`/v1/files` with `/v1/batches`, and
+`/v1/messages/batches`).
+
+Usage:
+    python benchmarks/mock_server.py --latency lognormal:0.3,0.5 --tokens-per-second 80 --rpm 600
+"""
+import re
+import json
+import math
+import hashlib
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from datetime import datetime, timedelta, timezone
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from sequencer.config import APIConfig, Settings
+
+class Latency:
+    """
+    Distribution of the time to first token, in seconds.
+
+    Specs: `0.05` or `fixed:0.05`, `uniform:LOW,HIGH`, `lognormal:MEDIAN,SIGMA`
+    and `exponential:MEAN`.
+    """
+
+    KINDS = ("fixed", "uniform", "lognormal", "exponential")
+
+    def __init__(self, kind: str = "fixed", *params: float, seed: Optional[int] = None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unsupported latency distribution: {kind} (expected one of {', '.join(self.KINDS)})")
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2, "exponential": 1}[kind]
+        if len(params) != expected:
+            raise ValueError(f"{kind} latency takes {expected} parameter(s), got {len(params)}")
+        self.kind = kind
+        self.params = params
+        self._random = random.Random(seed)
+
+    @classmethod
+    def parse(cls, spec: str, seed: Optional[int] = None) -> "Latency":
+        kind, _, params = spec.partition(":")
+        if not params:
+            kind, params = "fixed", spec
+        return cls(kind, *(float(p) for p in params.split(",")), seed=seed)
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return self._random.uniform(*self.params)
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            return self._random.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return self._random.expovariate(1 / self.params[0]) if self.params[0] > 0 else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{','.join(f'{p:g}' for p in self.params)}"
+
+class MockLLMServer:
+    """
+    Minimal HTTP/1.1 server answering OpenAI and Anthropic requests.
+
+    Keeps connections alive and counts them, so benchmarks can show
+    whether clients reuse their connections. Requests over `rpm` in any
+    60 second window, and a random `error_rate` share of all requests, get
+    a 429 with Retry-After. A random `server_error_rate` share fails with a
+    500 (OpenAI) or 529 overloaded (Anthropic).
+
+    With `prefill_tokens_per_second`, the time to first token grows with
+    the prompt, except for the part served from the prompt cache. Like the
+    real APIs, Anthropic caches prompt prefixes up to blocks marked with
+    `cache_control`, OpenAI caches prefixes of 1024+ tokens automatically.
+
+    Batches end `batch_seconds` after they were created. Their requests
+    are neither rate limited nor paced, but fail at `server_error_rate`.
+    """
+
+    CACHE_TTL = 300.0
+    OPENAI_MIN_CACHED = 1024
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float | str | Latency = 0.0,
+        tokens_per_second: Optional[float] = None,
+        output_tokens: int = 8,
+        rpm: Optional[int] = None,
+        error_rate: float = 0.0,
+        retry_after: float = 1.0,
+        server_error_rate: float = 0.0,
+        prefill_tokens_per_second: Optional[float] = None,
+        batch_seconds: float = 1.0,
+        seed: Optional[int] = None
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency if isinstance(latency, Latency) else Latency.parse(str(latency), seed=seed)
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.server_error_rate = server_error_rate
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.batch_seconds = batch_seconds
+        self.connections = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.server_errors = 0
+        self.cache_read_tokens = 0
+        self.batches = 0
+        self.batched = 0
+        self._files: Dict[str, bytes] = {}
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._batch_tasks: Set[asyncio.Task] = set()
+        self._ids = itertools.count(1)
+        self._prompt_cache: Dict[str, float] = {}
+        self._random = random.Random(seed)
+        self._window: Deque[float] = deque()
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/v1"
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "connections": self.connections,
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "server_errors": self.server_errors,
+            "cache_read_tokens": self.cache_read_tokens,
+            "batches": self.batches,
+            "batched": self.batched,
+        }
+
+    async def start(self) -> "MockLLMServer":
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            # Idle keep-alive connections would otherwise hold wait_closed() open
+            for writer in list(self._writers):
+                writer.close()
+            for task in self._batch_tasks:
+                task.cancel()
+            await self._server.wait_closed()
+
+    async def __aenter__(self) -> "MockLLMServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        return method, path, headers, body
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._writers.add(writer)
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                self.requests += 1
+                method, path, headers, body = request
+                await self.handle(method, path.split("?")[0], self._parse_body(headers, body), writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def _parse_body(headers: Dict[str, str], body: bytes) -> dict:
+        """JSON body, or the fields of a multipart upload with files as bytes"""
+        content_type = headers.get("content-type", "")
+        if not content_type.startswith("multipart/form-data"):
+            return json.loads(body or b"{}")
+        boundary = content_type.partition("boundary=")[2].strip('"').encode()
+        fields = {}
+        for part in body.split(b"--" + boundary)[1:-1]:
+            head, _, data = part.partition(b"\r\n\r\n")
+            name = re.search(rb'name="([^"]*)"', head)
+            if name:
+                data = data[:-2] if data.endswith(b"\r\n") else data
+                fields[name.group(1).decode()] = data if b"filename=" in head else data.decode()
+        return fields
+
+    async def _respond(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        payload: dict | bytes,
+        headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        """Send a JSON payload, or raw bytes such as a JSONL file"""
+        if isinstance(payload, bytes):
+            data, content_type = payload, "application/octet-stream"
+        else:
+            data, content_type = json.dumps(payload).encode(), "application/json"
+        extra = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"content-type: {content_type}\r\n"
+            f"content-length: {len(data)}\r\n"
+            f"{extra}"
+            f"connection: keep-alive\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+
+    def _throttle(self) -> Optional[float]:
+        """Seconds the client has to wait if this request is rate limited"""
+        now = time.monotonic()
+        if self.error_rate and self._random.random() < self.error_rate:
+            return self.retry_after
+        if self.rpm is None:
+            return None
+        while self._window and now - self._window[0] >= 60.0:
+            self._window.popleft()
+        if len(self._window) >= self.rpm:
+            return 60.0 - (now - self._window[0])
+        self._window.append(now)
+        return None
+
+    def _prompt_caching(self, body: dict, anthropic: bool) -> Tuple[int, int, int]:
+        """Split the prompt into (uncached, cache read, cache write) tokens, updating the cache"""
+        system = body.get("system") or []
+        blocks = [{"text": system}] if isinstance(system, str) else list(system)
+        for message in body.get("messages") or []:
+            content = message.get("content", "")
+            parts = [{"text": content}] if isinstance(content, str) else content
+            blocks += [{**part, "role": message.get("role")} for part in parts]
+        # Prefix hashes and sizes after every block
+        digest, total, prefixes = hashlib.sha256(body.get("model", "").encode()), 0, []
+        for block in blocks:
+            digest.update(json.dumps([block.get("role"), block.get("text", "")]).encode())
+            total += len(block.get("text", "")) // 4
+            prefixes.append((digest.hexdigest(), total, "cache_control" in block))
+        if anthropic:
+            cacheable = [prefix for prefix in prefixes if prefix[2]]
+        else:
+            cacheable = [prefix for prefix in prefixes if prefix[1] >= self.OPENAI_MIN_CACHED]
+        now = time.monotonic()
+        read = max((size for key, size, _ in cacheable if self._prompt_cache.get(key, 0) > now), default=0)
+        written = max((size for _, size, _ in cacheable), default=0) - read if anthropic else 0
+        for key, _, _ in cacheable:
+            self._prompt_cache[key] = now + self.CACHE_TTL
+        self.cache_read_tokens += read
+        return total - read - max(written, 0), read, max(written, 0)
+
+    def _tokens(self, prompt: str) -> List[str]:
+        words = (prompt.split() or ["echo"]) * self.output_tokens
+        return [f"{word} " for word in words[:self.output_tokens]]
+
+    def _reply(self, body: dict) -> List[str]:
+        """Tokens of the answer, echoing the last message"""
+        messages = body.get("messages") or [{}]
+        content = messages[-1].get("content", "")
+        prompt = content if isinstance(content, str) else "".join(part.get("text", "") for part in content)
+        return self._tokens(prompt)
+
+    @staticmethod
+    def _usage(uncached: int, read: int, written: int, anthropic: bool) -> dict:
+        if anthropic:
+            # Anthropic counts cached prompt tokens separately from input_tokens
+            return {"input_tokens": uncached, "cache_read_input_tokens": read, "cache_creation_input_tokens": written}
+        return {"prompt_tokens": uncached + read, "prompt_tokens_details": {"cached_tokens": read}}
+
+    async def _generate(self, tokens: List[str]):
+        """Yield batches of tokens at the configured generation speed"""
+        if not self.tokens_per_second:
+            yield tokens
+            return
+        # Pace in steps of at least 10ms, sleeping per token is too coarse at high speeds
+        step = max(1, math.ceil(self.tokens_per_second * 0.01))
+        for i in range(0, len(tokens), step):
+            batch = tokens[i:i + step]
+            await asyncio.sleep(len(batch) / self.tokens_per_second)
+            yield batch
+
+    async def handle(self, method: str, path: str, body: dict, writer: asyncio.StreamWriter) -> None:
+        """Answer a single request"""
+        if path.endswith("/stats"):
+            return await self._respond(writer, 200, self.stats())
+        if "/batches" in path or "/files" in path:
+            return await self._handle_batches(method, path, body, writer)
+        anthropic = path.endswith("/messages")
+        if method != "POST" or not (anthropic or path.endswith("/chat/completions")):
+            return await self._respond(writer, 404, {"error": {"message": f"Unknown path {path}"}})
+
+        wait = self._throttle()
+        if wait is not None:
+            self.rate_limited += 1
+            message = f"Rate limit exceeded, retry after {wait:.2f}s"
+            error = (
+                {"type": "error", "error": {"type": "rate_limit_error", "message": message}}
+                if anthropic else
+                {"error": {"message": message, "type": "requests", "code": "rate_limit_exceeded"}}
+            )
+            return await self._respond(writer, 429, error, {
+                "retry-after": str(math.ceil(wait)),
+                "retry-after-ms": str(int(wait * 1000)),
+            })
+
+        if self.server_error_rate and self._random.random() < self.server_error_rate:
+            self.server_errors += 1
+            if anthropic:
+                return await self._respond(writer, 529, {
+                    "type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}
+                })
+            return await self._respond(writer, 500, {"error": {"message": "Internal server error", "type": "server_error"}})
+
+        uncached, read, written = self._prompt_caching(body, anthropic)
+        prefill = (uncached + written) / self.prefill_tokens_per_second if self.prefill_tokens_per_second else 0.0
+        await asyncio.sleep(self.latency.sample() + prefill)
+        usage = self._usage(uncached, read, written, anthropic)
+        tokens = self._reply(body)
+        model = body.get("model", "mock")
+        if body.get("stream"):
+            events = self._anthropic_events if anthropic else self._openai_events
+            return await self._stream(writer, events(model, tokens, usage))
+
+        text = "".join([token async for batch in self._generate(tokens) for token in batch])
+        await self._respond(writer, 200, self._payload(model, text, len(tokens), usage, int(body.get("n") or 1), anthropic))
+
+    def _payload(self, model: str, text: str, output_tokens: int, usage: dict, n: int, anthropic: bool) -> dict:
+        """Body of a non-streamed response"""
+        if anthropic:
+            return {
+                "id": f"msg_{self.requests}",
+                "type": "message",
+                "role": "assistant",
+                "model": model,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {**usage, "output_tokens": output_tokens}
+            }
+        return {
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            # n choices share one prefill and are decoded side by side
+            "choices": [{
+                "index": i,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop"
+            } for i in range(n)],
+            "usage": {
+                **usage,
+                "completion_tokens": n * output_tokens,
+                "total_tokens": usage["prompt_tokens"] + n * output_tokens
+            }
+        }
+
+    async def _handle_batches(self, method: str, path: str, body: dict, writer: asyncio.StreamWriter) -> None:
+        """Files and batches of the OpenAI Batch API and Anthropic Message Batches"""
+        parts = path.strip("/").split("/")
+        anthropic = parts[:3] == ["v1", "messages", "batches"]
+        route = (method, *parts[3 if anthropic else 2:])
+        if parts[:2] == ["v1", "files"]:
+            if route == ("POST",):
+                file_id = f"file-{next(self._ids)}"
+                self._files[file_id] = body.get("file", b"")
+                return await self._respond(writer, 200, {
+                    "id": file_id, "object": "file", "bytes": len(self._files[file_id]), "created_at": int(time.time()),
+                    "filename": "batch.jsonl", "purpose": body.get("purpose", "batch"), "status": "processed"
+                })
+            if len(route) == 3 and route[0] == "GET" and route[2] == "content" and route[1] in self._files:
+                return await self._respond(writer, 200, self._files[route[1]])
+        elif anthropic or parts[:2] == ["v1", "batches"]:
+            if route == ("POST",):
+                return await self._create_batch(body, anthropic, writer)
+            batch = self._batches.get(route[1]) if len(route) > 1 else None
+            if batch is not None and batch["anthropic"] == anthropic:
+                if route[0] == "POST" and route[2:] == ("cancel",):
+                    if anthropic and batch["object"]["processing_status"] == "in_progress":
+                        batch["object"].update(processing_status="canceling", cancel_initiated_at=_now())
+                    elif not anthropic and batch["object"]["status"] in ("validating", "in_progress"):
+                        batch["object"].update(status="cancelling", cancelling_at=int(time.time()))
+                    return await self._respond(writer, 200, batch["object"])
+                if route[0] == "GET" and len(route) == 2:
+                    return await self._respond(writer, 200, batch["object"])
+                if route[0] == "GET" and route[2:] == ("results",) and anthropic and batch["results"] is not None:
+                    return await self._respond(writer, 200, batch["results"])
+        return await self._respond(writer, 404, {"error": {"type": "not_found_error", "message": f"Unknown path {path}"}})
+
+    async def _create_batch(self, body: dict, anthropic: bool, writer: asyncio.StreamWriter) -> None:
+        batch_id = f"{'msgbatch' if anthropic else 'batch'}_{next(self._ids)}"
+        if anthropic:
+            requests = [(request["custom_id"], request["params"]) for request in body.get("requests", [])]
+            batch = {
+                "id": batch_id, "type": "message_batch", "processing_status": "in_progress",
+                "request_counts": {"processing": len(requests), "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0},
+                "created_at": _now(), "expires_at": _now(timedelta(days=1)),
+                "ended_at": None, "cancel_initiated_at": None, "results_url": None
+            }
+        else:
+            content = self._files.get(body.get("input_file_id"))
+            if content is None:
+                return await self._respond(writer, 404, {"error": {"message": f"No such file: {body.get('input_file_id')}"}})
+            lines = [json.loads(line) for line in content.decode("utf-8").splitlines() if line.strip()]
+            requests = [(line["custom_id"], line["body"]) for line in lines]
+            batch = {
+                "id": batch_id, "object": "batch", "endpoint": body.get("endpoint"), "input_file_id": body.get("input_file_id"),
+                "completion_window": body.get("completion_window", "24h"), "status": "in_progress",
+                "created_at": int(time.time()), "output_file_id": None, "error_file_id": None,
+                "request_counts": {"total": len(requests), "completed": 0, "failed": 0}
+            }
+        self.batches += 1
+        self._batches[batch_id] = {"anthropic": anthropic, "object": batch, "results": None}
+        task = asyncio.create_task(self._process_batch(batch_id, requests))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+        await self._respond(writer, 200, batch)
+
+    async def _process_batch(self, batch_id: str, requests: List[Tuple[str, dict]]) -> None:
+        """End a batch after `batch_seconds`, answering its requests unless it was cancelled"""
+        await asyncio.sleep(self.batch_seconds)
+        record = self._batches[batch_id]
+        anthropic, batch = record["anthropic"], record["object"]
+        cancelled = batch.get("processing_status") == "canceling" or batch.get("status") == "cancelling"
+        succeeded, failed = [], []
+        for custom_id, body in requests:
+            if cancelled:
+                failed.append({"custom_id": custom_id, "result": {"type": "canceled"}})
+                continue
+            self.batched += 1
+            if self.server_error_rate and self._random.random() < self.server_error_rate:
+                self.server_errors += 1
+                if anthropic:
+                    failed.append({"custom_id": custom_id, "result": {"type": "errored", "error": {
+                        "type": "error", "error": {"type": "api_error", "message": "Internal server error"}
+                    }}})
+                else:
+                    failed.append({"id": f"batch_req_{next(self._ids)}", "custom_id": custom_id, "error": None, "response": {
+                        "status_code": 500, "request_id": "", "body": {"error": {"message": "Internal server error", "type": "server_error"}}
+                    }})
+                continue
+            usage = self._usage(*self._prompt_caching(body, anthropic), anthropic)
+            tokens = self._reply(body)
+            payload = self._payload(body.get("model", "mock"), "".join(tokens), len(tokens), usage, int(body.get("n") or 1), anthropic)
+            if anthropic:
+                succeeded.append({"custom_id": custom_id, "result": {"type": "succeeded", "message": payload}})
+            else:
+                succeeded.append({"id": f"batch_req_{next(self._ids)}", "custom_id": custom_id, "error": None, "response": {
+                    "status_code": 200, "request_id": "", "body": payload
+                }})
+
+        def jsonl(items: List[dict]) -> bytes:
+            return "".join(json.dumps(item) + "\n" for item in items).encode()
+
+        if anthropic:
+            record["results"] = jsonl(succeeded + failed)
+            batch.update(
+                processing_status="ended", ended_at=_now(),
+                results_url=f"{self.base_url}/v1/messages/batches/{batch_id}/results",
+                request_counts={
+                    "processing": 0, "succeeded": len(succeeded), "expired": 0,
+                    "errored": 0 if cancelled else len(failed), "canceled": len(failed) if cancelled else 0
+                }
+            )
+            return
+        for items, field in ((succeeded, "output_file_id"), (failed, "error_file_id")):
+            if items and not cancelled:
+                file_id = f"file-{next(self._ids)}"
+                self._files[file_id] = jsonl(items)
+                batch[field] = file_id
+        batch.update(
+            status="cancelled" if cancelled else "completed",
+            request_counts={"total": len(requests), "completed": len(succeeded), "failed": 0 if cancelled else len(failed)},
+            **{"cancelled_at" if cancelled else "completed_at": int(time.time())}
+        )
+
+    async def _stream(self, writer: asyncio.StreamWriter, events) -> None:
+        """Send server-sent events with chunked transfer encoding"""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"content-type: text/event-stream\r\n"
+            b"transfer-encoding: chunked\r\n"
+            b"connection: keep-alive\r\n\r\n"
+        )
+        async for event in events:
+            data = event.encode()
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _openai_events(self, model: str, tokens: List[str], usage: dict):
+        def chunk(choices: list, usage: Optional[dict] = None) -> str:
+            return "data: " + json.dumps({
+                "id": f"chatcmpl-{self.requests}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": choices,
+                "usage": usage
+            }) + "\n\n"
+
+        async for batch in self._generate(tokens):
+            yield chunk([{"index": 0, "delta": {"content": "".join(batch)}, "finish_reason": None}])
+        yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        yield chunk([], {
+            **usage,
+            "completion_tokens": len(tokens),
+            "total_tokens": usage["prompt_tokens"] + len(tokens)
+        })
+        yield "data: [DONE]\n\n"
+
+    async def _anthropic_events(self, model: str, tokens: List[str], usage: dict):
+        def event(name: str, data: dict) -> str:
+            return f"event: {name}\ndata: {json.dumps({'type': name, **data})}\n\n"
+
+        yield event("message_start", {"message": {
+            "id": f"msg_{self.requests}", "type": "message", "role": "assistant", "model": model,
+            "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": {**usage, "output_tokens": 1}
+        }})
+        yield event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+        async for batch in self._generate(tokens):
+            yield event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": "".join(batch)}})
+        yield event("content_block_stop", {"index": 0})
+        yield event("message_delta", {
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": len(tokens)}
+        })
+        yield event("message_stop", {})
+
+def _now(offset: timedelta = timedelta()) -> str:
+    return (datetime.now(timezone.utc) + offset).isoformat()
+
+def mock_settings(base_url: str) -> Settings:
+    """
+    Settings pointing every provider at a stand-in server.
+
+    Args:
+        base_url: Server root, e.g. `MockLLMServer.base_url`
+    """
+    class MockSettings(Settings):
+        def _mock(self, key, path: str = "/v1") -> APIConfig:
+            return APIConfig(api_key=key, base_url=base_url + path)
+
+        @property
+        def openai_config(self) -> APIConfig:
+            return self._mock(self.openai_api_key)
+
+        @property
+        def anthropic_config(self) -> APIConfig:
+            return self._mock(self.anthropic_api_key, path="")
+
+        @property
+        def together_config(self) -> APIConfig:
+            return self._mock(self.together_api_key)
+
+        @property
+        def cerebras_config(self) -> APIConfig:
+            return self._mock(self.cerebras_api_key)
+
+        @property
+        def sambanova_config(self) -> APIConfig:
+            return self._mock(self.sambanova_api_key)
+
+    return MockSettings(**{
+        f"{name}_api_key": "mock"
+        for name in ("openai", "anthropic", "together", "hf", "cerebras", "sambanova")
+    })
+
+async def serve(args: argparse.Namespace) -> None:
+    server = MockLLMServer(
+        args.host,
+        args.port,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        rpm=args.rpm,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        server_error_rate=args.server_error_rate,
+        prefill_tokens_per_second=args.prefill_tokens_per_second,
+        batch_seconds=args.batch_seconds,
+        seed=args.seed
+    )
+    async with server:
+        # First line of output, read by benchmarks running the server in a subprocess
+        print(server.base_url, flush=True)
+        await asyncio.Event().wait()
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local stand-in for OpenAI and Anthropic APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", default="0", help="Time to first token, e.g. 0.05, uniform:0.1,0.5, lognormal:0.3,0.5")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Generation speed per request")
+    parser.add_argument("--output-tokens", type=int, default=8, help="Tokens per response")
+    parser.add_argument("--rpm", type=int, default=None, help="Requests per minute before answering 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of random 429s, in seconds")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Share of requests failing with 500/529")
+    parser.add_argument(
+        "--prefill-tokens-per-second", type=float, default=None,
+        help="Prompt processing speed, uncached prompt tokens add to the time to first token"
+    )
+    parser.add_argument("--batch-seconds", type=float, default=1.0, help="Time until a batch has ended")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        pass
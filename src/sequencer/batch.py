@@ -0,0 +1,156 @@
+"""
+Batch API execution: requests of all runs collected into provider batches, in lockstep.
+"""
+import time
+import asyncio
+import logging
+import itertools
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from .config import BatchConfig
+from .metrics import Metrics, get_metrics
+from .providers import Completion, LLMError, LLMProvider, TransientError
+
+class _Request:
+    """A request waiting for its batch"""
+    __slots__ = ("custom_id", "messages", "future")
+
+    def __init__(self, custom_id: str, messages: List[Dict[str, str]], future: asyncio.Future):
+        self.custom_id = custom_id
+        self.messages = messages
+        self.future = future
+
+class BatchExecutor:
+    """
+    Sends requests through the providers' asynchronous batch APIs.
+
+    Runs hand in their next request and wait for the answer. Requests are
+    collected until none has come in for `collect_seconds`, which is the
+    case once every run is waiting, and submitted as one batch per
+    provider and model. Batches are polled at growing intervals. When one
+    ends, its runs get their answers and move on to their next sections,
+    whose requests make up the next batches, so all runs advance in
+    lockstep, one section per round.
+
+    Batches don't count against the rate limits and cost less, but take
+    minutes to hours, so this is for large jobs that aren't in a hurry.
+    Failed requests aren't retried, their sections fail and can be redone
+    with `--resume`.
+    """
+
+    def __init__(self, config: BatchConfig, metrics: Optional[Metrics] = None):
+        self.config = config
+        self.metrics = metrics or get_metrics()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._pending: Dict[Tuple[str, str], Tuple[LLMProvider, List[_Request]]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self._batches: Set[asyncio.Task] = set()
+        self._ids = itertools.count()
+
+    async def complete(self, provider: LLMProvider, provider_name: str, messages: List[Dict[str, str]]) -> Completion:
+        """
+        Get a completion through the next batch of the provider and model.
+
+        Raises:
+            LLMError: If the request or its whole batch failed
+        """
+        loop = asyncio.get_running_loop()
+        start_time = datetime.now()
+        key = (provider_name, provider.runner_config.model)
+        request = _Request(f"request-{next(self._ids)}", messages, loop.create_future())
+        _, requests = self._pending.setdefault(key, (provider, []))
+        requests.append(request)
+        if key in self._timers:
+            self._timers.pop(key).cancel()
+        if len(requests) >= self.config.max_requests:
+            self._submit(key)
+        else:
+            self._timers[key] = loop.call_later(self.config.collect_seconds, self._submit, key)
+        completion = await request.future
+        # Batches have no time to first token, the whole wait counts as the request's duration
+        completion.start_time = start_time
+        return completion
+
+    def _submit(self, key: Tuple[str, str]) -> None:
+        self._timers.pop(key, None)
+        provider, requests = self._pending.pop(key, (None, []))
+        # Requests whose run was cancelled while collecting are left out
+        requests = [request for request in requests if not request.future.done()]
+        if requests:
+            task = asyncio.create_task(self._run(provider, requests), name=f"batch_{key[1]}")
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run(self, provider: LLMProvider, requests: List[_Request]) -> None:
+        model = provider.runner_config.model
+        batch_id = None
+        try:
+            batch_id = await provider.create_batch([(request.custom_id, request.messages) for request in requests])
+            submitted = time.monotonic()
+            self.metrics.batch_requests.inc(len(requests), model=model)
+            self.logger.info(f"Submitted batch {batch_id} of {len(requests)} {model} requests")
+            interval = self.config.poll_interval
+            while True:
+                await asyncio.sleep(interval)
+                if all(request.future.done() for request in requests):
+                    self.logger.info(f"Cancelling batch {batch_id}, its runs were cancelled")
+                    await provider.cancel_batch(batch_id)
+                    self.metrics.batches.inc(model=model, outcome="cancelled")
+                    return
+                try:
+                    results = await provider.poll_batch(batch_id)
+                except TransientError as e:
+                    self.logger.warning(f"Polling batch {batch_id} failed, trying again: {str(e)}")
+                    results = None
+                if results is not None:
+                    break
+                interval = min(interval * 1.5, self.config.max_poll_interval)
+        except asyncio.CancelledError:
+            for request in requests:
+                request.future.cancel()
+            if batch_id:
+                try:
+                    await provider.cancel_batch(batch_id)
+                except LLMError as e:
+                    self.logger.warning(f"Cancelling batch {batch_id} failed: {str(e)}")
+            raise
+        except Exception as e:
+            # Whatever went wrong, the runs waiting for the batch must hear of it
+            error = e if isinstance(e, LLMError) else LLMError(str(e))
+            self.logger.error(f"Batch of {len(requests)} {model} requests failed: {str(error)}")
+            self.metrics.batches.inc(model=model, outcome="error")
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(error)
+            return
+
+        elapsed = time.monotonic() - submitted
+        self.metrics.batches.inc(model=model, outcome="ok")
+        self.metrics.batch_wait.observe(elapsed, model=model)
+        failed = 0
+        for request in requests:
+            result = results.get(request.custom_id)
+            if result is None:
+                result = LLMError(f"No result for {request.custom_id} in batch {batch_id}")
+            failed += isinstance(result, LLMError)
+            if request.future.done():
+                continue
+            if isinstance(result, LLMError):
+                request.future.set_exception(result)
+            else:
+                request.future.set_result(result)
+        self.logger.info(f"Batch {batch_id} ended after {elapsed:.0f}s, {len(requests) - failed} ok, {failed} failed")
+
+    async def close(self) -> None:
+        """Cancel batches still running, at the provider too, and requests still being collected"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for _, requests in self._pending.values():
+            for request in requests:
+                request.future.cancel()
+        self._pending.clear()
+        for task in self._batches:
+            task.cancel()
+        await asyncio.gather(*list(self._batches), return_exceptions=True)
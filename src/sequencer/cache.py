@@ -0,0 +1,124 @@
+"""
+Content-addressed on-disk cache for provider responses.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Literal, Optional
+
+from .config import RunnerConfig
+from .providers import LLMError
+
+CacheMode = Literal["rw", "ro", "replay"]
+
+class CacheMissError(LLMError):
+    """Response not found in cache while replaying"""
+    pass
+
+class ResponseCache:
+    """
+    Size-bounded response store with LRU eviction.
+
+    Modes:
+        rw: read cached responses and store new ones
+        ro: read cached responses, never store
+        replay: read cached responses, raise CacheMissError on a miss
+    """
+
+    def __init__(
+        self,
+        directory: str | Path = ".sequencer_cache",
+        max_bytes: int = 1024 * 1024 * 1024,
+        mode: CacheMode = "rw"
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> size, least recently used first
+        self._size = 0
+        self._load_index()
+
+    @property
+    def writable(self) -> bool:
+        return self.mode == "rw"
+
+    @staticmethod
+    def key(runner_config: RunnerConfig, messages: List[Dict[str, str]], sample: Optional[int] = None) -> str:
+        """
+        Hash the model, its sampling parameters and the exact messages.
+
+        Each of several runs of the same prompt passes its run as `sample`, so
+        the runs keep their own, differing responses.
+        """
+        payload = {
+            "model": runner_config.model,
+            "temperature": runner_config.temperature,
+            "top_p": runner_config.top_p,
+            "max_tokens": runner_config.max_tokens,
+            "messages": messages,
+        }
+        if sample is not None:
+            payload["sample"] = sample
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _load_index(self) -> None:
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._size += size
+
+    def get(self, key: str) -> Optional[str]:
+        """Get a cached response, marking it as recently used"""
+        with self._lock:
+            if key not in self._index:
+                return None
+            self._index.move_to_end(key)
+        path = self._path(key)
+        try:
+            text = json.loads(path.read_text(encoding="utf-8"))["text"]
+            os.utime(path)  # file mtime keeps the LRU order across processes
+            return text
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.warning(f"Dropping unreadable cache entry {key}: {str(e)}")
+            self._discard(key)
+            return None
+
+    def put(self, key: str, text: str) -> None:
+        """Store a response, evicting least recently used entries beyond the size limit"""
+        if not self.writable:
+            return
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        data = json.dumps({"text": text}, ensure_ascii=False).encode("utf-8")
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            evicted = []
+            while self._size > self.max_bytes and len(self._index) > 1:
+                old_key, size = self._index.popitem(last=False)
+                self._size -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            self._path(old_key).unlink(missing_ok=True)
+
+    def _discard(self, key: str) -> None:
+        with self._lock:
+            self._size -= self._index.pop(key, 0)
+        self._path(key).unlink(missing_ok=True)
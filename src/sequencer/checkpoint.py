@@ -0,0 +1,149 @@
+"""
+Checkpoint module for resuming partially completed sequence runs.
+"""
+import re
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from datetime import datetime
+from pydantic import BaseModel, Field, ValidationError
+
+from .runner import RunResult
+
+class RunManifest(BaseModel):
+    """Arguments of the sequence invocation a checkpoint directory belongs to"""
+    sequence_file: str
+    models: List[str]
+    num_runs: int
+    dataset: Optional[str] = None
+    workers: int = 8
+    created: datetime = Field(default_factory=datetime.now)
+
+class Turn(BaseModel):
+    """One completed section of a run with the messages it added"""
+    result: RunResult
+    messages: List[Dict[str, str]]
+    # Hash of the section's prompt and everything it saw, see reader.prompt_hashes
+    prompt_hash: Optional[str] = None
+    # Whether the result reached the record sinks, see CheckpointStore.mark_recorded
+    recorded: bool = False
+
+class CheckpointStore:
+    """
+    Checkpoint files of one sequence invocation.
+
+    Every run appends one line per turn to its own JSONL file, so a crash
+    at most loses the turn that was being written. Resuming continues
+    from the first turn that is missing or failed. Once the sink pipeline
+    has written a run's results, their section indices are appended to a
+    `.recorded` file next to it, so a resumed run writes exactly the
+    restored turns that never reached the sinks.
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, run_dir: str | Path):
+        self.run_dir = Path(run_dir)
+        self.logger = logging.getLogger(self.__class__.__name__)
+        # The sink writer thread marks turns while runs reset their files
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, output_dir: str | Path, manifest: RunManifest) -> "CheckpointStore":
+        """Create a new checkpoint directory under `output_dir/checkpoints`"""
+        base = Path(output_dir) / "checkpoints"
+        base.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        run_dir, suffix = base / timestamp, 1
+        while run_dir.exists():
+            suffix += 1
+            run_dir = base / f"{timestamp}_{suffix}"
+        run_dir.mkdir()
+        (run_dir / cls.MANIFEST).write_text(manifest.model_dump_json(indent=2), encoding='utf-8')
+        return cls(run_dir)
+
+    @classmethod
+    def incremental(cls, output_dir: str | Path, manifest: RunManifest) -> "CheckpointStore":
+        """
+        Checkpoint directory shared by every invocation of a sequence file.
+
+        Unlike `create`, the directory stays the same from one invocation to
+        the next, so turns recorded by earlier ones can be reused.
+        """
+        path = Path(manifest.sequence_file).resolve()
+        key = hashlib.sha256(str(path).encode("utf-8")).hexdigest()[:12]
+        run_dir = Path(output_dir) / "checkpoints" / "incremental" / f"{re.sub(r'[^\w.-]', '_', path.stem)}_{key}"
+        run_dir.mkdir(parents=True, exist_ok=True)
+        (run_dir / cls.MANIFEST).write_text(manifest.model_dump_json(indent=2), encoding='utf-8')
+        return cls(run_dir)
+
+    def load_manifest(self) -> RunManifest:
+        """Read the arguments of the checkpointed invocation"""
+        path = self.run_dir / self.MANIFEST
+        if not path.exists():
+            raise FileNotFoundError(f"No checkpoint manifest in {self.run_dir}")
+        return RunManifest.model_validate_json(path.read_text(encoding='utf-8'))
+
+    def _path(self, model: str, run_id: int, row_id: Optional[str] = None) -> Path:
+        name = f"{model}_run{run_id}" + (f"_row{row_id}" if row_id is not None else "")
+        return self.run_dir / (re.sub(r'[^\w.-]', '_', name) + ".jsonl")
+
+    def _recorded(self, model: str, run_id: int, row_id: Optional[str] = None) -> Set[int]:
+        path = self._path(model, run_id, row_id).with_suffix(".recorded")
+        if not path.exists():
+            return set()
+        return {int(line) for line in path.read_text(encoding='utf-8').split() if line.isdigit()}
+
+    def load(self, model: str, run_id: int, row_id: Optional[str] = None) -> List[Turn]:
+        """Load the recorded turns of a run, ignoring a partially written last line"""
+        path = self._path(model, run_id, row_id)
+        if not path.exists():
+            return []
+        turns = []
+        with self._lock:
+            recorded = self._recorded(model, run_id, row_id)
+            lines = path.read_text(encoding='utf-8').splitlines()
+        for line in lines:
+            try:
+                turn = Turn.model_validate_json(line)
+            except ValidationError:
+                self.logger.warning(f"Ignoring incomplete checkpoint line in {path.name}")
+                break
+            turn.recorded = turn.recorded or turn.result.section_index in recorded
+            turns.append(turn)
+        return turns
+
+    def reset(self, model: str, run_id: int, turns: List[Turn], row_id: Optional[str] = None) -> None:
+        """Rewrite a run's checkpoint with only the given turns, before resuming it"""
+        path = self._path(model, run_id, row_id)
+        with self._lock:
+            path.write_text("".join(turn.model_dump_json() + "\n" for turn in turns), encoding='utf-8')
+            # Marks of turns not kept mustn't carry over to their replacements
+            path.with_suffix(".recorded").unlink(missing_ok=True)
+
+    def mark_recorded(self, results: List[RunResult]) -> None:
+        """Note that results reached the record sinks, called by the sink pipeline once they are flushed"""
+        runs: Dict[Tuple[str, int, Optional[str]], List[int]] = {}
+        for result in results:
+            if not result.recorded:
+                runs.setdefault((result.model, result.run_id, result.row_id), []).append(result.section_index)
+        with self._lock:
+            for (model, run_id, row_id), indices in runs.items():
+                with open(self._path(model, run_id, row_id).with_suffix(".recorded"), 'a', encoding='utf-8') as f:
+                    f.write("".join(f"{index}\n" for index in indices))
+
+    def save(
+        self,
+        model: str,
+        run_id: int,
+        result: RunResult,
+        messages: List[Dict[str, str]],
+        row_id: Optional[str] = None,
+        prompt_hash: Optional[str] = None
+    ) -> None:
+        """Append a finished turn to the run's checkpoint file"""
+        with open(self._path(model, run_id, row_id), 'a', encoding='utf-8') as f:
+            f.write(Turn(result=result, messages=messages, prompt_hash=prompt_hash).model_dump_json() + "\n")
+            f.flush()
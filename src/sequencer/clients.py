@@ -0,0 +1,114 @@
+"""
+Process-wide registry of pooled SDK clients.
+"""
+import math
+import logging
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+from .config import APIConfig, PoolConfig
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI as OpenAI
+    from anthropic import AsyncAnthropic as Anthropic
+
+class ClientRegistry:
+    """
+    Hands out shared SDK clients per provider endpoint, so all runs against
+    the same endpoint reuse the same keep-alive connections.
+
+    Each endpoint's connections are split across `pool.shards` clients,
+    handed out round-robin. An SDK is imported when its first client is
+    created, so runs load only the SDKs of the models they use.
+    """
+
+    def __init__(self, pool: Optional[PoolConfig] = None):
+        self.pool = pool or PoolConfig()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._clients: Dict[Tuple[str, str], List["OpenAI | Anthropic"]] = {}
+        self._handed_out: Dict[Tuple[str, str], int] = {}
+
+    def _http_client(self) -> "httpx.AsyncClient":
+        """Create an HTTP client with one shard of the configured pool limits"""
+        import httpx
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=math.ceil(self.pool.max_connections / self.pool.shards),
+                max_keepalive_connections=math.ceil(self.pool.max_keepalive_connections / self.pool.shards),
+                keepalive_expiry=self.pool.keepalive_expiry
+            ),
+            http2=self.pool.http2,
+            follow_redirects=True
+        )
+
+    def _get(self, key: Tuple[str, str], factory: Callable[[], "OpenAI | Anthropic"]) -> "OpenAI | Anthropic":
+        """Get the next client shard for an endpoint, creating the shards on first use"""
+        if key not in self._clients:
+            self._clients[key] = [factory() for _ in range(self.pool.shards)]
+            self._handed_out[key] = 0
+        shards = self._clients[key]
+        self._handed_out[key] += 1
+        return shards[self._handed_out[key] % len(shards)]
+
+    def openai(self, api_config: APIConfig) -> "OpenAI":
+        """Get a shared OpenAI-compatible client for an endpoint"""
+        from openai import AsyncOpenAI
+        return self._get(
+            ("openai", str(api_config.base_url)),
+            lambda: AsyncOpenAI(
+                api_key=api_config.api_key.get_secret_value(),
+                base_url=str(api_config.base_url) if api_config.base_url else None,
+                timeout=api_config.timeout,
+                max_retries=0,  # retried by the runner's RetryEngine
+                http_client=self._http_client()
+            )
+        )
+
+    def anthropic(self, api_config: APIConfig) -> "Anthropic":
+        """Get a shared Anthropic client for an endpoint"""
+        from anthropic import AsyncAnthropic
+        return self._get(
+            ("anthropic", str(api_config.base_url)),
+            lambda: AsyncAnthropic(
+                api_key=api_config.api_key.get_secret_value(),
+                base_url=str(api_config.base_url) if api_config.base_url else None,
+                timeout=api_config.timeout,
+                max_retries=0,  # retried by the runner's RetryEngine
+                http_client=self._http_client()
+            )
+        )
+
+    async def aclose(self) -> None:
+        """Close all clients and their connection pools"""
+        clients, self._clients = self._clients, {}
+        self._handed_out = {}
+        for shards in clients.values():
+            for client in shards:
+                try:
+                    await client.close()
+                except Exception as e:
+                    self.logger.warning(f"Error closing client: {str(e)}")
+
+_registry: Optional[ClientRegistry] = None
+
+def get_client_registry(pool: Optional[PoolConfig] = None) -> ClientRegistry:
+    """
+    Get the process-wide client registry.
+
+    Args:
+        pool: Pool settings, only used when the registry is first created
+
+    Returns:
+        ClientRegistry: Shared registry instance
+    """
+    global _registry
+    if _registry is None:
+        _registry = ClientRegistry(pool)
+    return _registry
+
+async def close_clients() -> None:
+    """Close the process-wide client registry"""
+    global _registry
+    if _registry is not None:
+        await _registry.aclose()
+        _registry = None
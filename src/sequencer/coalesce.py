@@ -0,0 +1,119 @@
+"""
+Single-flight coalescing of identical concurrent provider requests.
+"""
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .config import CoalesceConfig, RunnerConfig
+from .metrics import Metrics, get_metrics
+from .providers import Completion
+
+class _Flight:
+    """A request in flight and the number of callers waiting for it"""
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class Coalescer:
+    """
+    Lets concurrent callers with the same request share one call.
+
+    Requests are identical if they go to the same endpoint with the same
+    model, sampling parameters and messages. The first caller's request is
+    sent; callers arriving while it is in flight wait for it and get a copy
+    of its completion, without usage, which was reported once. Whether a
+    request may be shared is up to the config: sampled requests that happen
+    to be identical are expected to give different answers, and several runs
+    of the same prompt sampled above `max_temperature` are never shared.
+    """
+
+    def __init__(self, config: CoalesceConfig, metrics: Optional[Metrics] = None):
+        self.config = config
+        self.metrics = metrics or get_metrics()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.requests = 0
+        self.hits = 0
+        self._flights: Dict[str, _Flight] = {}
+        # Runs sample at the runner config's default temperature
+        temperature = RunnerConfig.model_fields["temperature"].default
+        if config.mode == "deterministic" and temperature > config.max_temperature:
+            self.logger.warning(
+                f"Requests are sampled at temperature {temperature}, above the max_temperature "
+                f"{config.max_temperature} of deterministic coalescing, so none will be coalesced"
+            )
+
+    def allows(self, runner_config: RunnerConfig, sampled: bool = False) -> bool:
+        """
+        Whether requests with these sampling parameters may be shared.
+
+        Args:
+            runner_config: Model and sampling parameters of the request
+            sampled: Whether the request belongs to one of several runs of
+                the same prompt, whose differing answers are the point
+        """
+        deterministic = runner_config.temperature <= self.config.max_temperature
+        if sampled and not deterministic:
+            return False
+        if self.config.mode == "always":
+            return True
+        if self.config.mode == "deterministic":
+            return deterministic
+        return False
+
+    @staticmethod
+    def key(endpoint: Optional[str], runner_config: RunnerConfig, messages: List[Dict[str, str]]) -> str:
+        """Fingerprint of the endpoint, model, sampling parameters and messages"""
+        payload = {
+            "endpoint": endpoint,
+            "model": runner_config.model,
+            "temperature": runner_config.temperature,
+            "top_p": runner_config.top_p,
+            "max_tokens": runner_config.max_tokens,
+            "messages": messages,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    async def run(self, key: str, model: str, call: Callable[[], Awaitable[Completion]]) -> Tuple[Completion, bool]:
+        """
+        Run `call`, or wait for the identical call already in flight.
+
+        Args:
+            key: Fingerprint of the request
+            model: Model, for the metrics
+            call: Sends the request
+
+        Returns:
+            Tuple[Completion, bool]: Completion and whether it was shared
+            from another caller's request
+
+        Raises:
+            Exception: The shared request's error
+        """
+        self.requests += 1
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if shared:
+            self.hits += 1
+            self.metrics.coalesced.inc(model=model)
+        else:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(call()))
+            flight.task.add_done_callback(lambda _: self._flights.pop(key, None) if self._flights.get(key) is flight else None)
+        flight.waiters += 1
+        try:
+            # One caller giving up mustn't cancel the request for the others
+            completion = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+        if not shared:
+            return completion, False
+        usage = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+        return completion.model_copy(update={
+            field: 0 for field in usage if getattr(completion, field) is not None
+        }), True
@@ -1,7 +1,8 @@
 """
 Handles API configurations and settings for different LLM providers.
 """
-from typing import Optional, Literal
+from functools import lru_cache
+from typing import Dict, List, Optional, Literal
 from pydantic import BaseModel, Field, SecretStr, AnyHttpUrl
 from pydantic_settings import BaseSettings
 
@@ -18,19 +19,105 @@ ModelType = Literal[
     # "o1-mini-2024-09-12",
 ]
 
+# Models served by more than one endpoint, routed per request by sequencer.router.Router
+DEFAULT_MODEL_ALIASES: Dict[str, List[ModelType]] = {
+    "llama-3.1-405b": [
+        "meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo", # Together.ai
+        "Meta-Llama-3.1-405B-Instruct", # SambaNova
+    ],
+}
+
+# Context window (prompt plus completion tokens) per model
+CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4o-2024-08-06": 128000,
+    "gpt-4o-mini-2024-07-18": 128000,
+    "claude-3-5-sonnet-20241022": 200000,
+    "meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo": 130815,
+    "Meta-Llama-3.1-405B-Instruct": 16384,
+    "llama-3.3-70b": 8192,
+}
+
 class APIConfig(BaseModel):
     """Base configuration for API providers"""
     api_key: SecretStr
     base_url: Optional[AnyHttpUrl] = None
     timeout: float = Field(default=300.0, ge=0.0)
+    # Retries of transient errors and rate limits, done by the runner (SDK retries are disabled)
     max_retries: int = Field(default=3, ge=0)
 
+class ProviderLimits(BaseModel):
+    """Request scheduling limits for a single provider"""
+    max_concurrency: Optional[int] = Field(default=None, gt=0)
+    requests_per_minute: Optional[int] = Field(default=None, gt=0)
+    tokens_per_minute: Optional[int] = Field(default=None, gt=0)
+
+class PoolConfig(BaseModel):
+    """HTTP connection pool shared by all runs against the same endpoint"""
+    max_connections: int = Field(default=100, gt=0)
+    max_keepalive_connections: int = Field(default=100, ge=0)
+    keepalive_expiry: float = Field(default=30.0, ge=0.0)
+    # Connections are split across shards, httpcore's pool bookkeeping grows
+    # quadratically with pool size and queued requests
+    shards: int = Field(default=8, ge=1)
+    http2: bool = False  # requires the http2 extra (h2 package)
+
+class RetryConfig(BaseModel):
+    """Retry backoff and circuit breaking, shared by all providers"""
+    base_delay: float = Field(default=0.5, gt=0.0)
+    max_delay: float = Field(default=60.0, gt=0.0)
+    # Consecutive transient failures before a provider stops taking traffic
+    failure_threshold: int = Field(default=5, ge=1)
+    reset_timeout: float = Field(default=30.0, gt=0.0)
+
+class HedgeConfig(BaseModel):
+    """Hedging of slow requests with a second, identical one"""
+    enabled: bool = False
+    # Hedge once a request is slower than this percentile of its model's recent latencies
+    percentile: float = Field(default=95.0, gt=0.0, lt=100.0)
+    max_rate: float = Field(default=0.1, ge=0.0, le=1.0)
+    min_delay: float = Field(default=1.0, ge=0.0)
+    min_samples: int = Field(default=20, ge=1)
+    window: int = Field(default=500, ge=1)
+
+class CoalesceConfig(BaseModel):
+    """Sharing one in-flight request between identical concurrent requests"""
+    # off, only for (near-)deterministic sampling, or for every request
+    mode: Literal["off", "deterministic", "always"] = "off"
+    # Sampling counted as deterministic: temperature at most this, covering the runner's default 0.1
+    max_temperature: float = Field(default=0.1, ge=0.0, le=1.0)
+
+class BatchConfig(BaseModel):
+    """Running requests through the providers' batch APIs, in lockstep across runs"""
+    enabled: bool = False
+    # Submit once no new request has come in for this long
+    collect_seconds: float = Field(default=1.0, gt=0.0)
+    max_requests: int = Field(default=10000, ge=1)
+    # Polling starts at poll_interval and slows down to max_poll_interval
+    poll_interval: float = Field(default=5.0, gt=0.0)
+    max_poll_interval: float = Field(default=60.0, gt=0.0)
+
+class ContextConfig(BaseModel):
+    """Keeping requests within the model's context window as sequences grow"""
+    # How older turns are compacted once a request doesn't fit: not at all (the request fails),
+    # drop them, truncate them, replace them with a summary, or send only the sections a section
+    # declares with `depends:`
+    policy: Literal["none", "drop", "truncate", "summarize", "declared"] = "none"
+    # Input token budget per request, on top of the model's context window
+    max_input_tokens: Optional[int] = Field(default=None, gt=0)
+    # Most recent turns, never compacted
+    keep_recent: int = Field(default=2, ge=0)
+    truncate_tokens: int = Field(default=256, gt=0)
+    summary_tokens: int = Field(default=1024, gt=0)
+
 class RunnerConfig(BaseModel):
     """Configuration for LLM execution"""
     model: ModelType
     temperature: float = Field(default=0.1, ge=0.0, le=1.0)
     top_p: float = Field(default=0.1, ge=0.0, le=1.0)
     max_tokens: Optional[int] = Field(default=None, gt=0)
+    context_window: Optional[int] = Field(default=None, gt=0)
+    # Mark the conversation prefix for provider prompt caching where the API needs it (Anthropic)
+    prompt_caching: bool = True
     system_prompt: str = "You are a helpful assistant."
 
     def __init__(self, **data):
@@ -41,31 +128,75 @@ class RunnerConfig(BaseModel):
                 self.max_tokens = 8192
             else:
                 self.max_tokens = 16384
+        if self.context_window is None:
+            self.context_window = CONTEXT_WINDOWS.get(self.model, 128000)
+
+    def input_budget(self, max_input_tokens: Optional[int] = None) -> int:
+        """Prompt tokens that fit the context window next to the completion"""
+        # Leave room for the completion, but at most half the window
+        budget = self.context_window - min(self.max_tokens, self.context_window // 2)
+        return min(budget, max_input_tokens) if max_input_tokens else budget
 
 class Settings(BaseSettings):
-    """Global settings for the LLM runner"""
-    openai_api_key: SecretStr
-    anthropic_api_key: SecretStr
-    together_api_key: SecretStr
-    hf_api_key: SecretStr
-    cerebras_api_key: SecretStr
-    sambanova_api_key: SecretStr
+    """
+    Global settings for the LLM runner.
+
+    API keys are optional on load and checked when a provider's config is
+    first used, so a run only needs the keys of the models it uses.
+    """
+    openai_api_key: Optional[SecretStr] = None
+    anthropic_api_key: Optional[SecretStr] = None
+    together_api_key: Optional[SecretStr] = None
+    hf_api_key: Optional[SecretStr] = None
+    cerebras_api_key: Optional[SecretStr] = None
+    sambanova_api_key: Optional[SecretStr] = None
+    # Per-provider limits, e.g. PROVIDER_LIMITS='{"openai": {"requests_per_minute": 500}}'
+    provider_limits: Dict[str, ProviderLimits] = Field(default_factory=dict)
+    # Connection pooling, e.g. HTTP_POOL='{"max_connections": 200, "http2": true}'
+    http_pool: PoolConfig = Field(default_factory=PoolConfig)
+    # Retries and circuit breakers, e.g. RETRY='{"failure_threshold": 10}'
+    retry: RetryConfig = Field(default_factory=RetryConfig)
+    # Hedged requests, e.g. HEDGE='{"enabled": true, "percentile": 90}'
+    hedge: HedgeConfig = Field(default_factory=HedgeConfig)
+    # Request coalescing, e.g. COALESCE='{"mode": "deterministic", "max_temperature": 0.2}'
+    coalesce: CoalesceConfig = Field(default_factory=CoalesceConfig)
+    # Batch API mode, e.g. BATCH='{"enabled": true, "max_poll_interval": 300}'
+    batch: BatchConfig = Field(default_factory=BatchConfig)
+    # Context window management, e.g. CONTEXT='{"policy": "summarize", "max_input_tokens": 32000}'
+    context: ContextConfig = Field(default_factory=ContextConfig)
+    prompt_caching: bool = True
+    # Ask for one choice per run in a single request where runs send the same messages
+    n_sampling: bool = False
+    # Model aliases served by a pool of endpoints, e.g. MODEL_ALIASES='{"llama-3.1-405b": ["Meta-Llama-3.1-405B-Instruct"]}'
+    model_aliases: Dict[str, List[ModelType]] = Field(default_factory=lambda: dict(DEFAULT_MODEL_ALIASES))
+    
+    def _api_key(self, provider: str) -> SecretStr:
+        """
+        API key of a provider.
+
+        Raises:
+            ValueError: If the key isn't set
+        """
+        key = getattr(self, f"{provider}_api_key")
+        if key is None:
+            raise ValueError(f"{provider.upper()}_API_KEY is not set (in the environment or .env)")
+        return key
     
     @property
     def openai_config(self) -> APIConfig:
         """Get OpenAI API configuration"""
-        return APIConfig(api_key=self.openai_api_key)
+        return APIConfig(api_key=self._api_key("openai"))
     
     @property
     def anthropic_config(self) -> APIConfig:
         """Get Anthropic API configuration"""
-        return APIConfig(api_key=self.anthropic_api_key)
+        return APIConfig(api_key=self._api_key("anthropic"))
     
     @property
     def together_config(self) -> APIConfig:
         """Get Together AI API configuration"""
         return APIConfig(
-            api_key=self.together_api_key,
+            api_key=self._api_key("together"),
             base_url="https://api.together.ai/v1"
         )
     
@@ -73,7 +204,7 @@ class Settings(BaseSettings):
     def cerebras_config(self) -> APIConfig:
         """Get Cerebras API configuration"""
         return APIConfig(
-            api_key=self.cerebras_api_key,
+            api_key=self._api_key("cerebras"),
             base_url="https://api.cerebras.ai/v1"
         )
     
@@ -81,28 +212,30 @@ class Settings(BaseSettings):
     def sambanova_config(self) -> APIConfig:
         """Get SambaNova API configuration"""
         return APIConfig(
-            api_key=self.sambanova_api_key,
+            api_key=self._api_key("sambanova"),
             base_url="https://api.sambanova.ai/v1"
         )
     
     @property
     def hf_config(self) -> APIConfig:
         """Get HuggingFace API configuration"""
-        return APIConfig(api_key=self.hf_api_key)
+        return APIConfig(api_key=self._api_key("hf"))
     
     class Config:
         """Pydantic settings configuration"""
         env_file = ".env"
         env_file_encoding = "utf-8"
 
+@lru_cache(maxsize=1)
 def get_settings() -> Settings:
     """
-    Get settings instance with environment variables.
+    Get the settings instance with environment variables, read once per process.
     
     Returns:
-        Settings: Configuration instance with loaded environment variables
+        Settings: Configuration instance with loaded environment variables,
+            shared between callers, copy it before changing it
         
     Raises:
-        pydantic.ValidationError: If required environment variables are missing
+        pydantic.ValidationError: If environment variables are invalid
     """
     return Settings()
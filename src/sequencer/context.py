@@ -0,0 +1,176 @@
+"""
+Context window management: per-turn token counts and compaction of older turns.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .config import ContextConfig
+from .providers import LLMError
+from .scheduler import estimate_tokens
+
+Message = Dict[str, str]
+Part = Tuple[List[Message], int]
+
+SUMMARY_PROMPT = (
+    "Summarize our conversation so far in at most {words} words. Keep every fact, decision "
+    "and result that later questions may build on."
+)
+
+class ContextOverflowError(LLMError):
+    """Request over its token budget, with compaction turned off"""
+
+def count_tokens(messages: List[Message]) -> int:
+    """Estimated tokens of messages, counted one by one so counts can be added up"""
+    return sum(estimate_tokens([message]) for message in messages)
+
+class ContextWindow:
+    """
+    Turns of one run with their token counts, assembled into requests that fit a budget.
+
+    Every turn is counted once when it is recorded, so sizing a request adds
+    up one number per turn instead of rescanning the whole history. When the
+    turns a section sees don't fit, policy none fails the request. The other
+    policies compact the oldest turns, always keeping the last `keep_recent`:
+    truncate shortens them, summarize replaces them with a summary written
+    by the model, and anything still over budget is dropped oldest first,
+    with a warning.
+    """
+
+    def __init__(
+        self,
+        system: List[Message],
+        config: ContextConfig,
+        budget: int,
+        summarize: Optional[Callable[[List[Message]], Awaitable[str]]] = None
+    ):
+        self.system = system
+        self.system_tokens = count_tokens(system)
+        self.config = config
+        self.budget = budget
+        self.summarize = summarize
+        self.turns: Dict[int, List[Message]] = {}
+        self.tokens: Dict[int, int] = {}
+        self._truncated: Dict[int, Part] = {}
+        self._summaries: Dict[Tuple[int, ...], asyncio.Task] = {}
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def __contains__(self, index: int) -> bool:
+        return index in self.turns
+
+    def add(self, index: int, messages: List[Message]) -> None:
+        """Record the messages of a turn"""
+        self.turns[index] = list(messages)
+        self.tokens[index] = count_tokens(messages)
+
+    def append(self, index: int, message: Message) -> None:
+        """Add a message, e.g. the response, to a recorded turn"""
+        self.turns[index].append(message)
+        self.tokens[index] += estimate_tokens([message])
+
+    def _truncate(self, index: int) -> Part:
+        if index not in self._truncated:
+            limit = self.config.truncate_tokens * 4
+            messages = [
+                message if len(message["content"]) <= limit
+                else {**message, "content": message["content"][:limit] + "\n[...]"}
+                for message in self.turns[index]
+            ]
+            self._truncated[index] = (messages, count_tokens(messages))
+        return self._truncated[index]
+
+    async def _summary(self, indices: Tuple[int, ...]) -> Optional[Part]:
+        # Sections running concurrently share the summary of the same turns
+        if indices not in self._summaries:
+            self._summaries[indices] = asyncio.ensure_future(self._summarize(indices))
+        return await self._summaries[indices]
+
+    def _previous_summary(self, indices: Tuple[int, ...]) -> Tuple[int, Optional[Part]]:
+        """Longest already summarized prefix of `indices`, so a growing history is summarized incrementally"""
+        for length in range(len(indices) - 1, 0, -1):
+            task = self._summaries.get(indices[:length])
+            if task and task.done() and not task.cancelled() and task.exception() is None and task.result():
+                return length, task.result()
+        return 0, None
+
+    async def _summarize(self, indices: Tuple[int, ...]) -> Optional[Part]:
+        prompt = {"role": "user", "content": SUMMARY_PROMPT.format(words=self.config.summary_tokens * 3 // 4)}
+        room = self.budget - self.system_tokens - estimate_tokens([prompt])
+        length, previous = self._previous_summary(indices)
+        if previous:
+            room -= previous[1]
+        # Summarize as many of the most recent turns as fit into one request
+        included: List[int] = []
+        for index in reversed(indices[length:]):
+            if self.tokens[index] > room:
+                previous = None  # turns in between would be lost
+                break
+            room -= self.tokens[index]
+            included.insert(0, index)
+        if not included:
+            return previous
+        messages = list(previous[0]) if previous else []
+        messages += [message for index in included for message in self.turns[index]]
+        try:
+            text = await self.summarize(self.system + messages + [prompt])
+        except LLMError as e:
+            self.logger.warning(f"Summarizing {len(included)} turns failed, dropping them instead: {str(e)}")
+            return None
+        summary = [prompt, {"role": "assistant", "content": text}]
+        return summary, count_tokens(summary)
+
+    async def build(self, visible: List[int], message: Message) -> Tuple[List[Message], int, int]:
+        """
+        Assemble the request of a section from the turns it sees.
+
+        Args:
+            visible: Indices of the recorded turns the section sees, ascending
+            message: The section's prompt
+
+        Returns:
+            Tuple[List[Message], int, int]: Messages, their estimated tokens
+            and how many of the visible turns were compacted
+
+        Raises:
+            ContextOverflowError: If the request exceeds the budget under policy none
+        """
+        parts: List[Part] = [(self.turns[index], self.tokens[index]) for index in visible]
+        total = self.system_tokens + estimate_tokens([message]) + sum(tokens for _, tokens in parts)
+        touched: Set[int] = set()
+        if total > self.budget and self.config.policy == "none":
+            raise ContextOverflowError(
+                f"Request of ~{total} tokens exceeds the budget of {self.budget}, "
+                f"choose a context policy (--context-policy) to compact earlier turns"
+            )
+        if total > self.budget:
+            sources = [[index] for index in visible]
+            older = len(parts) - min(self.config.keep_recent, len(parts))
+            if self.config.policy == "truncate":
+                for position in range(older):
+                    if total <= self.budget:
+                        break
+                    parts[position] = self._truncate(visible[position])
+                    total += parts[position][1] - self.tokens[visible[position]]
+                    touched.add(visible[position])
+            elif self.config.policy == "summarize" and older and self.summarize:
+                summary = await self._summary(tuple(visible[:older]))
+                if summary:
+                    total += summary[1] - sum(tokens for _, tokens in parts[:older])
+                    parts[:older] = [summary]
+                    sources[:older] = [visible[:older]]
+                    touched.update(visible[:older])
+                    older = 1
+            # Whatever still doesn't fit is dropped, oldest first
+            dropped = 0
+            while total > self.budget and dropped < older:
+                total -= parts[dropped][1]
+                touched.update(sources[dropped])
+                dropped += 1
+            if dropped:
+                turns = sorted(index for source in sources[:dropped] for index in source)
+                self.logger.warning(f"Dropped earlier turns {turns} from a request to fit the budget of {self.budget} tokens")
+            parts = parts[dropped:]
+            if total > self.budget:
+                self.logger.warning(f"Request of ~{total} tokens exceeds the budget of {self.budget} after compaction")
+        messages = self.system + [m for part, _ in parts for m in part] + [message]
+        return messages, total, len(touched)
@@ -0,0 +1,65 @@
+"""
+Dataset reader module for streaming placeholder values from CSV/JSONL files.
+"""
+import csv
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, Tuple
+
+Row = Tuple[str, Dict[str, Any]]
+
+class DatasetReader:
+    """Streams placeholder rows from a dataset file without loading it into memory"""
+
+    def __init__(self, file_path: str | Path):
+        self.file_path = Path(file_path)
+        if not self.file_path.exists():
+            raise FileNotFoundError(f"File not found: {file_path}")
+        if self.file_path.suffix.lower() not in (".csv", ".jsonl"):
+            raise ValueError(f"Unsupported dataset format: {self.file_path.suffix} (expected .csv or .jsonl)")
+        self.rows_read = 0
+
+    def _records(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Yield (line number, record) pairs"""
+        with open(self.file_path, encoding='utf-8', newline='') as f:
+            if self.file_path.suffix.lower() == ".csv":
+                reader = csv.DictReader(f)
+                for record in reader:
+                    yield reader.line_num, record
+                return
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Invalid JSON on line {line_num} of {self.file_path}: {str(e)}")
+                if not isinstance(record, dict):
+                    raise ValueError(f"Line {line_num} of {self.file_path} is not a JSON object")
+                yield line_num, record
+
+    def __iter__(self) -> Iterator[Row]:
+        """Yield (row id, placeholder values), using the `id` field or the line number as row id"""
+        for line_num, record in self._records():
+            self.rows_read += 1
+            yield str(record.get("id", line_num)), record
+
+def read_dataset(file_path: str | Path) -> DatasetReader:
+    """
+    Open a dataset file for lazy iteration.
+
+    Args:
+        file_path: Path to a .csv (header row required) or .jsonl file
+
+    Returns:
+        DatasetReader: Iterable of (row id, placeholder values) pairs
+
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        ValueError: If the format is unsupported or a line is malformed
+
+    Example:
+        >>> for row_id, values in read_dataset("rows.jsonl"):
+        ...     print(row_id, values)
+    """
+    return DatasetReader(file_path)
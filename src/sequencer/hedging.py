@@ -0,0 +1,135 @@
+"""
+Hedged requests for cutting the latency tail of slow provider calls.
+"""
+import math
+import time
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from .config import HedgeConfig
+from .metrics import Metrics, get_metrics
+from .providers import Completion
+
+class LatencyTracker:
+    """Sliding window of recent request latencies per model, kept sorted for percentile lookups"""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._recent: Dict[str, Deque[float]] = {}
+        self._sorted: Dict[str, List[float]] = {}
+
+    def observe(self, model: str, seconds: float) -> None:
+        recent = self._recent.setdefault(model, deque())
+        ordered = self._sorted.setdefault(model, [])
+        if len(recent) == self.window:
+            del ordered[bisect_left(ordered, recent.popleft())]
+        recent.append(seconds)
+        insort(ordered, seconds)
+
+    def count(self, model: str) -> int:
+        return len(self._recent.get(model, ()))
+
+    def percentile(self, model: str, q: float) -> Optional[float]:
+        """Nearest-rank percentile of the model's recent latencies, None before the first"""
+        ordered = self._sorted.get(model)
+        if not ordered:
+            return None
+        rank = math.ceil(len(ordered) * q / 100)
+        return ordered[min(len(ordered), max(1, rank)) - 1]
+
+class Hedger:
+    """
+    Races a second, identical request against one that is slower than usual.
+
+    Once a request has been on the wire longer than the configured
+    percentile of its model's recent latencies, a hedge is sent and the
+    first to succeed wins; the other is cancelled. At most `max_rate` of
+    all requests are hedged, so a provider that is slow across the board
+    doesn't get its load doubled.
+    """
+
+    def __init__(self, config: HedgeConfig, metrics: Optional[Metrics] = None):
+        self.config = config
+        self.metrics = metrics or get_metrics()
+        self.latencies = LatencyTracker(config.window)
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.requests = 0
+        self.hedged = 0
+
+    def delay(self, model: str) -> Optional[float]:
+        """Seconds on the wire after which a request to `model` gets hedged, None while there's too little data"""
+        if self.latencies.count(model) < self.config.min_samples:
+            return None
+        return max(self.config.min_delay, self.latencies.percentile(model, self.config.percentile))
+
+    def _may_hedge(self) -> bool:
+        return self.hedged < self.config.max_rate * self.requests
+
+    async def run(
+        self,
+        model: str,
+        attempt: Callable[[Optional[asyncio.Event]], Awaitable[Completion]]
+    ) -> Completion:
+        """
+        Run `attempt`, hedging it with a second call if it is slow.
+
+        Args:
+            model: Model the request goes to
+            attempt: Makes one request, setting the given event once it is sent
+
+        Returns:
+            Completion: Completion of whichever request succeeded first
+
+        Raises:
+            Exception: The primary request's error if both fail
+        """
+        self.requests += 1
+        sent = asyncio.Event()
+        primary = asyncio.create_task(attempt(sent), name=f"{model}_primary")
+        tasks = [primary]
+        try:
+            delay = self.delay(model)
+            if delay is None:
+                completion = await primary
+                if completion.start_time is not None:
+                    self.latencies.observe(model, (datetime.now() - completion.start_time).total_seconds())
+                return completion
+
+            # The timer starts once the request holds a scheduler slot, queueing isn't slowness
+            waiter = asyncio.create_task(sent.wait())
+            try:
+                await asyncio.wait([primary, waiter], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            sent_at = time.monotonic()
+            done, _ = await asyncio.wait([primary], timeout=delay)
+            if done or not self._may_hedge():
+                completion = await primary
+                self.latencies.observe(model, time.monotonic() - sent_at)
+                return completion
+
+            self.hedged += 1
+            self.logger.info(f"Hedging {model} request after {delay:.1f}s")
+            hedge = asyncio.create_task(attempt(None), name=f"{model}_hedge")
+            tasks.append(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.metrics.hedges.inc(model=model, winner="hedge" if task is hedge else "primary")
+                        # If the hedge won, the primary took at least this long, which keeps slow requests in the window
+                        self.latencies.observe(model, time.monotonic() - sent_at)
+                        return task.result()
+            self.metrics.hedges.inc(model=model, winner="none")
+            return await primary
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                    # Retrieve the loser's outcome, so an error raised while cancelling isn't logged as unhandled
+                    task.add_done_callback(lambda t: t.cancelled() or t.exception())
@@ -0,0 +1,448 @@
+"""
+Job queue for sharing a batch between worker processes, with `sequencer submit` and `sequencer worker`.
+"""
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from .batch import BatchExecutor
+from .checkpoint import CheckpointStore
+from .clients import close_clients, get_client_registry
+from .coalesce import Coalescer
+from .config import ProviderLimits, get_settings
+from .dataset import read_dataset
+from .hedging import Hedger
+from .metrics import get_metrics
+from .reader import compile_sequence
+from .retry import RetryEngine
+from .router import Router
+from .runner import SequenceRunner
+from .scheduler import Scheduler
+from .sinks import SINKS, SinkPipeline, get_sink
+
+BLUEPRINT_DIR = Path(__file__).parent / "blueprints"
+
+class Job(BaseModel):
+    """One unit of a batch: a single run of a sequence through one model, optionally for one dataset row"""
+    id: int
+    batch_id: int
+    sequence_file: str
+    model: str
+    run_id: int = 0
+    row_id: Optional[str] = None
+    values: Dict[str, Any] = Field(default_factory=dict)
+    attempts: int = 0
+
+class JobQueue:
+    """
+    Job queue in a SQLite file, shared by `sequencer submit` and any number of workers.
+
+    Workers lease jobs for a limited time and renew their leases while
+    running them. Once a lease runs out, because its worker crashed or hung,
+    the job is handed to the next worker that asks. After `max_attempts`
+    leases it fails instead, so a job that takes down every worker can't
+    hold up the batch. Workers on several hosts need the file on a shared
+    filesystem with working locks.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            batch_id INTEGER NOT NULL,
+            sequence_file TEXT NOT NULL,
+            model TEXT NOT NULL,
+            run_id INTEGER NOT NULL,
+            row_id TEXT,
+            placeholders TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            lease_expires REAL,
+            error TEXT,
+            submitted TEXT NOT NULL,
+            finished TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_pending ON jobs(id) WHERE status = 'pending';
+        CREATE INDEX IF NOT EXISTS jobs_leased ON jobs(lease_expires) WHERE status = 'leased';
+        CREATE INDEX IF NOT EXISTS jobs_batch ON jobs(batch_id, status);
+    """
+    COLUMNS = "id, batch_id, sequence_file, model, run_id, row_id, placeholders, attempts"
+
+    def __init__(self, path: str | Path = "results/queue.sqlite", max_attempts: int = 3):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        # Autocommit, transactions are explicit so leasing can take the write lock up front
+        self._db = sqlite3.connect(self.path, isolation_level=None, timeout=30.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(self.SCHEMA)
+        # Workers call in from threads (asyncio.to_thread), one statement sequence at a time
+        self._lock = threading.Lock()
+
+    def _transaction(self, work: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work()
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def submit(
+        self,
+        sequence_file: str | Path,
+        models: List[str],
+        num_runs: int,
+        rows: Optional[Iterable[Tuple[str, Dict[str, Any]]]] = None
+    ) -> Tuple[int, int]:
+        """
+        Enqueue a batch: every run of every model, for every dataset row if given.
+
+        Args:
+            sequence_file: Sequence file, as a path every worker can read
+            models: Models to run
+            num_runs: Runs per model (and row)
+            rows: (row id, placeholder values) pairs, streamed into the queue
+
+        Returns:
+            Tuple[int, int]: Batch id and number of jobs enqueued
+        """
+        path = str(Path(sequence_file).resolve())
+        submitted = datetime.now().isoformat()
+
+        def units() -> Iterator[Tuple]:
+            for row_id, values in rows if rows is not None else [(None, {})]:
+                encoded = json.dumps(values, default=str)
+                for model in models:
+                    for run_id in range(num_runs):
+                        yield (path, model, run_id, row_id, encoded, submitted)
+
+        def insert() -> Tuple[int, int]:
+            batch_id = self._db.execute("SELECT COALESCE(MAX(batch_id), 0) + 1 FROM jobs").fetchone()[0]
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT INTO jobs (batch_id, sequence_file, model, run_id, row_id, placeholders, submitted) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((batch_id, *unit) for unit in units())
+            )
+            return batch_id, self._db.total_changes - before
+
+        return self._transaction(insert)
+
+    def lease(self, worker: str, limit: int, seconds: float) -> List[Job]:
+        """Lease up to `limit` jobs for `seconds`, expired leases first"""
+        now = time.time()
+
+        def take() -> List[Job]:
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', finished = ?, "
+                "error = 'Lease expired ' || attempts || ' times, the job may crash its workers' "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (datetime.now().isoformat(), now, self.max_attempts)
+            )
+            rows = self._db.execute(
+                f"SELECT {self.COLUMNS} FROM jobs WHERE status = 'leased' AND lease_expires < ? "
+                "ORDER BY lease_expires LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            rows += self._db.execute(
+                f"SELECT {self.COLUMNS} FROM jobs WHERE status = 'pending' ORDER BY id LIMIT ?",
+                (limit - len(rows),)
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                [(worker, now + seconds, row[0]) for row in rows]
+            )
+            return [
+                Job(
+                    id=row[0], batch_id=row[1], sequence_file=row[2], model=row[3], run_id=row[4],
+                    row_id=row[5], values=json.loads(row[6]), attempts=row[7] + 1
+                )
+                for row in rows
+            ]
+
+        return self._transaction(take)
+
+    def renew(self, worker: str, job_ids: List[int], seconds: float) -> List[int]:
+        """Extend the worker's leases, returns the ids it still holds"""
+        if not job_ids:
+            return []
+
+        def extend() -> List[int]:
+            marks = ",".join("?" * len(job_ids))
+            self._db.execute(
+                f"UPDATE jobs SET lease_expires = ? WHERE status = 'leased' AND worker = ? AND id IN ({marks})",
+                (time.time() + seconds, worker, *job_ids)
+            )
+            return [row[0] for row in self._db.execute(
+                f"SELECT id FROM jobs WHERE status = 'leased' AND worker = ? AND id IN ({marks})",
+                (worker, *job_ids)
+            )]
+
+        return self._transaction(extend)
+
+    def complete(self, job_id: int, worker: str) -> bool:
+        """Mark a job done, returns False if the worker no longer held its lease"""
+        return self._finish(
+            "UPDATE jobs SET status = 'done', finished = ?, error = NULL "
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (datetime.now().isoformat(), job_id, worker)
+        )
+
+    def fail(self, job_id: int, worker: str, error: str) -> bool:
+        """Requeue a failed job, or fail it for good after `max_attempts`"""
+        return self._finish(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "finished = ?, error = ?, worker = NULL WHERE id = ? AND worker = ? AND status = 'leased'",
+            (self.max_attempts, datetime.now().isoformat(), error, job_id, worker)
+        )
+
+    def release(self, worker: str, job_ids: List[int]) -> None:
+        """Hand unfinished jobs back without counting the attempt, e.g. when a worker shuts down"""
+        if job_ids:
+            marks = ",".join("?" * len(job_ids))
+            self._finish(
+                "UPDATE jobs SET status = 'pending', worker = NULL, lease_expires = NULL, attempts = attempts - 1 "
+                f"WHERE status = 'leased' AND worker = ? AND id IN ({marks})",
+                (worker, *job_ids)
+            )
+
+    def _finish(self, sql: str, params: Tuple) -> bool:
+        return self._transaction(lambda: self._db.execute(sql, params).rowcount > 0)
+
+    def counts(self, batch_id: Optional[int] = None) -> Dict[str, int]:
+        """Number of jobs per status, of one batch or all"""
+        with self._lock:
+            if batch_id is None:
+                rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            else:
+                rows = self._db.execute("SELECT status, COUNT(*) FROM jobs WHERE batch_id = ? GROUP BY status", (batch_id,))
+            return dict(rows.fetchall())
+
+    def remaining(self) -> int:
+        """Jobs not yet done or failed"""
+        counts = self.counts()
+        return counts.get("pending", 0) + counts.get("leased", 0)
+
+    def close(self) -> None:
+        self._db.close()
+
+class Worker:
+    """
+    Leases jobs from a queue and runs them, up to `concurrency` at a time.
+
+    Leases are renewed in the background while jobs run. Results are written
+    and flushed by the sink pipeline before a job is marked done, so a crash
+    in between can only repeat a job, never lose it. Every batch checkpoints to its own
+    directory next to the queue, so a job picked up again resumes after its
+    last finished section, writing the restored sections the checkpoint
+    doesn't mark as written.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        make_runner: Callable[[CheckpointStore], SequenceRunner],
+        pipeline: SinkPipeline,
+        concurrency: int = 8,
+        lease_seconds: float = 300.0,
+        poll_interval: float = 1.0,
+        name: Optional[str] = None
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.queue = queue
+        self.make_runner = make_runner
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.completed = 0
+        self.failed = 0
+        self._runners: Dict[int, SequenceRunner] = {}
+        self._active: Dict[int, asyncio.Task] = {}
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def _runner(self, batch_id: int) -> SequenceRunner:
+        if batch_id not in self._runners:
+            run_dir = self.queue.path.parent / "checkpoints" / f"batch_{batch_id}"
+            run_dir.mkdir(parents=True, exist_ok=True)
+            self._runners[batch_id] = self.make_runner(CheckpointStore(run_dir))
+        return self._runners[batch_id]
+
+    async def _process(self, job: Job) -> None:
+        row = f" row {job.row_id}" if job.row_id is not None else ""
+        self.logger.info(f"Running job {job.id}: {job.model} run {job.run_id}{row} (attempt {job.attempts})")
+        runner = self._runner(job.batch_id)
+        try:
+            results = await runner.run_job(
+                Path(job.sequence_file), job.model, run_id=job.run_id, values=job.values, row_id=job.row_id
+            )
+        except Exception as e:
+            self.failed += 1
+            self.logger.error(f"Job {job.id} failed: {str(e)}")
+            await asyncio.to_thread(self.queue.fail, job.id, self.name, str(e))
+            return
+        try:
+            # Only a job whose results are on disk may be marked done
+            await self.pipeline.write_durable(results, on_written=runner.checkpoints.mark_recorded)
+        except RuntimeError as e:
+            self.failed += 1
+            self.logger.error(f"Job {job.id} finished but its results weren't written: {str(e)}")
+            await asyncio.to_thread(self.queue.fail, job.id, self.name, str(e))
+            return
+        self.completed += 1
+        if not await asyncio.to_thread(self.queue.complete, job.id, self.name):
+            self.logger.warning(f"Lease of job {job.id} ran out before it finished, it may run again")
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            held = set(await asyncio.to_thread(self.queue.renew, self.name, list(self._active), self.lease_seconds))
+            for job_id, task in list(self._active.items()):
+                if job_id not in held:
+                    self.logger.warning(f"Lost the lease of job {job_id}, cancelling it")
+                    task.cancel()
+
+    async def run(self, exit_when_empty: bool = False) -> None:
+        """Process jobs until cancelled, or until the queue is drained with `exit_when_empty`"""
+        heartbeat = asyncio.create_task(self._heartbeat(), name="lease_heartbeat")
+        try:
+            while True:
+                free = self.concurrency - len(self._active)
+                if free:
+                    for job in await asyncio.to_thread(self.queue.lease, self.name, free, self.lease_seconds):
+                        self._active[job.id] = asyncio.create_task(self._process(job), name=f"job_{job.id}")
+                if not self._active:
+                    # Leases held by other workers may still run out and come back
+                    if exit_when_empty and not await asyncio.to_thread(self.queue.remaining):
+                        return
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                done, _ = await asyncio.wait(
+                    self._active.values(), timeout=self.poll_interval, return_when=asyncio.FIRST_COMPLETED
+                )
+                for job_id, task in list(self._active.items()):
+                    if task in done:
+                        del self._active[job_id]
+                        if not task.cancelled() and task.exception():
+                            self.logger.error(f"Job {job_id} crashed: {task.exception()}")
+        finally:
+            heartbeat.cancel()
+            unfinished = list(self._active)
+            for task in self._active.values():
+                task.cancel()
+            await asyncio.gather(*self._active.values(), return_exceptions=True)
+            self._active.clear()
+            await asyncio.to_thread(self.queue.release, self.name, unfinished)
+
+def _find_sequence(filename: str) -> Path:
+    """Sequence file by path, or by name in the blueprints directory"""
+    path = Path(filename)
+    if not path.exists():
+        path = BLUEPRINT_DIR / filename
+    if not path.exists():
+        raise SystemExit(f"Sequence file not found: {filename}")
+    return path
+
+def parse_submit_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse `sequencer submit` arguments"""
+    parser = argparse.ArgumentParser(prog="sequencer submit", description="Enqueue a batch for `sequencer worker`")
+    parser.add_argument("sequence_file", help="Sequence file, a path or the name of a blueprint")
+    parser.add_argument("-m", "--models", nargs="+", required=True, help="Models to run (space-separated)")
+    parser.add_argument("-n", "--num-runs", type=int, default=1, help="Number of runs per model")
+    parser.add_argument("--dataset", default=None, help="CSV/JSONL file of placeholder values, one job per row")
+    parser.add_argument("--queue", default="results/queue.sqlite", help="Queue database")
+    return parser.parse_args(argv)
+
+def submit(argv: Optional[List[str]] = None) -> None:
+    """Enqueue a batch and print its id"""
+    args = parse_submit_args(argv)
+    sequence_file = _find_sequence(args.sequence_file)
+    compile_sequence(sequence_file)  # fail here rather than in every worker
+    rows = read_dataset(args.dataset) if args.dataset else None
+    queue = JobQueue(args.queue)
+    try:
+        batch_id, count = queue.submit(sequence_file, args.models, args.num_runs, rows)
+    finally:
+        queue.close()
+    print(f"Batch {batch_id}: {count} jobs in {args.queue}")
+
+def parse_worker_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse `sequencer worker` arguments"""
+    parser = argparse.ArgumentParser(prog="sequencer worker", description="Run jobs enqueued with `sequencer submit`")
+    parser.add_argument("--queue", default="results/queue.sqlite", help="Queue database")
+    parser.add_argument("-o", "--output-dir", default="results", help="Output directory for results")
+    parser.add_argument(
+        "--sink", nargs="+", choices=list(SINKS), default=["markdown"],
+        help="Result backends: markdown files, results.jsonl and/or results.sqlite (default: markdown)"
+    )
+    parser.add_argument("--concurrency", type=int, default=8, help="Jobs run at the same time (default: 8)")
+    parser.add_argument("--lease", type=float, default=300.0, help="Lease time in seconds, renewed while a job runs")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Leases per job before it fails (default: 3)")
+    parser.add_argument("--exit-when-empty", action="store_true", help="Exit once no jobs are left instead of waiting")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="Max in-flight requests per provider")
+    parser.add_argument("--rpm", type=int, default=None, help="Max requests per minute per provider")
+    parser.add_argument("--tpm", type=int, default=None, help="Max tokens per minute per provider")
+    return parser.parse_args(argv)
+
+async def run_worker(args: argparse.Namespace) -> None:
+    """Run a worker with runners sharing one scheduler, client pool, retry engine, router, coalescer and batcher"""
+    settings = get_settings()
+    metrics = get_metrics()
+    scheduler = Scheduler(
+        settings.provider_limits,
+        default_limits=ProviderLimits(max_concurrency=args.max_concurrency, requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    )
+    retries = RetryEngine(settings.retry, metrics)
+    hedger = Hedger(settings.hedge, metrics) if settings.hedge.enabled else None
+    coalescer = Coalescer(settings.coalesce, metrics) if settings.coalesce.mode != "off" else None
+    batcher = BatchExecutor(settings.batch, metrics) if settings.batch.enabled else None
+    router = Router(settings.model_aliases, scheduler, retries, metrics)
+    clients = get_client_registry(settings.http_pool)
+
+    def make_runner(checkpoints: CheckpointStore) -> SequenceRunner:
+        return SequenceRunner(
+            settings, scheduler=scheduler, clients=clients, checkpoints=checkpoints,
+            metrics=metrics, retries=retries, hedger=hedger, router=router, coalescer=coalescer, batcher=batcher
+        )
+
+    queue = JobQueue(args.queue, max_attempts=args.max_attempts)
+    pipeline = SinkPipeline([get_sink(name, args.output_dir) for name in args.sink]).start()
+    worker = Worker(queue, make_runner, pipeline, concurrency=args.concurrency, lease_seconds=args.lease)
+    logging.getLogger(__name__).info(f"Worker {worker.name} processing {args.queue}")
+    try:
+        await worker.run(exit_when_empty=args.exit_when_empty)
+    finally:
+        if batcher:
+            await batcher.close()
+        await pipeline.close()
+        await close_clients()
+        counts = queue.counts()
+        queue.close()
+        logging.getLogger(__name__).info(
+            f"Worker {worker.name} ran {worker.completed} jobs ({worker.failed} failed), queue: "
+            + ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+        )
+
+def worker(argv: Optional[List[str]] = None) -> None:
+    """Process queued jobs until interrupted"""
+    args = parse_worker_args(argv)
+    try:
+        asyncio.run(run_worker(args))
+    except KeyboardInterrupt:
+        pass
@@ -7,12 +7,21 @@ import logging
 import argparse
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import AsyncIterator, List
+from typing import AsyncIterator, List, Optional, Tuple
 
+from .cache import ResponseCache
+from .checkpoint import CheckpointStore, RunManifest
+from .clients import close_clients, get_client_registry
+from .config import CoalesceConfig, ContextConfig, HedgeConfig, ProviderLimits, get_settings
+from .providers import check_credentials
 from .runner import RunResult, SequenceRunner
-from .runner import run
-from .writer import write_results
-from .reader import read_sequence
+from .scheduler import Scheduler
+from .sinks import SINKS, SinkPipeline, get_sink
+from .summary import RunSummary
+from .writer import StreamWriter
+from .reader import compile_sequence
+from .dataset import read_dataset
+from .metrics import get_metrics
 
 # Configure logging
 logging.basicConfig(
@@ -23,6 +32,8 @@ logger = logging.getLogger(__name__)
 
 # Define blueprints directory relative to package
 BLUEPRINT_DIR = Path(__file__).parent / "blueprints"
+# Dataset runs moving forward together in batch mode, each batch holds a section of every one
+BATCH_WORKERS = 1000
 
 def parse_args() -> argparse.Namespace:
     """Parse command line arguments"""
@@ -32,6 +43,7 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "sequence_file",
         type=str,
+        nargs="?",
         help="Name of sequence file in blueprints directory (e.g., sequence.md)"
     )
     parser.add_argument(
@@ -60,7 +72,168 @@ def parse_args() -> argparse.Namespace:
         default="results",
         help="Output directory for results"
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=None,
+        help="Max in-flight requests per provider (PROVIDER_LIMITS in .env overrides per provider)"
+    )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        default=None,
+        help="Max requests per minute per provider"
+    )
+    parser.add_argument(
+        "--tpm",
+        type=int,
+        default=None,
+        help="Max tokens per minute per provider"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream responses and append them to the output files as they arrive"
+    )
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const="rw",
+        choices=["rw", "ro"],
+        default=None,
+        help="Cache responses on disk: rw (read-write, default) or ro (read-only)"
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="Serve every response from the cache and fail on a cache miss"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=".sequencer_cache",
+        help="Directory of the response cache"
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=1024,
+        help="Size limit of the response cache in MB, least recently used entries are evicted"
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=None,
+        help="Max pooled HTTP connections per provider endpoint"
+    )
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help="Use HTTP/2 for provider connections (requires the http2 extra)"
+    )
+    parser.add_argument(
+        "--hedge",
+        type=float,
+        nargs="?",
+        const=95.0,
+        default=None,
+        metavar="PERCENTILE",
+        help="Hedge requests slower than this latency percentile of their model (default: 95) with a second request"
+    )
+    parser.add_argument(
+        "--hedge-max-rate",
+        type=float,
+        default=None,
+        help="Max share of requests that get hedged (default: 0.1)"
+    )
+    parser.add_argument(
+        "--context-policy",
+        choices=["none", "drop", "truncate", "summarize", "declared"],
+        default=None,
+        help="How older turns are compacted once a request exceeds its token budget (default: none, the request fails)"
+    )
+    parser.add_argument(
+        "--max-input-tokens",
+        type=int,
+        default=None,
+        help="Input token budget per request, below the model's context window"
+    )
+    parser.add_argument(
+        "--no-prompt-caching",
+        dest="prompt_caching",
+        action="store_false",
+        help="Don't mark the conversation prefix for provider prompt caching"
+    )
+    parser.add_argument(
+        "--coalesce",
+        nargs="?",
+        const="deterministic",
+        choices=["deterministic", "always"],
+        default=None,
+        help="Share one request between identical concurrent requests: only at (near-)deterministic sampling (default) or always"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Send requests through the providers' batch APIs (OpenAI, Anthropic), all runs one section at a time"
+    )
+    parser.add_argument(
+        "--n-sampling",
+        action="store_true",
+        help="Get the runs' shared first turns from one request with n choices (OpenAI-compatible providers)"
+    )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        default=None,
+        metavar="RUN_DIR",
+        help="Resume a checkpointed run from its directory (e.g. results/checkpoints/<timestamp>)"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reuse the responses of sections that are unchanged since the last incremental run of the sequence"
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Run incrementally again whenever the sequence file changes"
+    )
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        default=None,
+        help="CSV/JSONL file of placeholder values, the sequence runs once per row"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help=f"Number of concurrent sequence runs in dataset and constant-memory mode (default: 8, {BATCH_WORKERS} with --batch)"
+    )
+    parser.add_argument(
+        "--constant-memory",
+        action="store_true",
+        help="Keep only per-model totals of the results and start at most --workers runs at a time"
+    )
+    parser.add_argument(
+        "--sink",
+        nargs="+",
+        choices=list(SINKS),
+        default=["markdown"],
+        help="Where to write results: markdown files, results.jsonl and/or results.sqlite in the output directory"
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Write latency, token and retry metrics to metrics.txt (OpenMetrics) and metrics.json in the output directory"
+    )
+    args = parser.parse_args()
+    if not args.sequence_file and not args.resume:
+        parser.error("the following arguments are required: sequence_file")
+    if args.resume and (args.incremental or args.watch):
+        parser.error("--resume can't be combined with --incremental or --watch")
+    return args
 
 def get_sequence_path(filename: str) -> Path:
     """
@@ -104,50 +277,233 @@ What is artificial intelligence?
     
     return sequence_path
 
+async def run_batch(
+    runner: SequenceRunner,
+    pipeline: SinkPipeline,
+    sequence_file: Path,
+    models: List[str],
+    num_runs: int,
+    dataset_file: Optional[str],
+    workers: int,
+    constant_memory: bool = False
+) -> None:
+    """Run every model and run of a sequence, handing results to the sinks as they arrive"""
+    start_time = datetime.now()
+    # Results go to the sinks as they arrive, only a compact summary stays in memory
+    summary = RunSummary(keep_records=not constant_memory)
+    
+    if dataset_file:
+        dataset = read_dataset(dataset_file)
+        logger.info(f"Streaming rows from {dataset_file} with {workers} workers")
+        batches = runner.run_dataset(sequence_file, models, num_runs, dataset, max_workers=workers)
+    elif constant_memory:
+        # A single row without values, so runs start as workers free up instead of all at once
+        dataset = None
+        batches = runner.run_dataset(sequence_file, models, num_runs, [(None, {})], max_workers=workers)
+    else:
+        dataset = None
+        batches = runner.run_sequence(sequence_file, models, num_runs)
+    
+    async for results in batches:
+        summary.add(results)
+        await pipeline.put(results, on_written=runner.checkpoints.mark_recorded if runner.checkpoints else None)
+       
+        # Log progress for each completed result, reused ones are counted at the end
+        for result in results:
+            if result.restored:
+                continue
+            status = "Completed" if not result.error else "Failed"
+            logger.info(
+                f"{status} {result.model}"
+                + (f" - row {result.row_id}" if result.row_id is not None else "")
+                + f" - {result.title} - "
+                f"duration: {result.duration_seconds.total_seconds():.1f}s"
+                + (f", first token: {result.time_to_first_token.total_seconds():.1f}s" if result.time_to_first_token else "")
+                + (f" (Error: {result.error})" if result.error else "")
+            )
+        
+    # Log total execution time and success rate
+    total_duration = datetime.now() - start_time
+    num_rows = dataset.rows_read if dataset else 1
+    # Sections restored from checkpoints weren't attempted again
+    total_attempts = num_rows * len(models) * num_runs * (len(compile_sequence(sequence_file).sections) - 1) - summary.restored
+    success_count = summary.ok
+    # No attempts, e.g. a sequence without sections or every section reused
+    success_rate = success_count / total_attempts * 100 if total_attempts else 0.0
+    
+    logger.info(
+        f"Processing complete in {total_duration.total_seconds() / 60:.0f}:{total_duration.total_seconds() % 60:.1f}\n"
+        f"Success rate: {success_count}/{total_attempts} ({success_rate:.1f}%)\n"
+        + "\n".join(summary.report())
+    )
+    if summary.restored:
+        logger.info(f"Reused {summary.restored} sections recorded by an earlier run")
+    if runner.coalescer and runner.coalescer.hits:
+        logger.info(f"Coalesced {runner.coalescer.hits} of {runner.coalescer.requests} requests with identical ones in flight")
+
+async def wait_for_change(path: Path, interval: float = 1.0) -> None:
+    """Poll a file until it changes and then stays unchanged for `interval` seconds, as editors save in steps"""
+    def stamp() -> Optional[Tuple[int, int]]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    last = stamp()
+    changed = False
+    while True:
+        await asyncio.sleep(interval)
+        current = stamp()
+        if current != last:
+            changed, last = True, current
+        elif changed and current is not None:
+            return
+
 async def main() -> None:
     """Main entry point"""
     args = parse_args()
+    pipeline = None
+    runner = None
     
     try:
-        runner = SequenceRunner()
-        sequence_file = get_sequence_path(args.sequence_file)
+        settings = get_settings().model_copy()
+        pool = settings.http_pool.model_copy(update={
+            key: value
+            for key, value in {"max_connections": args.max_connections, "http2": args.http2 or None}.items()
+            if value is not None
+        })
+        if args.hedge is not None or args.hedge_max_rate is not None:
+            settings.hedge = HedgeConfig(**settings.hedge.model_dump() | {
+                key: value
+                for key, value in {"percentile": args.hedge, "max_rate": args.hedge_max_rate}.items()
+                if value is not None
+            } | {"enabled": True})
+        if not args.prompt_caching:
+            settings.prompt_caching = False
+        if args.n_sampling:
+            settings.n_sampling = True
+        if args.batch:
+            settings.batch = settings.batch.model_copy(update={"enabled": True})
+        if args.coalesce:
+            settings.coalesce = CoalesceConfig(**settings.coalesce.model_dump() | {"mode": args.coalesce})
+        settings.context = ContextConfig(**settings.context.model_dump() | {
+            key: value
+            for key, value in {"policy": args.context_policy, "max_input_tokens": args.max_input_tokens}.items()
+            if value is not None
+        })
+        scheduler = Scheduler(
+            settings.provider_limits,
+            default_limits=ProviderLimits(
+                max_concurrency=args.max_concurrency,
+                requests_per_minute=args.rpm,
+                tokens_per_minute=args.tpm
+            )
+        )
+        if args.resume:
+            checkpoints = CheckpointStore(args.resume)
+            manifest = checkpoints.load_manifest()
+            sequence_file = Path(manifest.sequence_file)
+            models, num_runs = manifest.models, manifest.num_runs
+            if not args.replay:
+                check_credentials(settings, models)
+            dataset_file, workers = manifest.dataset, manifest.workers
+            logger.info(f"Resuming checkpointed run from {checkpoints.run_dir}")
+        else:
+            sequence_file = get_sequence_path(args.sequence_file)
+            models, num_runs = args.models, args.num_runs
+            if not args.replay:
+                # Fail before creating checkpoints, replays need no API keys
+                check_credentials(settings, models)
+            dataset_file = args.dataset
+            workers = args.workers or (BATCH_WORKERS if args.batch else 8)
+            manifest = RunManifest(
+                sequence_file=str(sequence_file.resolve()),
+                models=models,
+                num_runs=num_runs,
+                dataset=str(Path(dataset_file).resolve()) if dataset_file else None,
+                workers=workers
+            )
+            if args.incremental or args.watch:
+                checkpoints = CheckpointStore.incremental(args.output_dir, manifest)
+                logger.info(f"Reusing unchanged sections recorded in {checkpoints.run_dir}")
+            else:
+                checkpoints = CheckpointStore.create(args.output_dir, manifest)
+                logger.info(f"Checkpoints in {checkpoints.run_dir} (continue with --resume)")
         
-        logger.info(f"Processing sequence file: {sequence_file}")
-        logger.info(f"Using models: {', '.join(args.models)}")
+        cache_mode = "replay" if args.replay else args.cache
+        runner = SequenceRunner(
+            settings,
+            scheduler=scheduler,
+            stream_writer=StreamWriter(args.output_dir) if args.stream else None,
+            cache=ResponseCache(
+                args.cache_dir,
+                max_bytes=args.cache_max_mb * 1024 * 1024,
+                mode=cache_mode
+            ) if cache_mode else None,
+            clients=get_client_registry(pool),
+            checkpoints=checkpoints
+        )
         
-        start_time = datetime.now()
-        completed_results = []
+        logger.info(f"Processing sequence file: {sequence_file}")
+        logger.info(f"Using models: {', '.join(models)}")
         
-        async for results in runner.run_sequence(sequence_file, args.models, args.num_runs):
-            completed_results.extend(results)
-            write_results(results, args.output_dir)
-           
-            # Log progress for each completed result
-            for result in results:
-                status = "Completed" if not result.error else "Failed"
-                logger.info(
-                    f"{status} {result.model} - {result.title} - "
-                    f"duration: {result.duration_seconds.total_seconds():.1f}s"
-                    + (f" (Error: {result.error})" if result.error else "")
-                )
-            
-        # Log total execution time and success rate
-        total_duration = datetime.now() - start_time
-        total_attempts = len(args.models) * args.num_runs * (len(read_sequence(sequence_file)) - 1)
-        success_count = len([r for r in completed_results if not r.error])
+        # Streamed results are already written to markdown files as they arrive
+        sink_names = [name for name in args.sink if not (args.stream and name == "markdown")]
+        pipeline = SinkPipeline([get_sink(name, args.output_dir) for name in sink_names]).start()
         
-        logger.info(
-            f"Processing complete in {total_duration.total_seconds() / 60:.0f}:{total_duration.total_seconds() % 60:.1f}\n"
-            f"Success rate: {success_count}/{total_attempts} ({success_count/total_attempts*100:.1f}%)"
-        )
+        await run_batch(runner, pipeline, sequence_file, models, num_runs, dataset_file, workers, args.constant_memory)
+        while args.watch:
+            logger.info(f"Watching {sequence_file} for changes")
+            await wait_for_change(sequence_file)
+            logger.info(f"{sequence_file} changed, rerunning changed sections")
+            try:
+                await run_batch(runner, pipeline, sequence_file, models, num_runs, dataset_file, workers, args.constant_memory)
+            except Exception as e:
+                # e.g. a half-edited file, keep watching for the fix
+                logger.error(f"Error processing sequence: {str(e)}")
         
     except Exception as e:
         logger.error(f"Error processing sequence: {str(e)}")
         sys.exit(1)
+    finally:
+        if runner and runner.batcher:
+            await runner.batcher.close()
+        if pipeline:
+            await pipeline.close()
+        if args.metrics:
+            text_path, json_path = get_metrics().write(args.output_dir)
+            logger.info(f"Metrics written to {text_path} and {json_path}")
+        await close_clients()
 
 def cli() -> None:
     """Command line entry point"""
-    asyncio.run(main())
+    # Subcommands import only what they use
+    if sys.argv[1:2] == ["query"]:
+        from .query import query
+        query(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["submit"]:
+        from .jobs import submit
+        submit(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["worker"]:
+        from .jobs import worker
+        worker(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["serve"]:
+        from .service import serve
+        serve(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["remote"]:
+        from .remote import remote
+        remote(sys.argv[2:])
+        return
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        # Results and checkpoints are flushed by main's cleanup
+        logger.info("Interrupted")
 
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,327 @@
+"""
+Metrics module for instrumenting the runner, providers and retries.
+"""
+import json
+import math
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# Seconds, from cached/local responses up to long reasoning completions
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+# Seconds, waiting for a free slot is usually far below a request's latency
+WAIT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+# Prompt tokens, from a single short section up to full 200k context windows
+TOKEN_BUCKETS = (256, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 200000)
+# Seconds, batch APIs promise results within 24 hours
+BATCH_BUCKETS = (1.0, 10.0, 60.0, 300.0, 900.0, 1800.0, 3600.0, 7200.0, 14400.0, 43200.0, 86400.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+class Metric:
+    """Base for metric families with a fixed set of label names"""
+    type = "unknown"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values: Dict[LabelValues, Any] = {}
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _labels(self, key: LabelValues, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> List[str]:
+        """OpenMetrics sample lines"""
+        raise NotImplementedError
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """JSON-ready values per label set"""
+        return [
+            {"labels": dict(zip(self.label_names, key)), "value": value}
+            for key, value in sorted(self._values.items())
+        ]
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}_total{self._labels(key)} {_format(value)}" for key, value in sorted(self._values.items())]
+
+class Gauge(Metric):
+    """Value that goes up and down, e.g. requests in flight"""
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{self._labels(key)} {_format(value)}" for key, value in sorted(self._values.items())]
+
+class _Buckets:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.count = 0
+        self.sum = 0.0
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets"""
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        data = self._values.get(key)
+        if data is None:
+            data = self._values[key] = _Buckets(len(self.buckets))
+        data.counts[bisect_left(self.buckets, value)] += 1
+        data.count += 1
+        data.sum += value
+
+    def quantile(self, q: float, **labels: str) -> Optional[float]:
+        """Estimate a quantile by interpolating within its bucket"""
+        data = self._values.get(self._key(labels))
+        return self._quantile(data, q) if data else None
+
+    def _quantile(self, data: _Buckets, q: float) -> float:
+        rank = q * data.count
+        seen = 0
+        for i, count in enumerate(data.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i]
+                if upper == math.inf:
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-2]
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, data in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, data.counts):
+                cumulative += count
+                le = 'le="' + _format(bound) + '"'
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_count{self._labels(key)} {data.count}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format(data.sum)}")
+        return lines
+
+    def summary(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "labels": dict(zip(self.label_names, key)),
+                "count": data.count,
+                "sum": data.sum,
+                "mean": data.sum / data.count,
+                "p50": self._quantile(data, 0.5),
+                "p95": self._quantile(data, 0.95),
+                "p99": self._quantile(data, 0.99),
+            }
+            for key, data in sorted(self._values.items())
+        ]
+
+class Metrics:
+    """
+    Metric families recorded by a sequencer process.
+
+    Recording is a dict lookup and an addition, cheap enough to stay on in
+    the hot path. Exporting is only done when asked for with `--metrics`.
+    """
+
+    def __init__(self):
+        self.families: Dict[str, Metric] = {}
+        self.request_duration = self._add(Histogram(
+            "sequencer_request_duration_seconds",
+            "Time on the wire per request, from acquiring a scheduler slot to the last token",
+            ["model", "section"]
+        ))
+        self.time_to_first_token = self._add(Histogram(
+            "sequencer_time_to_first_token_seconds",
+            "Time from sending a streamed request to its first token",
+            ["model"]
+        ))
+        self.queue_wait = self._add(Histogram(
+            "sequencer_queue_wait_seconds",
+            "Time spent waiting for a scheduler slot before a request is sent",
+            ["provider"],
+            buckets=WAIT_BUCKETS
+        ))
+        self.context_tokens = self._add(Histogram(
+            "sequencer_context_tokens",
+            "Estimated prompt tokens per request, after compaction",
+            ["model"],
+            buckets=TOKEN_BUCKETS
+        ))
+        self.compacted_turns = self._add(Counter(
+            "sequencer_compacted_turns",
+            "Earlier turns dropped, truncated or summarized to fit a request into its token budget",
+            ["model", "policy"]
+        ))
+        self.tokens = self._add(Counter(
+            "sequencer_tokens",
+            "Tokens reported by the provider: input (including cached), output, cache_read and cache_write",
+            ["model", "direction"]
+        ))
+        self.requests = self._add(Counter(
+            "sequencer_requests",
+            "Requests by outcome: ok, error, cached or shared (a choice of another run's request)",
+            ["model", "outcome"]
+        ))
+        self.retries = self._add(Counter(
+            "sequencer_retries",
+            "Retried provider calls",
+            ["model"]
+        ))
+        self.rate_limits = self._add(Counter(
+            "sequencer_rate_limits",
+            "Rate limit errors returned by providers",
+            ["model"]
+        ))
+        self.hedges = self._add(Counter(
+            "sequencer_hedges",
+            "Hedged requests by which request won: primary, hedge or none if both failed",
+            ["model", "winner"]
+        ))
+        self.circuit_opened = self._add(Counter(
+            "sequencer_circuit_opened",
+            "Times a provider's circuit breaker opened",
+            ["provider"]
+        ))
+        self.routed = self._add(Counter(
+            "sequencer_routed",
+            "Requests to a model alias by the endpoint the router picked",
+            ["model", "endpoint"]
+        ))
+        self.batches = self._add(Counter(
+            "sequencer_batches",
+            "Batches submitted to provider batch APIs by outcome: ok, error or cancelled",
+            ["model", "outcome"]
+        ))
+        self.batch_requests = self._add(Counter(
+            "sequencer_batch_requests",
+            "Requests sent through provider batch APIs",
+            ["model"]
+        ))
+        self.batch_wait = self._add(Histogram(
+            "sequencer_batch_wait_seconds",
+            "Time from submitting a batch to its results",
+            ["model"],
+            buckets=BATCH_BUCKETS
+        ))
+        self.coalesced = self._add(Counter(
+            "sequencer_coalesced_requests",
+            "Requests answered by an identical request already in flight instead of being sent",
+            ["model"]
+        ))
+        self.failovers = self._add(Counter(
+            "sequencer_failovers",
+            "Requests to a model alias moved to another endpoint after the picked one failed",
+            ["model", "endpoint"]
+        ))
+        self.in_flight = self._add(Gauge(
+            "sequencer_requests_in_flight",
+            "Requests currently sent to a provider",
+            ["provider"]
+        ))
+        self.queued = self._add(Gauge(
+            "sequencer_requests_queued",
+            "Requests currently waiting for a scheduler slot",
+            ["provider"]
+        ))
+
+    def _add(self, metric: Metric) -> Metric:
+        self.families[metric.name] = metric
+        return metric
+
+    def to_openmetrics(self) -> str:
+        """Render all families in the OpenMetrics text format"""
+        lines = []
+        for metric in self.families.values():
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            lines.extend(metric.samples())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        """Summarize all families as JSON-ready data"""
+        return {
+            name: {"type": metric.type, "help": metric.help, "values": metric.summary()}
+            for name, metric in self.families.items()
+        }
+
+    def write(self, output_dir: str | Path) -> Tuple[Path, Path]:
+        """
+        Write `metrics.txt` (OpenMetrics) and `metrics.json` (summary) to a directory.
+
+        Args:
+            output_dir: Directory to write to
+
+        Returns:
+            Tuple[Path, Path]: Paths of the OpenMetrics and JSON files
+        """
+        directory = Path(output_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        text_path, json_path = directory / "metrics.txt", directory / "metrics.json"
+        text_path.write_text(self.to_openmetrics(), encoding='utf-8')
+        json_path.write_text(json.dumps(self.summary(), indent=2), encoding='utf-8')
+        return text_path, json_path
+
+_metrics: Optional[Metrics] = None
+
+def get_metrics() -> Metrics:
+    """
+    Get the process-wide metrics.
+
+    Returns:
+        Metrics: Metrics shared by all runners and providers of the process
+    """
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
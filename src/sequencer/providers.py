@@ -1,164 +1,662 @@
 """
 LLM provider interfaces for different API services.
 """
+import re
+import sys
+import json
 import asyncio
 import logging
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterable, List, Dict, Optional, Tuple, Union, get_args
 
-from openai import AsyncOpenAI as OpenAI
-from anthropic import AsyncAnthropic as Anthropic
-from .config import Settings, APIConfig, RunnerConfig
+from pydantic import BaseModel
+from .clients import ClientRegistry, get_client_registry
+from .config import Settings, APIConfig, ModelType, RunnerConfig
+
+if TYPE_CHECKING:
+    # The SDKs take most of the startup time, they are imported once a provider needs them
+    from openai import AsyncOpenAI as OpenAI
+    from anthropic import AsyncAnthropic as Anthropic
 
 class LLMError(Exception):
-    """Base exception for LLM errors"""
-    pass
+    """Base exception for LLM errors, not worth retrying unless a subclass says otherwise"""
+    retryable = False
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
 
 class RateLimitError(LLMError):
     """Rate limit exceeded"""
-    pass
+    retryable = True
+
+class TransientError(LLMError):
+    """Server error, overload, timeout or dropped connection"""
+    retryable = True
+
+# Statuses the SDKs retry themselves: timeout, conflict, rate limit and server errors
+# (529 is Anthropic's "overloaded")
+TRANSIENT_STATUSES = {408, 409, 500, 502, 503, 504, 529}
+# Anthropic prompt cache entries live 5 minutes, refreshed on every hit
+CACHE_CONTROL = {"type": "ephemeral"}
+
+def _duration(value: str) -> Optional[float]:
+    """Parse durations like `1s`, `6m0s`, `20ms` or `1h2m3.5s` as used by OpenAI's reset headers"""
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not parts or "".join(n + u for n, u in parts) != value.strip():
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(n) * scale[u] for n, u in parts)
+
+def _timestamp_delay(value: str) -> Optional[float]:
+    """Seconds until an RFC 3339 or HTTP date, as used by Anthropic's reset headers and Retry-After"""
+    try:
+        when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
 
-async def with_retries(func, max_retries: int = 3, base_delay: float = 1.0):
-    """Simple retry handler with exponential backoff"""
-    for attempt in range(max_retries):
+def retry_after(headers) -> Optional[float]:
+    """
+    Seconds a provider asks clients to wait before retrying.
+
+    Reads `retry-after-ms` and `Retry-After`, then falls back to the rate limit
+    reset headers of OpenAI (`x-ratelimit-reset-*`) and Anthropic
+    (`anthropic-ratelimit-*-reset`), preferring the limit that is exhausted.
+
+    Args:
+        headers: Response headers (case-insensitive mapping)
+
+    Returns:
+        Optional[float]: Seconds to wait, None if the headers don't say
+    """
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+    except ValueError:
+        pass
+    if value := headers.get("retry-after"):
         try:
-            return await func()
-        except RateLimitError:
-            if attempt == max_retries - 1:
-                raise
-            delay = base_delay * (2 ** attempt)
-            await asyncio.sleep(delay)
-    raise LLMError("Max retries exceeded")
+            return max(0.0, float(value))
+        except ValueError:
+            if (delay := _timestamp_delay(value)) is not None:
+                return delay
+    resets, exhausted = [], []
+    for name, value in headers.items():
+        name = name.lower()
+        if name.startswith("x-ratelimit-reset-"):
+            delay = _duration(value)
+            remaining = headers.get(name.replace("-reset-", "-remaining-"))
+        elif name.startswith("anthropic-ratelimit-") and name.endswith("-reset"):
+            delay = _timestamp_delay(value)
+            remaining = headers.get(name[:-len("-reset")] + "-remaining")
+        else:
+            continue
+        if delay is None:
+            continue
+        resets.append(delay)
+        if remaining == "0":
+            exhausted.append(delay)
+    if exhausted:
+        return max(exhausted)
+    return min(resets) if resets else None
+
+def _connection_errors() -> Tuple[type, ...]:
+    """Connection error types of the SDKs loaded so far, no other SDK can have raised one"""
+    errors = [asyncio.TimeoutError]
+    for module, name in (("openai", "APIConnectionError"), ("anthropic", "APIConnectionError"), ("httpx", "TransportError")):
+        if module in sys.modules:
+            errors.append(getattr(sys.modules[module], name))
+    return tuple(errors)
+
+def classify_error(e: Exception) -> LLMError:
+    """
+    Translate an SDK exception into an LLMError by status code and type.
+
+    Args:
+        e: Exception raised by an SDK client
+
+    Returns:
+        LLMError: RateLimitError for 429s, TransientError for server errors,
+            overload, timeouts and connection failures, LLMError otherwise
+    """
+    if isinstance(e, LLMError):
+        return e
+    status = getattr(e, "status_code", None)
+    response = getattr(e, "response", None)
+    delay = retry_after(getattr(response, "headers", None))
+    if status == 429:
+        return RateLimitError(str(e), status=status, retry_after=delay)
+    if status in TRANSIENT_STATUSES:
+        return TransientError(str(e), status=status, retry_after=delay)
+    if status is None and isinstance(e, _connection_errors()):
+        # Covers timeouts too, the SDKs' timeout errors are connection errors
+        return TransientError(str(e))
+    return LLMError(str(e), status=status)
+
+class Completion(BaseModel):
+    """Generated response with its timing and token usage"""
+    text: str
+    start_time: Optional[datetime] = None
+    first_token_time: Optional[datetime] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    # Prompt tokens served from or written to the provider's prompt cache, part of input_tokens
+    cache_read_tokens: Optional[int] = None
+    cache_write_tokens: Optional[int] = None
+    cached: bool = False
 
 class LLMProvider(ABC):
     """Base class for LLM providers"""
     
+    # Whether complete_n asks for several choices in a single request
+    supports_n = False
+    # Whether the provider has an asynchronous batch API, see create_batch
+    supports_batch = False
+    
     def __init__(self, api_config: APIConfig, runner_config: RunnerConfig):
         self.api_config = api_config
         self.runner_config = runner_config
         self.logger = logging.getLogger(self.__class__.__name__)
     
-    @abstractmethod
     async def generate(self, messages: List[Dict[str, str]]) -> str:
         """Generate response from messages"""
+        return (await self.complete(messages)).text
+    
+    @abstractmethod
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        on_chunk: Optional[Callable[[str], None]] = None
+    ) -> Completion:
+        """
+        Generate completion from messages in a single attempt, streaming text chunks to `on_chunk` if given.
+
+        Failures are raised as classified LLMErrors, retrying is left to the caller.
+        """
         pass
     
+    async def complete_n(self, messages: List[Dict[str, str]], n: int) -> List[Completion]:
+        """
+        Generate `n` completions of the same messages in a single request, sharing its prefill.
+
+        The provider may return fewer choices than asked for. Failures are
+        raised as classified LLMErrors.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} doesn't support several choices per request")
+    
+    async def create_batch(self, requests: List[Tuple[str, List[Dict[str, str]]]]) -> str:
+        """
+        Submit requests to the provider's batch API.
+
+        Args:
+            requests: Request ids, unique within the batch, with their messages
+
+        Returns:
+            str: Id of the batch, for poll_batch
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} has no batch API")
+    
+    async def poll_batch(self, batch_id: str) -> Optional[Dict[str, Union[Completion, LLMError]]]:
+        """
+        Get the results of a batch once it has ended.
+
+        Returns:
+            Optional[Dict[str, Union[Completion, LLMError]]]: None while the
+            batch is processing, then the completion or error of every
+            request by id. Requests the batch didn't get to are missing.
+
+        Raises:
+            LLMError: If the batch as a whole failed, or polling failed
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} has no batch API")
+    
+    async def cancel_batch(self, batch_id: str) -> None:
+        """Cancel a batch whose results are no longer needed"""
+        raise NotImplementedError(f"{self.__class__.__name__} has no batch API")
+    
+    async def _collect(
+        self,
+        chunks: AsyncIterator[Optional[str]],
+        on_chunk: Callable[[str], None],
+        completion: Completion
+    ) -> Completion:
+        """Drain a stream of text chunks into `completion`, which the stream may also update with usage"""
+        parts = []
+        async for text in chunks:
+            if not text:
+                continue
+            if completion.first_token_time is None:
+                completion.first_token_time = datetime.now()
+            parts.append(text)
+            on_chunk(text)
+        completion.text = "".join(parts)
+        return completion
+    
     async def _handle_error(self, e: Exception) -> None:
         """Handle provider errors"""
-        error_msg = str(e).lower()
-        self.logger.error(f"Provider error: {error_msg}")
-        if "rate limit" in error_msg:
-            raise RateLimitError(str(e))
-        raise LLMError(str(e))
+        error = classify_error(e)
+        self.logger.error(f"Provider error ({error.__class__.__name__}): {str(e)}")
+        raise error from e
 
 class OpenAIProvider(LLMProvider):
     """OpenAI API provider"""
     
-    def __init__(self, api_config: APIConfig, runner_config: RunnerConfig):
+    supports_n = True
+    supports_batch = True
+    BATCH_ENDPOINT = "/v1/chat/completions"
+    
+    def __init__(self, api_config: APIConfig, runner_config: RunnerConfig, client: Optional["OpenAI"] = None):
         super().__init__(api_config, runner_config)
-        self.client = OpenAI(
-            api_key=api_config.api_key.get_secret_value(),
-            base_url=api_config.base_url,
-            timeout=api_config.timeout,
-            max_retries=api_config.max_retries
+        if client is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(
+                api_key=api_config.api_key.get_secret_value(),
+                base_url=api_config.base_url,
+                timeout=api_config.timeout,
+                max_retries=0  # retried by the runner's RetryEngine
+            )
+        self.client = client
+    
+    def _request(self, messages: List[Dict[str, str]], stream: bool) -> Dict:
+        """Build chat completion parameters"""
+        params = dict(
+            model=self.runner_config.model,
+            messages=messages,
+            temperature=self.runner_config.temperature,
+            top_p=self.runner_config.top_p,
+            max_tokens=self.runner_config.max_tokens,
+            stream=stream
         )
+        if stream:
+            params["stream_options"] = {"include_usage": True}
+        return params
     
-    async def generate(self, messages: List[Dict[str, str]]) -> str:
-        async def _generate():
-            try:
-                self.logger.info(f"Generating with OpenAI model: {self.runner_config.model}")
-                response = await self.client.chat.completions.create(
-                    model=self.runner_config.model,
-                    messages=messages,
-                    temperature=self.runner_config.temperature,
-                    top_p=self.runner_config.top_p,
-                    max_tokens=self.runner_config.max_tokens
-                )
-                return response.choices[0].message.content
-            except Exception as e:
-                await self._handle_error(e)
-                
-        return await with_retries(_generate)
+    def _log_generate(self) -> None:
+        self.logger.info(f"Generating with OpenAI model: {self.runner_config.model}")
+    
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        on_chunk: Optional[Callable[[str], None]] = None
+    ) -> Completion:
+        try:
+            self._log_generate()
+            response = await self.client.chat.completions.create(**self._request(messages, on_chunk is not None))
+            if on_chunk is None:
+                return Completion(text=response.choices[0].message.content, **_openai_usage(response.usage))
+            
+            completion = Completion(text="")
+            async def texts():
+                async for chunk in response:
+                    for field, value in _openai_usage(getattr(chunk, "usage", None)).items():
+                        setattr(completion, field, value)
+                    if chunk.choices:
+                        yield chunk.choices[0].delta.content
+            return await self._collect(texts(), on_chunk, completion)
+        except Exception as e:
+            await self._handle_error(e)
+    
+    async def complete_n(self, messages: List[Dict[str, str]], n: int) -> List[Completion]:
+        try:
+            self._log_generate()
+            response = await self.client.chat.completions.create(**self._request(messages, False), n=n)
+        except Exception as e:
+            await self._handle_error(e)
+        texts = [choice.message.content or "" for choice in sorted(response.choices, key=lambda choice: choice.index)]
+        usage = _openai_usage(response.usage)
+        # Usage covers the whole request: the prompt is counted with the first
+        # choice, output tokens are split by length
+        output_tokens, length = usage.pop("output_tokens", None), sum(len(text) for text in texts) or 1
+        return [
+            Completion(
+                text=text,
+                output_tokens=round(output_tokens * len(text) / length) if output_tokens is not None else None,
+                **(usage if i == 0 else {key: 0 for key, value in usage.items() if value is not None})
+            )
+            for i, text in enumerate(texts)
+        ]
+
+    async def create_batch(self, requests: List[Tuple[str, List[Dict[str, str]]]]) -> str:
+        lines = []
+        for custom_id, messages in requests:
+            body = self._request(messages, False)
+            del body["stream"]
+            lines.append(json.dumps({"custom_id": custom_id, "method": "POST", "url": self.BATCH_ENDPOINT, "body": body}))
+        try:
+            self.logger.info(f"Submitting batch of {len(requests)} requests for OpenAI model: {self.runner_config.model}")
+            file = await self.client.files.create(file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+            batch = await self.client.batches.create(
+                input_file_id=file.id, endpoint=self.BATCH_ENDPOINT, completion_window="24h"
+            )
+        except Exception as e:
+            await self._handle_error(e)
+        return batch.id
+    
+    async def poll_batch(self, batch_id: str) -> Optional[Dict[str, Union[Completion, LLMError]]]:
+        try:
+            batch = await self.client.batches.retrieve(batch_id)
+            if batch.status in ("validating", "in_progress", "finalizing", "cancelling"):
+                return None
+            if batch.status == "failed":
+                errors = "; ".join(error.message or error.code or "" for error in (batch.errors.data or [])) if batch.errors else ""
+                raise LLMError(f"Batch {batch_id} failed" + (f": {errors}" if errors else ""))
+            results: Dict[str, Union[Completion, LLMError]] = {}
+            # Successful requests are in the output file, failed ones in the error file
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                content = await self.client.files.content(file_id)
+                for line in content.text.splitlines():
+                    if line.strip():
+                        item = json.loads(line)
+                        results[item["custom_id"]] = _openai_batch_result(item)
+            return results
+        except LLMError:
+            raise
+        except Exception as e:
+            await self._handle_error(e)
+    
+    async def cancel_batch(self, batch_id: str) -> None:
+        try:
+            await self.client.batches.cancel(batch_id)
+        except Exception as e:
+            await self._handle_error(e)
 
 class AnthropicProvider(LLMProvider):
     """Anthropic API provider"""
     
-    def __init__(self, api_config: APIConfig, runner_config: RunnerConfig):
+    supports_batch = True
+    
+    def __init__(self, api_config: APIConfig, runner_config: RunnerConfig, client: Optional["Anthropic"] = None):
         super().__init__(api_config, runner_config)
-        self.client = Anthropic(
-            api_key=api_config.api_key.get_secret_value()
+        if client is None:
+            from anthropic import AsyncAnthropic
+            client = AsyncAnthropic(
+                api_key=api_config.api_key.get_secret_value(),
+                max_retries=0  # retried by the runner's RetryEngine
+            )
+        self.client = client
+    
+    def _request(self, messages: List[Dict[str, str]], stream: bool) -> Dict:
+        """Build message parameters, with cache breakpoints on the conversation prefix if prompt caching is on"""
+        system = messages[0]["content"]  # as given by runner.SequenceRunner._prepare_messages
+        turns = messages[1:]
+        if self.runner_config.prompt_caching:
+            system = [{"type": "text", "text": system, "cache_control": CACHE_CONTROL}]
+            turns = _cache_breakpoints(turns)
+        return dict(
+            model=self.runner_config.model,
+            system=system,
+            messages=turns,
+            max_tokens=self.runner_config.max_tokens,
+            stream=stream
         )
     
-    async def generate(self, messages: List[Dict[str, str]]) -> str:
-        async def _generate():
-            try:
-                self.logger.info(f"Generating with Anthropic model: {self.runner_config.model}")
-                response = await self.client.messages.create(
-                    model=self.runner_config.model,
-                    system=messages[0]["content"], # as given by runner.SequenceRunner._prepare_messages
-                    messages=messages[1:],  # Exclude system message
-                    max_tokens=self.runner_config.max_tokens,
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        on_chunk: Optional[Callable[[str], None]] = None
+    ) -> Completion:
+        try:
+            self.logger.info(f"Generating with Anthropic model: {self.runner_config.model}")
+            # The prompt caching beta reports cache usage, plain messages don't in this SDK version
+            api = self.client.beta.prompt_caching.messages if self.runner_config.prompt_caching else self.client.messages
+            response = await api.create(**self._request(messages, on_chunk is not None))
+            if on_chunk is None:
+                return Completion(
+                    text=response.content[0].text,
+                    output_tokens=response.usage.output_tokens,
+                    **_anthropic_input_usage(response.usage)
                 )
-                return response.content[0].text
-            except Exception as e:
-                await self._handle_error(e)
-                
-        return await with_retries(_generate)
+            
+            completion = Completion(text="")
+            async def texts():
+                async for event in response:
+                    if event.type == "message_start":
+                        for field, value in _anthropic_input_usage(event.message.usage).items():
+                            setattr(completion, field, value)
+                    elif event.type == "message_delta":
+                        completion.output_tokens = event.usage.output_tokens
+                    elif event.type == "content_block_delta":
+                        yield getattr(event.delta, "text", None)
+            return await self._collect(texts(), on_chunk, completion)
+        except Exception as e:
+            await self._handle_error(e)
+
+    async def create_batch(self, requests: List[Tuple[str, List[Dict[str, str]]]]) -> str:
+        batch_requests = []
+        for custom_id, messages in requests:
+            params = self._request(messages, False)
+            del params["stream"]
+            batch_requests.append({"custom_id": custom_id, "params": params})
+        # Cache breakpoints need the prompt caching beta in batches too
+        betas = {"betas": ["prompt-caching-2024-07-31"]} if self.runner_config.prompt_caching else {}
+        try:
+            self.logger.info(f"Submitting batch of {len(requests)} requests for Anthropic model: {self.runner_config.model}")
+            batch = await self.client.beta.messages.batches.create(requests=batch_requests, **betas)
+        except Exception as e:
+            await self._handle_error(e)
+        return batch.id
+    
+    async def poll_batch(self, batch_id: str) -> Optional[Dict[str, Union[Completion, LLMError]]]:
+        try:
+            batch = await self.client.beta.messages.batches.retrieve(batch_id)
+            if batch.processing_status != "ended":
+                return None
+            results: Dict[str, Union[Completion, LLMError]] = {}
+            async for item in await self.client.beta.messages.batches.results(batch_id):
+                if item.result.type == "succeeded":
+                    message = item.result.message
+                    results[item.custom_id] = Completion(
+                        text=message.content[0].text,
+                        output_tokens=message.usage.output_tokens,
+                        **_anthropic_input_usage(message.usage)
+                    )
+                elif item.result.type == "errored":
+                    results[item.custom_id] = LLMError(f"Batch request failed: {item.result.error.error.message}")
+                else:
+                    results[item.custom_id] = LLMError(f"Batch request {item.result.type}")
+            return results
+        except Exception as e:
+            await self._handle_error(e)
+    
+    async def cancel_batch(self, batch_id: str) -> None:
+        try:
+            await self.client.beta.messages.batches.cancel(batch_id)
+        except Exception as e:
+            await self._handle_error(e)
 
-class OtherProviderOpenAILib(LLMProvider):
+class OtherProviderOpenAILib(OpenAIProvider):
     """Other Provider based on the OpenAI library"""
     
-    def __init__(self, api_config: APIConfig, runner_config: RunnerConfig):
-        super().__init__(api_config, runner_config)
-        self.client = OpenAI(
-            api_key=api_config.api_key.get_secret_value(),
-            base_url=str(api_config.base_url),
-            timeout=api_config.timeout,
-            max_retries=api_config.max_retries
+    # Batch APIs of OpenAI-compatible providers differ from OpenAI's, if they have one
+    supports_batch = False
+    # Together, SambaNova and Cerebras may reject `n` > 1 or ignore it
+    supports_n = False
+    
+    def __init__(self, api_config: APIConfig, runner_config: RunnerConfig, client: Optional["OpenAI"] = None):
+        if client is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(
+                api_key=api_config.api_key.get_secret_value(),
+                base_url=str(api_config.base_url),
+                timeout=api_config.timeout,
+                max_retries=0  # retried by the runner's RetryEngine
+            )
+        super().__init__(api_config, runner_config, client=client)
+    
+    def _request(self, messages: List[Dict[str, str]], stream: bool) -> Dict:
+        """Build chat completion parameters, leaving max_tokens and stream_options to the provider's defaults"""
+        return dict(
+            model=self.runner_config.model,
+            messages=messages,
+            temperature=self.runner_config.temperature,
+            top_p=self.runner_config.top_p,
+            stream=stream
         )
     
-    async def generate(self, messages: List[Dict[str, str]]) -> str:
-        async def _generate():
-            try:
-                self.logger.info(f"Generating with Other AI model: {self.runner_config.model}")
-                response = await self.client.chat.completions.create(
-                    model=self.runner_config.model,
-                    messages=messages,
-                    temperature=self.runner_config.temperature,
-                    top_p=self.runner_config.top_p
-                )
-                return response.choices[0].message.content
-            except Exception as e:
-                await self._handle_error(e)
-                
-        return await with_retries(_generate)
+    def _log_generate(self) -> None:
+        self.logger.info(f"Generating with Other AI model: {self.runner_config.model}")
+
+def _openai_usage(usage) -> Dict[str, Optional[int]]:
+    """Token counts from an OpenAI-compatible usage object"""
+    if usage is None:
+        return {}
+    counts = {"input_tokens": usage.prompt_tokens, "output_tokens": usage.completion_tokens}
+    # Prompt caching is automatic, OpenAI reports the cached part of the prompt
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is not None and getattr(details, "cached_tokens", None) is not None:
+        counts["cache_read_tokens"] = details.cached_tokens
+    return counts
+
+def _openai_batch_result(item: Dict) -> Union[Completion, LLMError]:
+    """Completion or error of one line of an OpenAI batch output or error file"""
+    from openai.types.chat import ChatCompletion
+    response = item.get("response") or {}
+    if response.get("status_code") == 200:
+        body = ChatCompletion.model_validate(response["body"])
+        return Completion(text=body.choices[0].message.content or "", **_openai_usage(body.usage))
+    error = item.get("error") or (response.get("body") or {}).get("error") or {}
+    return LLMError(f"Batch request failed: {error.get('message', 'no error message')}", status=response.get("status_code"))
+
+def _anthropic_input_usage(usage) -> Dict[str, Optional[int]]:
+    """Prompt token counts from an Anthropic usage object, input_tokens including cached ones as with OpenAI"""
+    read = getattr(usage, "cache_read_input_tokens", None)
+    written = getattr(usage, "cache_creation_input_tokens", None)
+    return {
+        "input_tokens": usage.input_tokens + (read or 0) + (written or 0),
+        "cache_read_tokens": read,
+        "cache_write_tokens": written,
+    }
 
-def get_provider(settings: Settings, runner_config: RunnerConfig) -> LLMProvider:
+def _cache_breakpoints(messages: List[Dict[str, str]]) -> List[Dict]:
     """
-    Get appropriate provider instance.
+    Messages with cache breakpoints on the previous request's last prompt and on the new one.
+    
+    The first reads the prefix cached by the previous turn, the second
+    caches the whole prompt for the next turn, so the cached prefix grows
+    along with the conversation. Together with the system prompt, that is
+    3 of the 4 breakpoints Anthropic allows.
+    """
+    marked = {len(messages) - 1}
+    previous = next((i for i in range(len(messages) - 2, -1, -1) if messages[i]["role"] == "user"), None)
+    if previous is not None:
+        marked.add(previous)
+    return [
+        {
+            "role": message["role"],
+            "content": [{"type": "text", "text": message["content"], "cache_control": CACHE_CONTROL}]
+        } if i in marked else message
+        for i, message in enumerate(messages)
+    ]
+
+def get_provider_name(model: str) -> str:
+    """
+    Get the name of the provider serving a model.
     
     Args:
         model: Model type to use
-        api_config: API configuration
-        runner_config: Runner configuration
         
     Returns:
-        LLMProvider: Provider instance for the specified model
+        str: Provider name, also used as the key for provider settings
         
     Raises:
         ValueError: If model type is not supported
     """
-    model = runner_config.model
     if "gpt-4" in model or "o1-" in model or "gpt-3.5" in model:
-        return OpenAIProvider(settings.openai_config, runner_config)
+        return "openai"
     elif "claude" in model:
-        return AnthropicProvider(settings.anthropic_config, runner_config)
+        return "anthropic"
     elif "meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo" in model:
-        return OtherProviderOpenAILib(settings.together_config, runner_config)
+        return "together"
     elif "Meta-Llama-3.1-405B-Instruct" in model:
-        return OtherProviderOpenAILib(settings.sambanova_config, runner_config)
+        return "sambanova"
     elif "llama-3.3-70b" in model:
-        return OtherProviderOpenAILib(settings.cerebras_config, runner_config)
+        return "cerebras"
     else:
         raise ValueError(f"Unsupported model: {model}")
-    
\ No newline at end of file
+
+def check_credentials(settings: Settings, models: Iterable[str]) -> None:
+    """
+    Check that the API keys of the providers serving the models are set, before any run starts.
+    
+    Args:
+        settings: Settings holding the API keys
+        models: Models or model aliases, aliases need every endpoint they route to
+        
+    Raises:
+        ValueError: If a model is unsupported or its provider's API key isn't set
+    """
+    for model in models:
+        for endpoint in settings.model_aliases.get(model, [model]):
+            getattr(settings, f"{get_provider_name(endpoint)}_config")
+
+def get_provider(
+    settings: Settings,
+    runner_config: RunnerConfig,
+    clients: Optional[ClientRegistry] = None
+) -> LLMProvider:
+    """
+    Get appropriate provider instance.
+    
+    Args:
+        settings: Settings holding the API configurations
+        runner_config: Runner configuration
+        clients: Registry of pooled clients, defaults to the process-wide one
+        
+    Returns:
+        LLMProvider: Provider instance for the specified model
+        
+    Raises:
+        ValueError: If model type is not supported
+    """
+    name = get_provider_name(runner_config.model)
+    clients = clients or get_client_registry(settings.http_pool)
+    if name == "openai":
+        config = settings.openai_config
+        return OpenAIProvider(config, runner_config, client=clients.openai(config))
+    elif name == "anthropic":
+        config = settings.anthropic_config
+        return AnthropicProvider(config, runner_config, client=clients.anthropic(config))
+    else:
+        config = getattr(settings, f"{name}_config")
+        return OtherProviderOpenAILib(config, runner_config, client=clients.openai(config))
+
+def warm_clients(settings: Settings, clients: Optional[ClientRegistry] = None) -> List[str]:
+    """
+    Import the SDKs and create the pooled clients of every provider whose API key is set.
+
+    Blocking, meant to run off the event loop before a long-running process
+    takes requests, so the first one doesn't pay for the imports.
+
+    Args:
+        settings: Settings holding the API configurations
+        clients: Registry of pooled clients, defaults to the process-wide one
+
+    Returns:
+        List[str]: Names of the providers whose clients were created
+    """
+    clients = clients or get_client_registry(settings.http_pool)
+    warmed = []
+    for name in dict.fromkeys(get_provider_name(model) for model in get_args(ModelType)):
+        try:
+            config = getattr(settings, f"{name}_config")
+        except ValueError:
+            continue  # no API key, so no requests either
+        if name == "anthropic":
+            clients.anthropic(config)
+        else:
+            clients.openai(config)
+        warmed.append(name)
+    return warmed
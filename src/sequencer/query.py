@@ -0,0 +1,72 @@
+"""
+Query command for the indexed results store.
+"""
+import argparse
+from pathlib import Path
+from typing import List, Optional
+
+from .store import ResultStore
+
+def parse_query_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse `sequencer query` arguments"""
+    parser = argparse.ArgumentParser(
+        prog="sequencer query",
+        description="Query results recorded with --sink sqlite"
+    )
+    parser.add_argument(
+        "--db",
+        default="results/results.sqlite",
+        help="Results database to query"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    latency = commands.add_parser("latency", help="Latency percentile per model")
+    latency.add_argument("-p", "--percentile", type=float, default=95.0, help="Percentile between 0 and 100")
+    latency.add_argument("--section", help="Only include results of the section with this title")
+    latency.add_argument("--batch", type=int, help="Only include results of this batch (default: all)")
+
+    errors = commands.add_parser("errors", help="Failed sections of a batch")
+    errors.add_argument("--batch", type=int, help="Batch to list (default: latest)")
+
+    batches = commands.add_parser("batches", help="Recorded batches")
+    batches.add_argument("--limit", type=int, default=20, help="Number of batches to list")
+
+    response = commands.add_parser("response", help="Print the response of a stored result")
+    response.add_argument("result_id", type=int, help="Result id, as listed by `errors`")
+
+    return parser.parse_args(argv)
+
+def query(argv: Optional[List[str]] = None) -> None:
+    """Run a query against the results store and print the outcome"""
+    args = parse_query_args(argv)
+    if not Path(args.db).exists():
+        raise SystemExit(f"No results database at {args.db}")
+    store = ResultStore(args.db)
+    try:
+        if args.command == "latency":
+            latencies = store.latency_percentile(args.percentile, title=args.section, batch_id=args.batch)
+            if not latencies:
+                print("No successful results match")
+            for model, seconds in sorted(latencies.items()):
+                print(f"{model}: p{args.percentile:g} {seconds:.2f}s")
+        elif args.command == "errors":
+            for error in store.errors(args.batch):
+                row = f" row {error.row_id}" if error.row_id is not None else ""
+                print(
+                    f"[{error.id}] {error.model} run {error.run_id}{row} "
+                    f"section {error.section_index} '{error.title}': {error.error}"
+                )
+        elif args.command == "batches":
+            for batch in store.batches(args.limit):
+                label = f" {batch.label}" if batch.label else ""
+                print(
+                    f"{batch.id}{label}: {batch.started:%Y-%m-%d %H:%M:%S}, "
+                    f"{batch.results} results, {batch.errors} errors"
+                )
+        elif args.command == "response":
+            text = store.response(args.result_id)
+            if text is None:
+                raise SystemExit(f"No result with id {args.result_id}")
+            print(text)
+    finally:
+        store.close()
@@ -1,15 +1,25 @@
 """
 Sequence reader module for parsing markdown prompt files.
 """
+import hashlib
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict
+from typing import Any, List, Dict, Mapping, Optional, Set, Tuple
 import re
 from pydantic import BaseModel, Field, field_validator
 
+# Anything in single braces may be a placeholder, as in str.replace("{key}", value)
+PLACEHOLDER_PATTERN = re.compile(r'\{([^{}\n]+)\}')
+IDENTIFIER_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+# Optional first line of a section's content, e.g. "depends: Draft, Outline"
+DEPENDS_PATTERN = re.compile(r'^depends:[ \t]*([^\n]*)(\n|$)', re.IGNORECASE)
+
 class PromptSection(BaseModel):
     """Single prompt section from sequence file"""
     title: str = Field(..., min_length=1)
     content: str = Field(..., min_length=1)
+    # Titles of the earlier sections this one sees, None for all of them
+    depends: Optional[List[str]] = None
     
     @field_validator('title', 'content')
     def no_empty_strings(cls, v: str) -> str:
@@ -51,12 +61,24 @@ class SequenceReader:
                                 
                 # Get everything after the title line as content
                 content = re.sub(r'^#\s+.+?\n', '', section, count=1, flags=re.MULTILINE).strip()
+                depends = None
+                depends_match = DEPENDS_PATTERN.match(content)
+                if depends_match:
+                    if not result:
+                        raise ValueError("The system prompt cannot have dependencies")
+                    depends = [title.strip() for title in depends_match.group(1).split(",") if title.strip()]
+                    earlier = {previous.title for previous in result[1:]}
+                    for title in depends:
+                        if title not in earlier:
+                            raise ValueError(f"Unknown dependency '{title}', must be the title of an earlier section")
+                    content = content[depends_match.end():].strip()
                 if not content:
                     raise ValueError(f"Missing content")
                 
                 result.append(PromptSection(
                     title=title_match.group(1),
-                    content=content
+                    content=content,
+                    depends=depends
                 ))
             except ValueError as e:
                 raise ValueError(f"Error in section {i}: {str(e)}")        
@@ -88,3 +110,148 @@ def read_sequence(file_path: str | Path) -> List[PromptSection]:
     reader = SequenceReader(file_path)
     content = reader.read_content()
     return reader.parse_sections(content)
+
+def section_context(sections: List[PromptSection], transitive: bool = True) -> List[List[int]]:
+    """
+    Get the earlier sections each section sees, following dependencies transitively.
+    
+    A section without declared dependencies sees every earlier section, so
+    sequences without any run strictly in order. A dependency refers to the
+    closest earlier section with that title. The system prompt (index 0) is
+    part of every context and not listed.
+    
+    Args:
+        sections: Parsed sections, the system prompt first
+        transitive: If False, a section sees only its declared dependencies,
+            or only the previous section if it declares none
+        
+    Returns:
+        List[List[int]]: Ascending indices of the sections in each section's context
+    """
+    context: List[List[int]] = [[]]
+    titles: Dict[str, int] = {}
+    for index, section in enumerate(sections[1:], 1):
+        if section.depends is None:
+            context.append(list(range(1, index)) if transitive else list(range(max(1, index - 1), index)))
+        else:
+            seen: Set[int] = set()
+            for title in section.depends:
+                if title not in titles:
+                    raise ValueError(f"Section {section.title} depends on unknown section {title}")
+                seen.add(titles[title])
+                if transitive:
+                    seen.update(context[titles[title]])
+            context.append(sorted(seen))
+        titles[section.title] = index
+    return context
+
+def prompt_hashes(sections: List[PromptSection], context: Optional[List[List[int]]] = None) -> List[str]:
+    """
+    Hash each section's prompt together with the prompts it builds on.
+    
+    A section's hash changes when its own title or content changes, or
+    those of the system prompt or of any section in its context, which is
+    when a recorded response to it can no longer be reused.
+    
+    Args:
+        sections: Parsed sections, the system prompt first
+        context: Each section's context as returned by `section_context`
+        
+    Returns:
+        List[str]: Hex digest per section, the system prompt's first
+    """
+    if context is None:
+        context = section_context(sections)
+    hashes: List[str] = []
+    for index, section in enumerate(sections):
+        digest = hashlib.sha256()
+        for part in [section.title, section.content, *(hashes[i] for i in ([0] if index else []) + context[index])]:
+            digest.update(part.encode("utf-8") + b"\0")
+        hashes.append(digest.hexdigest())
+    return hashes
+
+class Template:
+    """Text split once into literal segments and the placeholders between them"""
+    
+    def __init__(self, text: str):
+        self.literals: List[str] = []
+        self.names: List[str] = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            self.literals.append(text[position:match.start()])
+            self.names.append(match.group(1))
+            position = match.end()
+        self.literals.append(text[position:])
+        # Code snippets in blueprints also contain braces, only identifiers count as declared placeholders
+        self.placeholders: Set[str] = {name for name in self.names if IDENTIFIER_PATTERN.match(name)}
+    
+    def render(self, values: Mapping[str, Any]) -> str:
+        """Fill in placeholders in a single pass, leaving those without a value as they are"""
+        if not self.names:
+            return self.literals[0]
+        parts = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            value = values.get(name)
+            parts.append(str(value) if value is not None else f"{{{name}}}")
+            parts.append(literal)
+        return "".join(parts)
+
+class CompiledSequence:
+    """Parsed sequence with the placeholder spans of every section precomputed"""
+    
+    def __init__(self, sections: List[PromptSection]):
+        self.sections = sections
+        self.templates = [Template(section.content) for section in sections]
+        self.placeholders: Set[str] = set().union(*(template.placeholders for template in self.templates))
+    
+    def check(self, values: Mapping[str, Any]) -> Tuple[Set[str], Set[str]]:
+        """Get placeholders without a value and values without a placeholder"""
+        provided = {key for key, value in values.items() if value is not None}
+        return self.placeholders - provided, set(values) - self.placeholders
+    
+    def render(self, values: Mapping[str, Any], strict: bool = False) -> List[PromptSection]:
+        """
+        Render sections with placeholder values, sharing sections that have no placeholders.
+        
+        Raises:
+            ValueError: If strict and a placeholder has no value or a value is unused
+        """
+        if strict:
+            missing, unused = self.check(values)
+            if missing or unused:
+                raise ValueError(
+                    f"Placeholder mismatch - missing: {sorted(missing)}, unused: {sorted(unused)}"
+                )
+        return [
+            section.model_copy(update={"content": template.render(values)}) if template.names else section
+            for section, template in zip(self.sections, self.templates)
+        ]
+
+@lru_cache(maxsize=32)
+def _compile(file_path: Path, mtime_ns: int, size: int) -> CompiledSequence:
+    return CompiledSequence(read_sequence(file_path))
+
+def compile_sequence(file_path: str | Path) -> CompiledSequence:
+    """
+    Read, parse and compile a sequence file, cached until the file changes.
+    
+    Args:
+        file_path: Path to the sequence file
+        
+    Returns:
+        CompiledSequence: Sections with precomputed placeholder spans, shared
+        between callers and not to be modified
+        
+    Raises:
+        FileNotFoundError: If the file doesn't exist
+        ValueError: If the file is empty or has invalid format
+    
+    Example:
+        >>> compiled = compile_sequence("prompts.md")
+        >>> sections = compiled.render({"topic": "robotics"})
+    """
+    path = Path(file_path).resolve()
+    if not path.exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
+    stat = path.stat()
+    return _compile(path, stat.st_mtime_ns, stat.st_size)
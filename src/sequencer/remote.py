@@ -0,0 +1,175 @@
+"""
+Thin client of `sequencer serve`, with `sequencer remote`.
+
+Uses only the standard library, so it starts without loading the provider
+SDKs or settings.
+"""
+import os
+import sys
+import json
+import argparse
+import http.client
+from pathlib import Path
+from urllib.parse import urlsplit
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_URL = os.environ.get("SEQUENCER_URL", "http://127.0.0.1:8765")
+
+class ServiceError(Exception):
+    """Error answer of the service"""
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class ServiceClient:
+    """
+    Client of the HTTP API of `sequencer serve`.
+
+    Args:
+        url: Service URL
+        timeout: Socket timeout in seconds, None to wait for slow runs indefinitely
+    """
+
+    def __init__(self, url: str = DEFAULT_URL, timeout: Optional[float] = None):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> http.client.HTTPResponse:
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        body = json.dumps(payload).encode() if payload is not None else None
+        try:
+            connection.request(method, path, body=body, headers={"content-type": "application/json"} if body else {})
+            return connection.getresponse()
+        except OSError as e:
+            raise ServiceError(f"Service at {self.host}:{self.port} not reachable: {str(e)} (start it with `sequencer serve`)")
+
+    def _json(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Any:
+        response = self._request(method, path, payload)
+        data = json.loads(response.read() or b"null")
+        if response.status >= 400:
+            raise ServiceError(data.get("error", response.reason) if isinstance(data, dict) else response.reason, response.status)
+        return data
+
+    def health(self) -> Dict[str, Any]:
+        return self._json("GET", "/health")
+
+    def submit(
+        self,
+        sequence_file: str,
+        models: List[str],
+        num_runs: int = 1,
+        placeholders: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Start a run on the service.
+
+        Args:
+            sequence_file: Sequence file as a path the service can read, or a blueprint name
+            models: Models to run
+            num_runs: Runs per model
+            placeholders: Placeholder values
+
+        Returns:
+            Dict[str, Any]: Status of the run, with its `id`
+
+        Raises:
+            ServiceError: If the service rejected the run or isn't running
+        """
+        return self._json("POST", "/runs", {
+            "sequence_file": sequence_file,
+            "models": models,
+            "num_runs": num_runs,
+            "placeholders": placeholders or {},
+        })
+
+    def status(self, run_id: str) -> Dict[str, Any]:
+        return self._json("GET", f"/runs/{run_id}")
+
+    def cancel(self, run_id: str) -> Dict[str, Any]:
+        return self._json("DELETE", f"/runs/{run_id}")
+
+    def events(self, run_id: str, start: int = 0) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Follow a run's server-sent events.
+
+        Yields:
+            Tuple[str, Dict[str, Any]]: `result` events with a RunResult as
+            a dict, then one `end` event with the final status of the run
+        """
+        response = self._request("GET", f"/runs/{run_id}/events?from={start}")
+        if response.status >= 400:
+            raise ServiceError(json.loads(response.read() or b"{}").get("error", response.reason), response.status)
+        event, data = "message", []
+        for line in response:
+            line = line.decode("utf-8").rstrip("\r\n")
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                data.append(line[5:].strip())
+            elif not line and data:
+                yield event, json.loads("\n".join(data))
+                event, data = "message", []
+
+def _placeholder(item: str) -> Tuple[str, str]:
+    name, sep, value = item.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Expected NAME=VALUE, got {item}")
+    return name, value
+
+def parse_remote_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse `sequencer remote` arguments"""
+    parser = argparse.ArgumentParser(
+        prog="sequencer remote",
+        description="Run a sequence on a running `sequencer serve`, printing results as JSON lines"
+    )
+    parser.add_argument("sequence_file", nargs="?", help="Sequence file, a path or the name of a blueprint")
+    parser.add_argument("-m", "--models", nargs="+", help="Models to run (space-separated)")
+    parser.add_argument("-n", "--num-runs", type=int, default=1, help="Number of runs per model")
+    parser.add_argument(
+        "-p", "--placeholder", type=_placeholder, action="append", default=[], metavar="NAME=VALUE",
+        help="Placeholder value, repeatable"
+    )
+    parser.add_argument("--url", default=DEFAULT_URL, help=f"Service URL (default: $SEQUENCER_URL or {DEFAULT_URL})")
+    parser.add_argument("--detach", action="store_true", help="Print the run id and return without waiting for results")
+    parser.add_argument("--follow", metavar="RUN_ID", help="Print the results of a submitted run")
+    parser.add_argument("--cancel", metavar="RUN_ID", help="Cancel a submitted run")
+    args = parser.parse_args(argv)
+    if not (args.follow or args.cancel) and not (args.sequence_file and args.models):
+        parser.error("a sequence file and --models are required unless --follow or --cancel is given")
+    return args
+
+def remote(argv: Optional[List[str]] = None) -> None:
+    """Submit a run to the service and print its results as they arrive"""
+    args = parse_remote_args(argv)
+    client = ServiceClient(args.url)
+    run_id = args.follow
+    try:
+        if args.cancel:
+            print(json.dumps(client.cancel(args.cancel)))
+            return
+        if not run_id:
+            # A local file is sent as an absolute path, the service may run elsewhere
+            path = Path(args.sequence_file)
+            sequence_file = str(path.resolve()) if path.exists() else args.sequence_file
+            run_id = client.submit(sequence_file, args.models, args.num_runs, dict(args.placeholder))["id"]
+            if args.detach:
+                print(run_id)
+                return
+        for event, data in client.events(run_id):
+            if event == "result":
+                print(json.dumps(data), flush=True)
+            elif event == "end":
+                print(f"{data['id']} {data['status']}: {data['results']} results, {data['failed']} failed"
+                      + (f" ({data['error']})" if data.get("error") else ""), file=sys.stderr)
+                if data["status"] != "done":
+                    sys.exit(1)
+    except ServiceError as e:
+        sys.exit(f"Error: {str(e)}")
+    except KeyboardInterrupt:
+        if run_id:
+            client.cancel(run_id)
+
+if __name__ == "__main__":
+    remote()
@@ -0,0 +1,171 @@
+"""
+Retry engine with backoff, Retry-After handling and per-provider circuit breakers.
+"""
+import time
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from .config import RetryConfig
+from .metrics import Metrics, get_metrics
+from .providers import LLMError, RateLimitError, classify_error
+
+T = TypeVar("T")
+
+class CircuitOpenError(LLMError):
+    """Provider is failing and not taking traffic until its circuit breaker resets"""
+    pass
+
+class CircuitBreaker:
+    """
+    Stops traffic to a provider after consecutive transient failures.
+
+    Once open, calls fail fast for `reset_timeout` seconds. Then a single
+    probe is let through: success closes the breaker, failure opens it again.
+    Rate limits don't count as failures, the provider is up and only asks
+    to slow down.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless the call may go through"""
+        state = self.state
+        if state == "open" or (state == "half-open" and self._probing):
+            remaining = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            raise CircuitOpenError(
+                f"Circuit breaker for {self.name} is open after {self.failures} consecutive failures, "
+                f"retrying in {remaining:.0f}s"
+            )
+        if state == "half-open":
+            self._probing = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> bool:
+        """Count a transient failure, returns whether the breaker (re)opened"""
+        self.failures += 1
+        reopened = self._probing
+        self._probing = False
+        if reopened or (self.opened_at is None and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def release(self) -> None:
+        """End a probe that neither succeeded nor failed transiently"""
+        self._probing = False
+
+class RetryEngine:
+    """
+    The single retry layer for provider calls.
+
+    Retries errors classified as retryable (rate limits, server errors,
+    overload, timeouts, dropped connections). Waits as long as the provider
+    asks via Retry-After or its rate limit reset headers, plus jitter, and
+    otherwise backs off with decorrelated jitter. Parallel runs hitting the
+    same limit thereby spread out instead of retrying in waves.
+    """
+
+    def __init__(self, config: Optional[RetryConfig] = None, metrics: Optional[Metrics] = None):
+        self.config = config or RetryConfig()
+        self.metrics = metrics or get_metrics()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._random = random.Random()
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        """Get (or lazily create) the circuit breaker of a provider"""
+        if provider not in self._breakers:
+            self._breakers[provider] = CircuitBreaker(
+                provider, self.config.failure_threshold, self.config.reset_timeout
+            )
+        return self._breakers[provider]
+
+    def backoff(self, previous: float) -> float:
+        """Decorrelated jitter: random between the base delay and three times the previous delay"""
+        return min(self.config.max_delay, self._random.uniform(self.config.base_delay, previous * 3))
+
+    async def call(
+        self,
+        provider: str,
+        func: Callable[[], Awaitable[T]],
+        model: str = "unknown",
+        max_retries: int = 3,
+        can_retry: Callable[[], bool] = lambda: True
+    ) -> T:
+        """
+        Call `func` through the provider's circuit breaker, retrying retryable errors.
+
+        Args:
+            provider: Provider name, one circuit breaker per provider
+            func: Makes a single attempt
+            model: Model name for metrics and logs
+            max_retries: Retries after the first attempt
+            can_retry: Checked before each retry, e.g. False once streamed output was written
+
+        Returns:
+            T: Result of the first successful attempt
+
+        Raises:
+            CircuitOpenError: If the provider's circuit breaker is open
+            LLMError: The last error if it isn't retryable or retries are used up
+        """
+        breaker = self.breaker(provider)
+        delay = self.config.base_delay
+        for attempt in range(max_retries + 1):
+            breaker.before_call()
+            try:
+                result = await func()
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as e:
+                error = classify_error(e)
+                if isinstance(error, RateLimitError):
+                    self.metrics.rate_limits.inc(model=model)
+                    breaker.release()
+                elif error.retryable:
+                    if breaker.record_failure():
+                        self.metrics.circuit_opened.inc(provider=provider)
+                        self.logger.warning(
+                            f"Opened circuit breaker for {provider} after {breaker.failures} consecutive failures"
+                        )
+                else:
+                    breaker.release()
+                gives_up = not error.retryable or attempt == max_retries or not can_retry()
+                if gives_up or (error.retry_after or 0) > self.config.max_delay:
+                    if error is e:
+                        raise
+                    raise error from e
+                delay = self.backoff(delay)
+                wait = delay
+                if error.retry_after is not None:
+                    # Jitter on top of the provider's hint, so runs told the same time don't retry together
+                    wait = error.retry_after + self._random.uniform(0, self.config.base_delay)
+                self.metrics.retries.inc(model=model)
+                self.logger.info(
+                    f"Retrying {model} in {wait:.1f}s (attempt {attempt + 2}/{max_retries + 1}): {str(error)[:200]}"
+                )
+                await asyncio.sleep(wait)
+            else:
+                breaker.record_success()
+                return result
@@ -0,0 +1,111 @@
+"""
+Latency-aware routing of model aliases across the endpoints serving them.
+"""
+import random
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from .metrics import Metrics, get_metrics
+from .providers import get_provider_name
+from .retry import RetryEngine
+from .scheduler import Scheduler
+
+class EndpointStats:
+    """Moving averages of an endpoint's latency and error rate"""
+    __slots__ = ("latency", "error_rate", "samples")
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples = 0
+
+class Router:
+    """
+    Picks an endpoint for each request to a model alias.
+
+    Endpoints are chosen at random, weighted by speed: the inverse of their
+    recent latency, inflated by their recent error rate, and scaled by the
+    rate limit budget their provider has left. Faster endpoints thereby
+    take a proportionally larger share of traffic without starving the
+    others of the requests needed to notice when they recover. Endpoints
+    whose circuit breaker is open are skipped.
+    """
+
+    def __init__(
+        self,
+        aliases: Dict[str, List[str]],
+        scheduler: Scheduler,
+        retries: RetryEngine,
+        metrics: Optional[Metrics] = None,
+        alpha: float = 0.2,
+        error_penalty: float = 4.0
+    ):
+        self.aliases = aliases
+        self.scheduler = scheduler
+        self.retries = retries
+        self.metrics = metrics or get_metrics()
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.stats: Dict[str, EndpointStats] = {}
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._random = random.Random()
+
+    def is_alias(self, model: str) -> bool:
+        return model in self.aliases
+
+    def endpoints(self, model: str) -> List[str]:
+        """Endpoint models serving a model or alias"""
+        return list(self.aliases.get(model, [model]))
+
+    def _stats(self, endpoint: str) -> EndpointStats:
+        if endpoint not in self.stats:
+            self.stats[endpoint] = EndpointStats()
+        return self.stats[endpoint]
+
+    def weight(self, endpoint: str, default_latency: float = 1.0) -> float:
+        """Routing weight of an endpoint, higher is better"""
+        stats = self._stats(endpoint)
+        latency = stats.latency if stats.latency is not None else default_latency
+        headroom = self.scheduler.for_provider(get_provider_name(endpoint)).headroom()
+        # Keep a small weight when saturated, so an endpoint's recovery can still be seen
+        return max(headroom, 0.05) / (max(latency, 1e-3) * (1 + self.error_penalty * stats.error_rate))
+
+    def choose(self, model: str, exclude: Iterable[str] = ()) -> str:
+        """
+        Pick the endpoint for the next request to `model`.
+
+        Args:
+            model: Model alias
+            exclude: Endpoints that already failed this request
+
+        Returns:
+            str: Endpoint model to send the request to
+
+        Raises:
+            ValueError: If every endpoint is excluded
+        """
+        excluded = set(exclude)
+        candidates = [endpoint for endpoint in self.endpoints(model) if endpoint not in excluded]
+        if not candidates:
+            raise ValueError(f"No endpoints left for {model}")
+        healthy = [
+            endpoint for endpoint in candidates
+            if self.retries.breaker(get_provider_name(endpoint)).state != "open"
+        ]
+        # With every breaker open, try anyway, the request fails fast and the next endpoint is tried
+        candidates = healthy or candidates
+        known = [self.stats[e].latency for e in candidates if e in self.stats and self.stats[e].latency is not None]
+        # Endpoints without data get the average latency, so they are tried early
+        default_latency = sum(known) / len(known) if known else 1.0
+        weights = [self.weight(endpoint, default_latency) for endpoint in candidates]
+        endpoint = self._random.choices(candidates, weights)[0]
+        self.metrics.routed.inc(model=model, endpoint=endpoint)
+        return endpoint
+
+    def record(self, endpoint: str, seconds: Optional[float] = None, ok: bool = True) -> None:
+        """Update an endpoint's averages with the latency or failure of a request"""
+        stats = self._stats(endpoint)
+        stats.samples += 1
+        stats.error_rate += self.alpha * ((0.0 if ok else 1.0) - stats.error_rate)
+        if ok and seconds is not None:
+            stats.latency = seconds if stats.latency is None else stats.latency + self.alpha * (seconds - stats.latency)
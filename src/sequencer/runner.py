@@ -1,16 +1,35 @@
 """
 Runner module for executing prompt sequences across LLM providers.
 """
+import time
 import asyncio
+import functools
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import List, Dict, Optional, AsyncIterator
+from typing import TYPE_CHECKING, Any, Callable, Iterable, List, Dict, Optional, AsyncIterator, Tuple
 from pydantic import BaseModel, computed_field
 from datetime import datetime, timedelta
 
+from .batch import BatchExecutor
+from .cache import CacheMissError, ResponseCache
+from .clients import ClientRegistry, get_client_registry
+from .coalesce import Coalescer
 from .config import Settings, APIConfig, RunnerConfig, get_settings
-from .providers import get_provider, LLMError
-from .reader import read_sequence, PromptSection
+from .context import ContextWindow
+from .dataset import Row
+from .metrics import Metrics, get_metrics
+from .providers import get_provider, get_provider_name, Completion, LLMError, LLMProvider, RateLimitError
+from .hedging import Hedger
+from .reader import compile_sequence, prompt_hashes, section_context, PromptSection
+from .retry import CircuitOpenError, RetryEngine
+from .sampling import SampleGroup
+from .router import Router
+from .scheduler import Reservation, Scheduler, estimate_tokens
+
+if TYPE_CHECKING:
+    from .checkpoint import CheckpointStore, Turn
+    from .writer import StreamWriter
 
 class RunResult(BaseModel):
     """Result of a single run"""
@@ -19,18 +38,86 @@ class RunResult(BaseModel):
     content: str
     response: str
     error: Optional[str] = None
+    section_index: int = 0
+    run_id: int = 0
+    row_id: Optional[str] = None
     start_time: datetime
+    first_token_time: Optional[datetime] = None
     end_time: datetime
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cache_read_tokens: Optional[int] = None  # prompt tokens read from the provider's prompt cache
+    cache_write_tokens: Optional[int] = None  # prompt tokens written to it
+    endpoint: Optional[str] = None  # endpoint that served a model alias
+    context_tokens: Optional[int] = None  # estimated prompt tokens sent, after compaction
+    compacted_turns: int = 0
+    restored: bool = False  # replayed from a checkpoint, not generated by this invocation
+    recorded: bool = False  # restored and already written to the record sinks when it was generated
 
     @computed_field
     def duration_seconds(self) -> timedelta:
         return self.end_time - self.start_time
+
+    @computed_field
+    def time_to_first_token(self) -> Optional[timedelta]:
+        if self.first_token_time is None:
+            return None
+        return self.first_token_time - self.start_time
     
+class LazyProvider:
+    """
+    Provider built on first use of anything beyond its runner config.
+
+    Requests the response cache answers only need the runner config for
+    their key, so replays never build a provider and need no API keys.
+    """
+
+    def __init__(self, build: Callable[[], LLMProvider], runner_config: RunnerConfig):
+        self.runner_config = runner_config
+        self._build = build
+        self._provider: Optional[LLMProvider] = None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._provider is None:
+            self._provider = self._build()
+        return getattr(self._provider, name)
+
 class SequenceRunner:
     """Handles running prompt sequences through LLM providers"""
     
-    def __init__(self, settings: Optional[Settings] = None):
+    def __init__(
+        self,
+        settings: Optional[Settings] = None,
+        scheduler: Optional[Scheduler] = None,
+        stream_writer: Optional["StreamWriter"] = None,
+        cache: Optional[ResponseCache] = None,
+        clients: Optional[ClientRegistry] = None,
+        checkpoints: Optional["CheckpointStore"] = None,
+        metrics: Optional[Metrics] = None,
+        retries: Optional[RetryEngine] = None,
+        hedger: Optional[Hedger] = None,
+        router: Optional[Router] = None,
+        coalescer: Optional[Coalescer] = None,
+        batcher: Optional[BatchExecutor] = None
+    ):
         self.settings = settings or get_settings()
+        self.scheduler = scheduler or Scheduler(self.settings.provider_limits)
+        self.stream_writer = stream_writer
+        self.cache = cache
+        self.clients = clients or get_client_registry(self.settings.http_pool)
+        self.checkpoints = checkpoints
+        self.metrics = metrics or get_metrics()
+        self.retries = retries or RetryEngine(self.settings.retry, self.metrics)
+        if hedger is None and self.settings.hedge.enabled:
+            hedger = Hedger(self.settings.hedge, self.metrics)
+        self.hedger = hedger
+        if coalescer is None and self.settings.coalesce.mode != "off":
+            coalescer = Coalescer(self.settings.coalesce, self.metrics)
+        self.coalescer = coalescer
+        if batcher is None and self.settings.batch.enabled:
+            batcher = BatchExecutor(self.settings.batch, self.metrics)
+        self.batcher = batcher
+        self.router = router or Router(self.settings.model_aliases, self.scheduler, self.retries, self.metrics)
         self.logger = logging.getLogger(self.__class__.__name__)
 
     def _prepare_messages(self, sections: List[PromptSection]) -> List[Dict[str, str]]:
@@ -39,68 +126,494 @@ class SequenceRunner:
             raise ValueError("No sections provided")
         return [{"role": "system", "content": sections[0].content}]
 
-    def _replace_placeholders(self, text: str, **kwargs) -> str:
+    def _runner_config(self, model: str) -> RunnerConfig:
+        return RunnerConfig(model=model, prompt_caching=self.settings.prompt_caching)
+
+    @asynccontextmanager
+    async def _slot(self, provider_name: str, tokens: int) -> AsyncIterator[Reservation]:
+        """Scheduler slot, recording queue wait and requests queued and in flight"""
+        queued_at = time.perf_counter()
+        self.metrics.queued.inc(provider=provider_name)
+        acquired = False
+        try:
+            async with self.scheduler.slot(provider_name, tokens) as reservation:
+                acquired = True
+                self.metrics.queued.dec(provider=provider_name)
+                self.metrics.queue_wait.observe(time.perf_counter() - queued_at, provider=provider_name)
+                self.metrics.in_flight.inc(provider=provider_name)
+                try:
+                    yield reservation
+                finally:
+                    self.metrics.in_flight.dec(provider=provider_name)
+        finally:
+            if not acquired:
+                self.metrics.queued.dec(provider=provider_name)
+
+    def _record(self, result: RunResult, cached: bool = False, shared: bool = False) -> None:
+        """Record the outcome, latency and token usage of a finished section"""
+        model = result.model
+        if result.error:
+            self.metrics.requests.inc(model=model, outcome="error")
+            return
+        self.metrics.requests.inc(model=model, outcome="cached" if cached else "shared" if shared else "ok")
+        if cached:
+            return
+        self.metrics.request_duration.observe(
+            result.duration_seconds.total_seconds(), model=model, section=result.title
+        )
+        if result.time_to_first_token is not None:
+            self.metrics.time_to_first_token.observe(result.time_to_first_token.total_seconds(), model=model)
+        if result.input_tokens is not None:
+            self.metrics.tokens.inc(result.input_tokens, model=model, direction="input")
+        if result.output_tokens is not None:
+            self.metrics.tokens.inc(result.output_tokens, model=model, direction="output")
+        if result.cache_read_tokens:
+            self.metrics.tokens.inc(result.cache_read_tokens, model=model, direction="cache_read")
+        if result.cache_write_tokens:
+            self.metrics.tokens.inc(result.cache_write_tokens, model=model, direction="cache_write")
+
+    def _sample_group(self, runs: int) -> Optional[SampleGroup]:
+        """Group sharing the common requests of a model's runs, if n-sampling is on"""
+        return SampleGroup(runs) if self.settings.n_sampling and runs > 1 else None
+
+    async def _generate(
+        self,
+        provider: LLMProvider,
+        provider_name: str,
+        messages: List[Dict[str, str]],
+        on_chunk: Optional[Callable[[str], None]] = None,
+        max_retries: Optional[int] = None,
+        prompt_tokens: Optional[int] = None,
+        sampled: bool = False,
+        run_id: int = 0
+    ) -> Completion:
+        """
+        Generate a completion, served from the response cache, through a batch, or within the provider's scheduling limits.
+
+        `sampled` requests belong to run `run_id` of several runs of the same
+        prompt, they are only coalesced if their sampling is deterministic and
+        each run has its own cached responses.
+        """
+        if self.cache:
+            key = self.cache.key(provider.runner_config, messages, sample=run_id if sampled else None)
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                start_time = datetime.now()
+                if on_chunk:
+                    on_chunk(cached)
+                return Completion(text=cached, start_time=start_time, first_token_time=datetime.now(), cached=True)
+            if self.cache.mode == "replay":
+                raise CacheMissError(f"No cached response for {provider.runner_config.model} (key {key[:12]})")
+        
+        # Reserve the prompt plus the full completion budget, settled with the actual size
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(messages)
+        tokens = prompt_tokens + provider.runner_config.max_tokens
+        streamed = False
+        
+        def forward(text: str) -> None:
+            nonlocal streamed
+            streamed = True
+            on_chunk(text)
+        
+        async def attempt(sent: Optional[asyncio.Event] = None) -> Completion:
+            # Every attempt waits for its own slot, so backoff never holds one
+            async with self._slot(provider_name, tokens) as reservation:
+                if sent:
+                    sent.set()
+                start_time = datetime.now()
+                try:
+                    completion = await provider.complete(messages, on_chunk=forward if on_chunk else None)
+                except RateLimitError:
+                    reservation.used = 0  # rejected before any tokens were processed
+                    raise
+                if completion.input_tokens is not None and completion.output_tokens is not None:
+                    reservation.used = completion.input_tokens + completion.output_tokens
+                else:
+                    reservation.used = prompt_tokens + len(completion.text or "") // 4
+            completion.start_time = completion.start_time or start_time
+            return completion
+        
+        model = provider.runner_config.model
+        if self.hedger and not on_chunk:
+            # Streamed requests aren't hedged, both would write to the same stream
+            hedged = functools.partial(self.hedger.run, model, attempt)
+        else:
+            hedged = attempt
+        batched = self.batcher is not None and provider.supports_batch
+        if batched:
+            # Batches are neither rate limited nor retried here, and come back whole
+            send = functools.partial(self.batcher.complete, provider, provider_name, messages)
+        else:
+            send = functools.partial(
+                self.retries.call,
+                provider_name,
+                hedged,
+                model=model,
+                max_retries=provider.api_config.max_retries if max_retries is None else max_retries,
+                can_retry=lambda: not streamed  # a retry would repeat text already written to the stream
+            )
+        if self.coalescer and (batched or not on_chunk) and self.coalescer.allows(provider.runner_config, sampled):
+            # Streamed requests aren't coalesced either, the stream belongs to one caller, batches don't stream
+            endpoint = f"{provider_name}:{provider.api_config.base_url or ''}"
+            flight = self.coalescer.key(endpoint, provider.runner_config, messages)
+            completion, shared = await self.coalescer.run(flight, model, send)
+            if shared:
+                if on_chunk:
+                    on_chunk(completion.text)
+                return completion
+        else:
+            completion = await send()
+        if batched and on_chunk:
+            on_chunk(completion.text)
+        if self.cache and self.cache.writable and completion.text is not None:
+            await asyncio.to_thread(self.cache.put, key, completion.text)
+        return completion
+
+    async def _generate_n(
+        self,
+        provider: LLMProvider,
+        provider_name: str,
+        messages: List[Dict[str, str]],
+        n: int,
+        prompt_tokens: Optional[int] = None
+    ) -> List[Completion]:
+        """Generate `n` completions of the same messages with one request, within the provider's scheduling limits"""
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(messages)
+        tokens = prompt_tokens + n * provider.runner_config.max_tokens
+        
+        async def attempt() -> List[Completion]:
+            async with self._slot(provider_name, tokens) as reservation:
+                start_time = datetime.now()
+                try:
+                    completions = await provider.complete_n(messages, n)
+                except RateLimitError:
+                    reservation.used = 0  # rejected before any tokens were processed
+                    raise
+                output_tokens = [completion.output_tokens for completion in completions]
+                if completions and completions[0].input_tokens is not None and None not in output_tokens:
+                    reservation.used = completions[0].input_tokens + sum(output_tokens)
+                else:
+                    reservation.used = prompt_tokens + sum(len(completion.text) for completion in completions) // 4
+            for completion in completions:
+                completion.start_time = start_time
+            return completions
+        
+        return await self.retries.call(
+            provider_name,
+            attempt,
+            model=provider.runner_config.model,
+            max_retries=provider.api_config.max_retries
+        )
+
+    async def _route(
+        self,
+        alias: str,
+        providers: Dict[str, LLMProvider],
+        messages: List[Dict[str, str]],
+        on_chunk: Optional[Callable[[str], None]] = None,
+        prompt_tokens: Optional[int] = None,
+        sampled: bool = False,
+        run_id: int = 0
+    ) -> Tuple[Completion, str]:
+        """
+        Generate a completion for a model alias on the endpoint the router picks.
+
+        While other endpoints remain, a failing endpoint isn't retried: the
+        request fails over to the next pick instead. The last endpoint
+        gets the usual retries.
+
+        Args:
+            alias: Model alias
+            providers: Providers of the alias's endpoints, filled in on first use
+            messages: Conversation so far
+            on_chunk: Streaming callback
+            prompt_tokens: Estimated tokens of `messages`
+            sampled: Whether the request belongs to one of several runs of the same prompt
+            run_id: Which of those runs
+
+        Returns:
+            Tuple[Completion, str]: Completion and the endpoint that served it
+
+        Raises:
+            LLMError: If the last endpoint tried fails
         """
-        Replace placeholders in `text` with the corresponding values in kwargs.
-        Placeholders look like {key}.
-        If a given placeholder isn't provided in kwargs, it won't be replaced.
+        tried: List[str] = []
+        remaining = len(self.router.endpoints(alias))
+        streamed = False
+
+        def forward(text: str) -> None:
+            nonlocal streamed
+            streamed = True
+            on_chunk(text)
+
+        while True:
+            endpoint = self.router.choose(alias, exclude=tried)
+            tried.append(endpoint)
+            if endpoint not in providers:
+                runner_config = self._runner_config(endpoint)
+                providers[endpoint] = LazyProvider(
+                    functools.partial(get_provider, self.settings, runner_config, self.clients), runner_config
+                )
+            provider = providers[endpoint]
+            last = len(tried) == remaining
+            try:
+                completion = await self._generate(
+                    provider,
+                    get_provider_name(endpoint),
+                    messages,
+                    on_chunk=forward if on_chunk else None,
+                    max_retries=None if last else 0,
+                    prompt_tokens=prompt_tokens,
+                    sampled=sampled,
+                    run_id=run_id
+                )
+            except LLMError as e:
+                self.router.record(endpoint, ok=False)
+                # Switching endpoints after streaming would splice two responses together
+                if last or streamed or not (e.retryable or isinstance(e, CircuitOpenError)):
+                    raise
+                self.metrics.failovers.inc(model=alias, endpoint=endpoint)
+                self.logger.warning(f"{endpoint} failed for {alias}, failing over: {str(e)[:200]}")
+                continue
+            if not completion.cached:
+                self.router.record(endpoint, (datetime.now() - completion.start_time).total_seconds())
+            return completion, endpoint
+
+    def _restore(
+        self,
+        sections: List[PromptSection],
+        context: List[List[int]],
+        hashes: List[str],
+        history: List["Turn"],
+        window: ContextWindow,
+        results: List[RunResult]
+    ) -> List["Turn"]:
+        """Replay recorded turns that still match their sections and whose context was kept, returns the turns kept"""
+        kept = []
+        for turn in history:
+            index = turn.result.section_index
+            if turn.result.error or not 0 < index < len(sections) or index in window:
+                continue
+            section = sections[index]
+            if (turn.result.title, turn.result.content) != (section.title, section.content):
+                continue
+            # Also catches edits to the system prompt, older checkpoints have no hash
+            if turn.prompt_hash is not None and turn.prompt_hash != hashes[index]:
+                continue
+            if any(dependency not in window for dependency in context[index]):
+                continue
+            window.add(index, turn.messages)
+            results.append(turn.result.model_copy(update={"restored": True, "recorded": turn.recorded}))
+            kept.append(turn)
+        return kept
+
+    async def _save_turn(self, result: RunResult, messages: List[Dict[str, str]], prompt_hash: str) -> None:
+        """Append a finished turn to the run's checkpoint"""
+        if self.checkpoints:
+            await asyncio.to_thread(
+                self.checkpoints.save, result.model, result.run_id, result, messages, result.row_id, prompt_hash
+            )
+
+    async def _run_model(
+        self,
+        model: str,
+        sections: List[PromptSection],
+        run_id: int = 0,
+        history: Optional[List["Turn"]] = None,
+        row_id: Optional[str] = None,
+        samples: Optional[SampleGroup] = None,
+        sampled: bool = False
+    ) -> List[RunResult]:
         """
-        for key, value in kwargs.items():
-            if value is not None:
-                text = text.replace(f"{{{key}}}", str(value))
-        return text
+        Run sequence through a single model, continuing after the recorded turns in `history`.
 
-    async def _run_model(self, model: str, sections: List[PromptSection]) -> List[RunResult]:
-        """Run sequence through a single model"""
+        Each section starts once the sections it depends on are done and sees
+        only their turns, so independent sections run concurrently. Sections
+        that see no earlier turns take their completion from `samples` if given.
+        `sampled` runs are one of several runs of the same prompt.
+        """
         if not sections:
             raise ValueError("No sections provided")
             
-        messages = self._prepare_messages(sections)
+        system = self._prepare_messages(sections)
+        context = section_context(sections)
+        hashes = prompt_hashes(sections, context)
+        policy = self.settings.context.policy
+        visible = section_context(sections, transitive=False) if policy == "declared" else context
         results = []
+        file = self.stream_writer.open(model, run_id, row_id) if self.stream_writer else None
+        stream = file.sections() if file else None
+        tasks: Dict[int, asyncio.Task] = {}
         
         try:
-            runner_config = RunnerConfig(model=model)
-            provider = get_provider(self.settings, runner_config)
-            self.logger.info(provider)
+            routed = self.router.is_alias(model)
+            if routed:
+                providers: Dict[str, LLMProvider] = {}
+                self.logger.info(f"Routing {model} across {', '.join(self.router.endpoints(model))}")
+            else:
+                runner_config = self._runner_config(model)
+                provider = LazyProvider(functools.partial(get_provider, self.settings, runner_config, self.clients), runner_config)
+                provider_name = get_provider_name(model)
+                self.logger.info(f"Running {model} on {provider_name}")
+            endpoints = self.router.endpoints(model) if routed else [model]
+            budget = min(
+                self._runner_config(endpoint).input_budget(self.settings.context.max_input_tokens)
+                for endpoint in endpoints
+            )
+            
+            async def summarize(messages: List[Dict[str, str]]) -> str:
+                if routed:
+                    completion, _ = await self._route(model, providers, messages)
+                else:
+                    completion = await self._generate(provider, provider_name, messages)
+                return completion.text
+            
+            window = ContextWindow(system, self.settings.context, budget, summarize)
+            # Cached, routed and batched requests go through their usual paths
+            share = samples is not None and not routed and not self.cache and not self.batcher and provider.supports_n
+            
+            if history is None and self.checkpoints:
+                history = await asyncio.to_thread(self.checkpoints.load, model, run_id, row_id)
+            if history:
+                kept = self._restore(sections, context, hashes, history, window, results)
+                if self.checkpoints:
+                    await asyncio.to_thread(self.checkpoints.reset, model, run_id, kept, row_id)
+                self.logger.info(f"Resuming {model} run {run_id} after {len(kept)} completed sections")
+                if file:
+                    for result in sorted(results, key=lambda result: result.section_index):
+                        file.start_section(result.title, result.content)
+                        file.write(result.response)
+                        file.end_section()
             
-            for section in sections[1:]:
+            async def run_section(index: int, section: PromptSection) -> None:
+                await asyncio.gather(*(tasks[dependency] for dependency in context[index] if dependency in tasks))
                 try:
                     self.logger.info(f"Processing: {section.title}")
-                    messages.append({"role": "user", "content": section.content})
+                    prompt = {"role": "user", "content": section.content}
+                    window.add(index, [prompt])
+                    start_time, prompt_tokens, compacted = datetime.now(), None, 0
+                    if stream:
+                        stream.start_section(index, section.title, section.content)
+                    messages, prompt_tokens, compacted = await window.build(visible[index], prompt)
+                    if compacted:
+                        self.metrics.compacted_turns.inc(compacted, model=model, policy=policy)
+                        self.logger.info(f"Compacted {compacted} earlier turns of {section.title} to ~{prompt_tokens} tokens")
+                    self.metrics.context_tokens.observe(prompt_tokens, model=model)
                     
-                    start_time = datetime.now()
-                    response = await provider.generate(messages)
+                    endpoint = None
+                    completion, shared = None, False
+                    if share and not visible[index]:
+                        # The same messages in every run, one request answers all of them
+                        completion, shared = await samples.take(
+                            index, functools.partial(self._generate_n, provider, provider_name, messages, prompt_tokens=prompt_tokens)
+                        )
+                        if completion is not None and stream:
+                            stream.writer(index)(completion.text)
+                    if completion is None and routed:
+                        completion, endpoint = await self._route(
+                            model,
+                            providers,
+                            messages,
+                            on_chunk=stream.writer(index) if stream else None,
+                            prompt_tokens=prompt_tokens,
+                            sampled=sampled,
+                            run_id=run_id
+                        )
+                    elif completion is None:
+                        completion = await self._generate(
+                            provider,
+                            provider_name,
+                            messages,
+                            on_chunk=stream.writer(index) if stream else None,
+                            prompt_tokens=prompt_tokens,
+                            sampled=sampled,
+                            run_id=run_id
+                        )
                     end_time = datetime.now()
                     
-                    messages.append({"role": "assistant", "content": response})
+                    window.append(index, {"role": "assistant", "content": completion.text})
+                    if stream:
+                        stream.end_section(index)
                     
-                    results.append(RunResult(
+                    result = RunResult(
                         model=model,
                         title=section.title,
                         content=section.content,
-                        response=response,
-                        start_time=start_time,
-                        end_time=end_time
-                    ))
+                        response=completion.text,
+                        section_index=index,
+                        run_id=run_id,
+                        row_id=row_id,
+                        start_time=completion.start_time,
+                        first_token_time=completion.first_token_time,
+                        end_time=end_time,
+                        input_tokens=completion.input_tokens,
+                        output_tokens=completion.output_tokens,
+                        cache_read_tokens=completion.cache_read_tokens,
+                        cache_write_tokens=completion.cache_write_tokens,
+                        endpoint=endpoint,
+                        context_tokens=prompt_tokens,
+                        compacted_turns=compacted
+                    )
+                    results.append(result)
+                    self._record(result, cached=completion.cached, shared=shared)
+                    await self._save_turn(result, window.turns[index], hashes[index])
                     
                 except LLMError as e:
                     self.logger.error(f"Error processing section {section.title}: {str(e)}")
-                    results.append(RunResult(
+                    if stream:
+                        stream.end_section(index, error=str(e))
+                    result = RunResult(
                         model=model,
                         title=section.title,
                         content=section.content,
                         response="",
                         error=str(e),
+                        section_index=index,
+                        run_id=run_id,
+                        row_id=row_id,
                         start_time=start_time,
-                        end_time=datetime.now()
-                    ))
+                        end_time=datetime.now(),
+                        context_tokens=prompt_tokens,
+                        compacted_turns=compacted
+                    )
+                    results.append(result)
+                    self._record(result)
+                    await self._save_turn(result, window.turns[index], hashes[index])
+            
+            for index, section in enumerate(sections[1:], 1):
+                if index not in window:
+                    tasks[index] = asyncio.create_task(
+                        run_section(index, section), name=f"{model}_run_{run_id}_section_{index}"
+                    )
+            await asyncio.gather(*tasks.values())
             
+            results.sort(key=lambda result: result.section_index)
             return results
             
         except Exception as e:
             self.logger.error(f"Error running model {model}: {str(e)}")
             raise
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            if file:
+                file.close()
     
+    async def run_job(
+        self,
+        sequence_file: Path,
+        model: str,
+        run_id: int = 0,
+        values: Optional[Dict[str, Any]] = None,
+        row_id: Optional[str] = None
+    ) -> List[RunResult]:
+        """Run a single unit of a batch: one run of the sequence through one model, filled in with one row's values"""
+        sections = compile_sequence(sequence_file).render(values or {})
+        # A job doesn't know how many runs its batch has, it may be one of several
+        return await self._run_model(model, sections, run_id=run_id, row_id=row_id, sampled=True)
+
     async def run_sequence(
         self,
         sequence_file: Path,
@@ -109,19 +622,12 @@ class SequenceRunner:
         **kwargs
     ) -> AsyncIterator[List[RunResult]]:
         """Run sequence and yield results as they complete"""
-        runner = SequenceRunner()
-        sections = read_sequence(sequence_file)
-
-        # Replace placeholders in each section
-        updated_sections = []
-        for section in sections:
-            replaced_content = self._replace_placeholders(section.content, **kwargs)
-            section.content = replaced_content
-            updated_sections.append(section)
+        sections = compile_sequence(sequence_file).render(kwargs)
+        groups = {model: self._sample_group(num_runs) for model in models}
         
         tasks = {
             asyncio.create_task(
-                runner._run_model(model, sections),
+                self._run_model(model, sections, run_id=i, samples=groups[model], sampled=num_runs > 1),
                 name=f"{model}_run_{i}"
             )
             for model in models
@@ -129,22 +635,96 @@ class SequenceRunner:
         }
         
         # Process tasks as they complete
-        while tasks:
-            done, _ = await asyncio.wait(
-                tasks, 
-                return_when=asyncio.FIRST_COMPLETED
-            )
-            
-            for task in done:
-                tasks.remove(task)
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(
+                    tasks, 
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                
+                for task in done:
+                    tasks.remove(task)
+                    try:
+                        results = await task
+                        if results:  # Only yield if we have results
+                            yield results
+                    except Exception as e:
+                        self.logger.error(f"Task {task.get_name()} failed: {str(e)}")
+                        # Continue with remaining tasks instead of raising
+                        continue
+        finally:
+            # Runs of a caller that was cancelled or stopped early
+            for task in tasks:
+                task.cancel()
+
+    async def run_dataset(
+        self,
+        sequence_file: Path,
+        models: List[str],
+        num_runs: int,
+        rows: Iterable[Row],
+        max_workers: int = 8
+    ) -> AsyncIterator[List[RunResult]]:
+        """
+        Run sequence once per dataset row and yield results as they complete.
+
+        Rows are pulled lazily and run by `max_workers` workers. Bounded queues
+        on both sides give backpressure, so memory stays constant however
+        large the dataset is.
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        compiled = compile_sequence(sequence_file)
+        jobs: asyncio.Queue = asyncio.Queue(maxsize=max_workers)
+        finished: asyncio.Queue = asyncio.Queue(maxsize=max_workers)
+
+        async def produce() -> None:
+            reported = set()
+            try:
+                for row_id, values in rows:
+                    missing, unused = compiled.check(values)
+                    if (missing or unused) and (frozenset(missing), frozenset(unused)) not in reported:
+                        reported.add((frozenset(missing), frozenset(unused)))
+                        self.logger.warning(
+                            f"Row {row_id}: placeholders without values {sorted(missing)}, "
+                            f"values without placeholders {sorted(unused)}"
+                        )
+                    row_sections = compiled.render(values)
+                    for model in models:
+                        samples = self._sample_group(num_runs)
+                        for i in range(num_runs):
+                            await jobs.put((model, i, row_id, row_sections, samples))
+            finally:
+                for _ in range(max_workers):
+                    await jobs.put(None)
+
+        async def work() -> None:
+            while (job := await jobs.get()) is not None:
+                model, run_id, row_id, row_sections, samples = job
                 try:
-                    results = await task
-                    if results:  # Only yield if we have results
-                        yield results
+                    results = await self._run_model(
+                        model, row_sections, run_id=run_id, row_id=row_id, samples=samples, sampled=num_runs > 1
+                    )
                 except Exception as e:
-                    self.logger.error(f"Task {task.get_name()} failed: {str(e)}")
-                    # Continue with remaining tasks instead of raising
-                    continue
+                    self.logger.error(f"Task {model}_run_{run_id} for row {row_id} failed: {str(e)}")
+                    results = []
+                await finished.put(results)
+            await finished.put(None)
+
+        producer = asyncio.create_task(produce(), name="dataset_producer")
+        workers = [asyncio.create_task(work(), name=f"dataset_worker_{i}") for i in range(max_workers)]
+        try:
+            remaining = max_workers
+            while remaining:
+                results = await finished.get()
+                if results is None:
+                    remaining -= 1
+                elif results:
+                    yield results
+            await producer  # surface dataset errors
+        finally:
+            for task in [producer, *workers]:
+                task.cancel()
 
 async def run(
     sequence_file: str | Path,
@@ -0,0 +1,69 @@
+"""
+Sharing one n-choice request between runs that send the same messages.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .providers import Completion, LLMError
+
+class SampleGroup:
+    """
+    Choices of the requests that the runs of one model have in common.
+
+    Sections that see no earlier turns send the same messages in every run
+    of a model (and dataset row). The first run to reach such a section asks
+    for one choice per run in a single request; the other runs take the
+    remaining choices, forking the conversation from there. Runs left over
+    when the provider returned fewer choices, e.g. because it ignores `n`,
+    make their own request, as do all runs if the provider rejected the
+    request with an error that isn't worth retrying, e.g. because it
+    doesn't accept `n`.
+    """
+
+    def __init__(self, runs: int):
+        self.runs = runs
+        self._requests: Dict[int, asyncio.Future] = {}
+        self._taken: Dict[int, int] = {}
+        self._rejected: Set[int] = set()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def take(
+        self,
+        key: int,
+        fetch: Callable[[int], Awaitable[List[Completion]]]
+    ) -> Tuple[Optional[Completion], bool]:
+        """
+        Take the next choice of the request for `key`, sending it on first use.
+
+        Args:
+            key: Index of the section the request is for
+            fetch: Sends the request, asking for the given number of choices
+
+        Returns:
+            Tuple[Optional[Completion], bool]: The choice, None once all are
+            taken or if the provider rejected the request, and whether it
+            came from a request another run sent
+
+        Raises:
+            LLMError: If the shared request failed with an error worth retrying
+        """
+        if key not in self._requests:
+            self._requests[key] = asyncio.ensure_future(fetch(self.runs))
+        try:
+            # A cancelled run mustn't cancel the request the others are waiting for
+            completions = await asyncio.shield(self._requests[key])
+        except LLMError as e:
+            if e.retryable:
+                raise
+            if key not in self._rejected:
+                self._rejected.add(key)
+                self.logger.warning(f"Request for {self.runs} choices rejected, each run sends its own: {str(e)[:200]}")
+            return None, False
+        if len(completions) < self.runs and self._taken.get(key, 0) == 0:
+            self.logger.info(f"Got {len(completions)} of {self.runs} choices, the other runs send their own requests")
+        taken = self._taken.get(key, 0)
+        self._taken[key] = taken + 1
+        if taken >= len(completions):
+            return None, False
+        return completions[taken], taken > 0
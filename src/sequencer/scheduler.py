@@ -0,0 +1,145 @@
+"""
+Request scheduler enforcing per-provider concurrency and rate limits.
+"""
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from .config import ProviderLimits
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """Rough token estimate for a message list (~4 characters per token)"""
+    return sum(len(message["content"]) for message in messages) // 4 + 1
+
+class TokenBucket:
+    """Token bucket refilled continuously up to `per_minute` tokens per minute"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Wait until `amount` tokens are available and take them, returns the amount taken"""
+        # A request larger than the whole bucket would never fit, let it through at full capacity
+        amount = min(float(amount), self.capacity)
+        async with self._lock:  # waiters are served in FIFO order
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return amount
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def available(self) -> float:
+        """Share of the bucket currently available, between 0 and 1"""
+        self._refill()
+        return max(0.0, self.tokens / self.capacity)
+
+    def refund(self, amount: float) -> None:
+        """Return unused tokens, or charge extra ones when `amount` is negative"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class Reservation:
+    """Tokens reserved for a single request, settled when its slot is released"""
+
+    def __init__(self, reserved: float):
+        self.reserved = reserved
+        self.used: Optional[float] = None
+
+class ProviderScheduler:
+    """Concurrency and rate limits for a single provider"""
+
+    def __init__(self, name: str, limits: ProviderLimits):
+        self.name = name
+        self.limits = limits
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._semaphore = asyncio.Semaphore(limits.max_concurrency) if limits.max_concurrency else None
+        self._requests = TokenBucket(limits.requests_per_minute) if limits.requests_per_minute else None
+        self._tokens = TokenBucket(limits.tokens_per_minute) if limits.tokens_per_minute else None
+        self.pending = 0  # requests waiting for or holding a slot
+
+    def headroom(self) -> float:
+        """Share of the provider's limits still free, between 0 (saturated) and 1 (idle or unlimited)"""
+        shares = [1.0]
+        if self.limits.max_concurrency:
+            shares.append(max(0.0, 1 - self.pending / self.limits.max_concurrency))
+        for bucket in (self._requests, self._tokens):
+            if bucket:
+                shares.append(bucket.available())
+        return min(shares)
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0) -> AsyncIterator[Reservation]:
+        """
+        Hold one in-flight slot for a request expected to use `tokens` tokens.
+
+        Set `reservation.used` inside the block to settle the token budget
+        with the actual usage once the request is done.
+        """
+        start = time.monotonic()
+        self.pending += 1
+        try:
+            if self._semaphore:
+                await self._semaphore.acquire()
+            try:
+                if self._requests:
+                    await self._requests.acquire()
+                reservation = Reservation(await self._tokens.acquire(tokens) if self._tokens else 0.0)
+                waited = time.monotonic() - start
+                if waited > 1.0:
+                    self.logger.debug(f"Throttled {self.name} request for {waited:.1f}s")
+                try:
+                    yield reservation
+                finally:
+                    if self._tokens and reservation.used is not None:
+                        self._tokens.refund(reservation.reserved - reservation.used)
+            finally:
+                if self._semaphore:
+                    self._semaphore.release()
+        finally:
+            self.pending -= 1
+
+class Scheduler:
+    """
+    Work-conserving request scheduler.
+
+    Every provider gets its own limiter, so requests throttled on one provider
+    never hold up requests to the others.
+    """
+
+    def __init__(
+        self,
+        provider_limits: Optional[Dict[str, ProviderLimits]] = None,
+        default_limits: Optional[ProviderLimits] = None
+    ):
+        self.provider_limits = provider_limits or {}
+        self.default_limits = default_limits or ProviderLimits()
+        self._providers: Dict[str, ProviderScheduler] = {}
+
+    def limits_for(self, provider: str) -> ProviderLimits:
+        """Get limits for a provider, falling back to the defaults for unset fields"""
+        limits = self.provider_limits.get(provider)
+        if limits is None:
+            return self.default_limits
+        return self.default_limits.model_copy(update=limits.model_dump(exclude_none=True))
+
+    def for_provider(self, provider: str) -> ProviderScheduler:
+        """Get (or lazily create) the limiter for a provider"""
+        if provider not in self._providers:
+            self._providers[provider] = ProviderScheduler(provider, self.limits_for(provider))
+        return self._providers[provider]
+
+    def slot(self, provider: str, tokens: int = 0):
+        """Hold one in-flight slot on `provider`, see ProviderScheduler.slot"""
+        return self.for_provider(provider).slot(tokens)
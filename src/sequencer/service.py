@@ -0,0 +1,376 @@
+"""
+Long-running service keeping settings, provider clients and compiled sequences warm, with `sequencer serve`.
+"""
+import json
+import time
+import asyncio
+import logging
+import argparse
+import itertools
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+
+from .clients import close_clients, get_client_registry
+from .config import ProviderLimits, get_settings
+from .providers import check_credentials, warm_clients
+from .reader import compile_sequence
+from .runner import RunResult, SequenceRunner
+from .scheduler import Scheduler
+from .sinks import SINKS, SinkPipeline, get_sink
+
+BLUEPRINT_DIR = Path(__file__).parent / "blueprints"
+DEFAULT_PORT = 8765
+
+class RunRequest(BaseModel):
+    """A sequence to run, as submitted to the service"""
+    sequence_file: str
+    models: List[str] = Field(min_length=1)
+    num_runs: int = Field(default=1, ge=1)
+    placeholders: Dict[str, Any] = Field(default_factory=dict)
+
+class ServiceRun:
+    """A submitted run with the results it has produced so far"""
+
+    def __init__(self, run_id: str, request: RunRequest, sequence_file: Path):
+        self.id = run_id
+        self.request = request
+        self.sequence_file = sequence_file
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.results: List[RunResult] = []
+        self.submitted = datetime.now()
+        self.finished: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def add(self, results: List[RunResult]) -> None:
+        self.results.extend(results)
+        self._notify()
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        self.status, self.error, self.finished = status, error, datetime.now()
+        self._notify()
+
+    def _notify(self) -> None:
+        # Wake every follower, later ones wait on a fresh event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, start: int = 0) -> AsyncIterator[RunResult]:
+        """Results from `start` on, as they arrive, until the run has finished"""
+        index = start
+        while True:
+            while index < len(self.results):
+                yield self.results[index]
+                index += 1
+            if self.status != "running":
+                return
+            await self._changed.wait()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "sequence_file": str(self.sequence_file),
+            "models": self.request.models,
+            "num_runs": self.request.num_runs,
+            "results": len(self.results),
+            "failed": sum(1 for result in self.results if result.error),
+            "submitted": self.submitted.isoformat(),
+            "finished": self.finished.isoformat() if self.finished else None,
+        }
+
+class SequenceService:
+    """
+    Runs submitted sequences on one warm runner.
+
+    Settings are read once, provider clients and their connections stay
+    open and compiled sequences are cached until their files change, so a
+    run starts without any of the setup a `sequencer` invocation pays.
+    Runs share the runner's scheduler, so their requests count against the
+    same rate limits. Finished runs are kept for `keep_runs` more
+    submissions, so their results can still be fetched. The service has no
+    authentication, so it only reads sequence files from the blueprints
+    directory and the directories in `roots`.
+    """
+
+    def __init__(
+        self,
+        runner: SequenceRunner,
+        pipeline: Optional[SinkPipeline] = None,
+        keep_runs: int = 100,
+        roots: Iterable[str | Path] = ()
+    ):
+        self.runner = runner
+        self.pipeline = pipeline
+        self.keep_runs = keep_runs
+        self.roots = [BLUEPRINT_DIR.resolve(), *(Path(root).resolve() for root in roots)]
+        self.runs: Dict[str, ServiceRun] = {}
+        self.started = time.monotonic()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._ids = itertools.count(1)
+
+    def _find_sequence(self, filename: str) -> Path:
+        """
+        Sequence file by path, or by name in the blueprints directory, within the allowed roots.
+
+        Raises:
+            PermissionError: If the file would be outside the allowed roots
+            FileNotFoundError: If there is no such file within them
+        """
+        inside = False
+        for candidate in (Path(filename), BLUEPRINT_DIR / filename):
+            # Resolved first, so neither `..` nor symlinks lead out of a root
+            path = candidate.resolve()
+            if any(path.is_relative_to(root) for root in self.roots):
+                inside = True
+                if path.is_file():
+                    return path
+        if not inside:
+            raise PermissionError(
+                f"Sequence file {filename} is outside the directories the service may read "
+                f"(allow its directory with `sequencer serve --allow-path`)"
+            )
+        raise FileNotFoundError(f"Sequence file not found: {filename}")
+
+    def submit(self, request: RunRequest) -> ServiceRun:
+        """
+        Start a run in the background.
+
+        Raises:
+            PermissionError: If the sequence file is outside the allowed roots
+            FileNotFoundError: If the sequence file doesn't exist
+            ValueError: If the sequence file is invalid, a model unsupported
+                or its provider's API key not set
+        """
+        check_credentials(self.runner.settings, request.models)
+        sequence_file = self._find_sequence(request.sequence_file)
+        compile_sequence(sequence_file)  # fail the submission rather than the run
+        run = ServiceRun(f"run-{next(self._ids)}", request, sequence_file)
+        run.task = asyncio.create_task(self._run(run), name=run.id)
+        self.runs[run.id] = run
+        finished = [run_id for run_id, other in self.runs.items() if other.status != "running"]
+        for run_id in finished[:max(0, len(finished) - self.keep_runs)]:
+            del self.runs[run_id]
+        self.logger.info(
+            f"Started {run.id}: {sequence_file.name} with {', '.join(request.models)}, {request.num_runs} run(s)"
+        )
+        return run
+
+    async def _run(self, run: ServiceRun) -> None:
+        request = run.request
+        try:
+            async for results in self.runner.run_sequence(
+                run.sequence_file, request.models, request.num_runs, **request.placeholders
+            ):
+                run.add(results)
+                if self.pipeline:
+                    await self.pipeline.put(results)
+        except asyncio.CancelledError:
+            run.finish("cancelled")
+            raise
+        except Exception as e:
+            self.logger.error(f"{run.id} failed: {str(e)}")
+            run.finish("failed", str(e))
+            return
+        run.finish("done")
+        self.logger.info(f"Finished {run.id}: {len(run.results)} results")
+
+    async def cancel(self, run: ServiceRun) -> None:
+        """Cancel a run and wait until it has stopped"""
+        if run.task and not run.task.done():
+            run.task.cancel()
+            await asyncio.gather(run.task, return_exceptions=True)
+
+    async def close(self) -> None:
+        """Cancel the runs still going"""
+        tasks = [run.task for run in self.runs.values() if run.task and not run.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "running": sum(1 for run in self.runs.values() if run.status == "running"),
+            "uptime_seconds": round(time.monotonic() - self.started, 1),
+        }
+
+class ServiceServer:
+    """
+    Minimal HTTP/1.1 front end of a SequenceService, one request per connection.
+
+    - `POST /runs` with a RunRequest starts a run, answering 202 with its id
+    - `GET /runs` and `GET /runs/{id}` show the status of runs
+    - `GET /runs/{id}/events` streams the run's results as server-sent
+      `result` events, from the first one (or `?from=N`), and an `end`
+      event with the final status
+    - `DELETE /runs/{id}` cancels a run
+    - `GET /health`
+    """
+
+    def __init__(self, service: SequenceService, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "ServiceServer":
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, bytes]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        return method, target, body
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await self._read_request(reader)
+            if request is not None:
+                await self.handle(*request, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            self.logger.error(f"Error handling request: {str(e)}")
+        finally:
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload: Any) -> None:
+        data = json.dumps(payload).encode()
+        reason = {200: "OK", 202: "Accepted", 400: "Bad Request", 403: "Forbidden", 404: "Not Found"}.get(status, "Error")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"content-type: application/json\r\n"
+            f"content-length: {len(data)}\r\n"
+            f"connection: close\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+
+    async def handle(self, method: str, target: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        """Answer a single request"""
+        path, _, query = target.partition("?")
+        parts = path.strip("/").split("/")
+        run = self.service.runs.get(parts[1]) if len(parts) > 1 and parts[0] == "runs" else None
+        if (method, parts) == ("GET", ["health"]):
+            return await self._respond(writer, 200, self.service.health())
+        if (method, parts) == ("POST", ["runs"]):
+            try:
+                run = self.service.submit(RunRequest.model_validate_json(body or b"{}"))
+            except PermissionError as e:
+                return await self._respond(writer, 403, {"error": str(e)})
+            except (ValidationError, FileNotFoundError, ValueError) as e:
+                return await self._respond(writer, 400, {"error": str(e)})
+            return await self._respond(writer, 202, run.summary())
+        if (method, parts) == ("GET", ["runs"]):
+            return await self._respond(writer, 200, [run.summary() for run in self.service.runs.values()])
+        if run is not None and method == "GET" and len(parts) == 2:
+            return await self._respond(writer, 200, run.summary())
+        if run is not None and method == "DELETE" and len(parts) == 2:
+            await self.service.cancel(run)
+            return await self._respond(writer, 200, run.summary())
+        if run is not None and method == "GET" and parts[2:] == ["events"]:
+            start = next((int(value) for key, _, value in (item.partition("=") for item in query.split("&"))
+                          if key == "from" and value.isdigit()), 0)
+            return await self._stream(writer, run, start)
+        await self._respond(writer, 404, {"error": f"Not found: {method} {path}"})
+
+    async def _stream(self, writer: asyncio.StreamWriter, run: ServiceRun, start: int) -> None:
+        """Send the run's results as server-sent events until it has finished"""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"content-type: text/event-stream\r\n"
+            b"cache-control: no-cache\r\n"
+            b"connection: close\r\n\r\n"
+        )
+        index = start
+        async for result in run.follow(start):
+            writer.write(f"event: result\nid: {index}\ndata: {result.model_dump_json()}\n\n".encode())
+            await writer.drain()
+            index += 1
+        writer.write(f"event: end\ndata: {json.dumps(run.summary())}\n\n".encode())
+        await writer.drain()
+
+async def run_service(args: argparse.Namespace) -> None:
+    """Run the service until interrupted"""
+    settings = get_settings()
+    scheduler = Scheduler(
+        settings.provider_limits,
+        default_limits=ProviderLimits(max_concurrency=args.max_concurrency, requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    )
+    runner = SequenceRunner(settings, scheduler=scheduler, clients=get_client_registry(settings.http_pool))
+    # Import the SDKs and open the clients now rather than on the event loop during the first request
+    warmed = await asyncio.to_thread(warm_clients, settings, runner.clients)
+    logging.getLogger(__name__).info(f"Created clients for {', '.join(warmed) or 'no providers (no API keys set)'}")
+    pipeline = SinkPipeline([get_sink(name, args.output_dir) for name in args.sink]).start() if args.sink else None
+    service = SequenceService(runner, pipeline, keep_runs=args.keep_runs, roots=args.allow_path)
+    server = await ServiceServer(service, args.host, args.port).start()
+    logging.getLogger(__name__).info(
+        f"Serving on {server.url}, reading sequences from {', '.join(str(root) for root in service.roots)}"
+    )
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        await service.close()
+        if runner.batcher:
+            await runner.batcher.close()
+        if pipeline:
+            await pipeline.close()
+        await close_clients()
+
+def parse_serve_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse `sequencer serve` arguments"""
+    parser = argparse.ArgumentParser(
+        prog="sequencer serve",
+        description="Serve sequence runs over HTTP with warm settings and clients, for `sequencer remote`"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("-o", "--output-dir", default="results", help="Output directory for --sink")
+    parser.add_argument(
+        "--sink", nargs="+", choices=list(SINKS), default=[],
+        help="Also write results to markdown files, results.jsonl and/or results.sqlite (default: none)"
+    )
+    parser.add_argument(
+        "--allow-path", action="append", default=[], metavar="DIR",
+        help="Directory the service may read sequence files from, besides the blueprints, repeatable"
+    )
+    parser.add_argument("--keep-runs", type=int, default=100, help="Finished runs kept for fetching their results")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="Max in-flight requests per provider")
+    parser.add_argument("--rpm", type=int, default=None, help="Max requests per minute per provider")
+    parser.add_argument("--tpm", type=int, default=None, help="Max tokens per minute per provider")
+    return parser.parse_args(argv)
+
+def serve(argv: Optional[List[str]] = None) -> None:
+    """Serve until interrupted"""
+    args = parse_serve_args(argv)
+    try:
+        asyncio.run(run_service(args))
+    except KeyboardInterrupt:
+        pass
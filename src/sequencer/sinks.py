@@ -0,0 +1,239 @@
+"""
+Result sinks and the background pipeline that writes results off the event loop.
+"""
+import os
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+from .runner import RunResult
+from .store import ResultStore
+from .writer import ResultWriter
+
+class ResultSink(ABC):
+    """
+    Destination for run results, only ever called from the pipeline's writer thread.
+
+    Results restored from a checkpoint that the invocation generating them
+    already wrote (`recorded`) are skipped by record sinks, so they aren't
+    stored twice.
+    """
+
+    @abstractmethod
+    def write(self, results: List[RunResult]) -> None:
+        """Write a batch of results"""
+        pass
+
+    def flush(self) -> None:
+        """Make written results durable"""
+        pass
+
+    def close(self) -> None:
+        """Flush and release resources"""
+        self.flush()
+
+class MarkdownSink(ResultSink):
+    """One markdown file per run, as written by ResultWriter"""
+
+    def __init__(self, output_dir: str | Path = "results"):
+        self.writer = ResultWriter(output_dir)
+
+    def write(self, results: List[RunResult]) -> None:
+        self.writer.write_results(results)
+
+class JsonlSink(ResultSink):
+    """Append-only JSONL file with one result per line"""
+
+    def __init__(self, output_dir: str | Path = "results", filename: str = "results.jsonl"):
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        self._file = open(Path(output_dir) / filename, 'a', encoding='utf-8')
+
+    def write(self, results: List[RunResult]) -> None:
+        self._file.writelines(result.model_dump_json() + "\n" for result in results if not result.recorded)
+
+    def flush(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
+class SqliteSink(ResultSink):
+    """Indexed SQLite result store, one batch per sequencer invocation"""
+
+    def __init__(self, output_dir: str | Path = "results", filename: str = "results.sqlite"):
+        # The pipeline writes from a single thread, but not the one that created the sink
+        self.store = ResultStore(Path(output_dir) / filename)
+
+    def write(self, results: List[RunResult]) -> None:
+        self.store.add([result for result in results if not result.recorded])
+
+    def flush(self) -> None:
+        self.store.commit()
+
+    def close(self) -> None:
+        self.store.close()
+
+SINKS: Dict[str, Type[ResultSink]] = {
+    "markdown": MarkdownSink,
+    "jsonl": JsonlSink,
+    "sqlite": SqliteSink,
+}
+
+def get_sink(name: str, output_dir: str | Path = "results") -> ResultSink:
+    """
+    Get sink instance by name.
+
+    Args:
+        name: One of the names in SINKS
+        output_dir: Directory the sink writes to
+
+    Returns:
+        ResultSink: Sink instance
+
+    Raises:
+        ValueError: If the sink name is unknown
+    """
+    if name not in SINKS:
+        raise ValueError(f"Unsupported sink: {name} (expected one of {', '.join(SINKS)})")
+    return SINKS[name](output_dir)
+
+class SinkPipeline:
+    """
+    Queues results and writes them to sinks in the background.
+
+    A single writer thread does all file and database I/O, so the event loop
+    never blocks on disk. Results are batched and flushed every
+    `flush_interval` seconds, or right away for `write_durable`, but only
+    if anything was written since the last flush. Once results are
+    flushed, their `on_written` callback runs on the writer thread, e.g. to
+    mark them in the checkpoint.
+    """
+
+    def __init__(
+        self,
+        sinks: List[ResultSink],
+        batch_size: int = 64,
+        flush_interval: float = 1.0,
+        max_queued: int = 1024
+    ):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sink-writer")
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> "SinkPipeline":
+        """Start the background writer"""
+        self._task = asyncio.create_task(self._run(), name="sink_pipeline")
+        return self
+
+    async def put(self, results: List[RunResult], on_written: Optional[Callable[[List[RunResult]], None]] = None) -> None:
+        """Queue results for writing, waits only if the writer falls far behind"""
+        if results:
+            await self._queue.put((results, None, on_written))
+
+    async def write_durable(
+        self,
+        results: List[RunResult],
+        on_written: Optional[Callable[[List[RunResult]], None]] = None
+    ) -> None:
+        """
+        Write results and wait until every sink has flushed them.
+
+        Results queued before are written first. Concurrent calls share one
+        flush.
+
+        Raises:
+            RuntimeError: If the pipeline isn't running, or a sink failed to write or flush
+        """
+        if not self._task or self._task.done():
+            raise RuntimeError("Sink pipeline is not running")
+        done = asyncio.get_running_loop().create_future()
+        await self._queue.put((results, done, on_written))
+        await done
+
+    def _call(self, method: str, *args) -> List[str]:
+        errors = []
+        for sink in self.sinks:
+            try:
+                getattr(sink, method)(*args)
+            except Exception as e:
+                self.logger.error(f"{sink.__class__.__name__}.{method} failed: {str(e)}")
+                errors.append(f"{sink.__class__.__name__}.{method}: {str(e)}")
+        return errors
+
+    def _written(self, callbacks: List[Tuple[Callable[[List[RunResult]], None], List[RunResult]]]) -> None:
+        for on_written, results in callbacks:
+            try:
+                on_written(results)
+            except Exception as e:
+                self.logger.error(f"Callback after writing {len(results)} results failed: {str(e)}")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        last_flush = loop.time()
+        closing = False
+        dirty = False  # written since the last flush
+        # Callbacks of results written but not flushed yet
+        unflushed: List[Tuple[Callable[[List[RunResult]], None], List[RunResult]]] = []
+        while not closing:
+            batch: List[RunResult] = []
+            waiters: List[asyncio.Future] = []
+            callbacks = []
+            try:
+                timeout = max(0.0, last_flush + self.flush_interval - loop.time())
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = ([], None, None)
+            # Take whatever else is already queued into the same batch
+            while True:
+                if item is None:
+                    closing = True
+                    break
+                results, waiter, on_written = item
+                batch.extend(results)
+                if waiter:
+                    waiters.append(waiter)
+                if on_written:
+                    callbacks.append((on_written, results))
+                if len(batch) >= self.batch_size or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            errors = []
+            if batch:
+                errors += await loop.run_in_executor(self._executor, self._call, "write", batch)
+                dirty = True
+                if not errors:
+                    unflushed += callbacks
+            if waiters or closing or loop.time() - last_flush >= self.flush_interval:
+                # An idle pipeline doesn't fsync the same files over and over
+                if dirty:
+                    errors += await loop.run_in_executor(self._executor, self._call, "flush")
+                    dirty = False
+                    if unflushed and not errors:
+                        await loop.run_in_executor(self._executor, self._written, unflushed)
+                    unflushed = []
+                last_flush = loop.time()
+            for waiter in waiters:
+                if waiter.done():
+                    continue
+                if errors:
+                    waiter.set_exception(RuntimeError(f"Results not written: {'; '.join(errors)}"))
+                else:
+                    waiter.set_result(None)
+
+    async def close(self) -> None:
+        """Write everything still queued, then close the sinks"""
+        if self._task:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._call, "close")
+        self._executor.shutdown()
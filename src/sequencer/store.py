@@ -0,0 +1,206 @@
+"""
+Indexed results store for querying across many runs.
+"""
+import hashlib
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+from .runner import RunResult
+
+class Batch(BaseModel):
+    """One recorded sequencer invocation"""
+    id: int
+    label: Optional[str] = None
+    started: datetime
+    results: int
+    errors: int
+
+class StoredError(BaseModel):
+    """Failed section of a recorded run"""
+    id: int
+    batch_id: int
+    model: str
+    title: str
+    section_index: int
+    run_id: int
+    row_id: Optional[str] = None
+    error: str
+    start_time: datetime
+
+class ResultStore:
+    """
+    SQLite store with one indexed row per result.
+
+    Prompts and responses live in a separate content-addressed table, so
+    queries over timings and errors never read them and repeated prompts
+    are stored once.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS batches (
+            id INTEGER PRIMARY KEY,
+            label TEXT,
+            started TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS bodies (
+            hash TEXT PRIMARY KEY,
+            text TEXT NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY,
+            batch_id INTEGER NOT NULL REFERENCES batches(id),
+            model TEXT NOT NULL,
+            title TEXT NOT NULL,
+            section_index INTEGER NOT NULL,
+            run_id INTEGER NOT NULL,
+            row_id TEXT,
+            start_time TEXT NOT NULL,
+            first_token_seconds REAL,
+            duration_seconds REAL NOT NULL,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            error TEXT,
+            content_hash TEXT NOT NULL,
+            response_hash TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS results_batch ON results(batch_id);
+        CREATE INDEX IF NOT EXISTS results_latency ON results(model, duration_seconds) WHERE error IS NULL;
+        CREATE INDEX IF NOT EXISTS results_section_latency
+            ON results(title, model, duration_seconds) WHERE error IS NULL;
+        CREATE INDEX IF NOT EXISTS results_errors ON results(batch_id, model) WHERE error IS NOT NULL;
+    """
+
+    def __init__(self, path: str | Path = "results/results.sqlite"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(self.SCHEMA)
+        self.batch_id: Optional[int] = None
+
+    def start_batch(self, label: Optional[str] = None) -> int:
+        """Start recording a new batch of results, returns its id"""
+        cursor = self._db.execute(
+            "INSERT INTO batches (label, started) VALUES (?, ?)",
+            (label, datetime.now().isoformat())
+        )
+        self._db.commit()
+        self.batch_id = cursor.lastrowid
+        return self.batch_id
+
+    def _body(self, text: str) -> str:
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        self._db.execute("INSERT OR IGNORE INTO bodies (hash, text) VALUES (?, ?)", (key, text))
+        return key
+
+    def add(self, results: List[RunResult]) -> None:
+        """Record results in the current batch"""
+        if self.batch_id is None:
+            self.start_batch()
+        self._db.executemany(
+            "INSERT INTO results (batch_id, model, title, section_index, run_id, row_id, start_time, "
+            "first_token_seconds, duration_seconds, input_tokens, output_tokens, error, content_hash, response_hash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    self.batch_id, r.model, r.title, r.section_index, r.run_id, r.row_id,
+                    r.start_time.isoformat(),
+                    r.time_to_first_token.total_seconds() if r.time_to_first_token else None,
+                    r.duration_seconds.total_seconds(),
+                    r.input_tokens, r.output_tokens, r.error,
+                    self._body(r.content), self._body(r.response)
+                )
+                for r in results
+            ]
+        )
+
+    def commit(self) -> None:
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+    def latest_batch(self) -> Optional[int]:
+        """Id of the most recent batch"""
+        row = self._db.execute("SELECT MAX(id) FROM batches").fetchone()
+        return row[0]
+
+    def batches(self, limit: int = 20) -> List[Batch]:
+        """Most recent batches with their result and error counts"""
+        rows = self._db.execute(
+            "SELECT b.id, b.label, b.started, COUNT(r.id), COUNT(r.error) "
+            "FROM batches b LEFT JOIN results r ON r.batch_id = b.id "
+            "GROUP BY b.id ORDER BY b.id DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [
+            Batch(id=id, label=label, started=started, results=results, errors=errors)
+            for id, label, started, results, errors in rows
+        ]
+
+    def latency_percentile(
+        self,
+        percentile: float = 95.0,
+        title: Optional[str] = None,
+        batch_id: Optional[int] = None
+    ) -> Dict[str, float]:
+        """
+        Latency percentile of successful results per model.
+
+        Uses the nearest-rank method. Each model's value is read straight from
+        the latency index, without sorting or scanning the results.
+
+        Args:
+            percentile: Percentile between 0 and 100
+            title: Only include results of this section
+            batch_id: Only include results of this batch
+
+        Returns:
+            Dict[str, float]: Duration in seconds by model
+        """
+        if not 0 <= percentile <= 100:
+            raise ValueError("Percentile must be between 0 and 100")
+        filters, params = ["error IS NULL"], []
+        if title is not None:
+            filters.append("title = ?")
+            params.append(title)
+        if batch_id is not None:
+            filters.append("batch_id = ?")
+            params.append(batch_id)
+        where = " AND ".join(filters)
+        counts = self._db.execute(
+            f"SELECT model, COUNT(*) FROM results WHERE {where} GROUP BY model", params
+        ).fetchall()
+        latencies = {}
+        for model, count in counts:
+            rank = max(1, -(-count * percentile // 100))  # ceil without float rounding drift
+            row = self._db.execute(
+                f"SELECT duration_seconds FROM results WHERE {where} AND model = ? "
+                f"ORDER BY duration_seconds LIMIT 1 OFFSET ?",
+                (*params, model, int(rank) - 1)
+            ).fetchone()
+            latencies[model] = row[0]
+        return latencies
+
+    def errors(self, batch_id: Optional[int] = None) -> List[StoredError]:
+        """Failed sections of a batch, defaults to the latest one"""
+        batch_id = batch_id if batch_id is not None else self.latest_batch()
+        rows = self._db.execute(
+            "SELECT id, batch_id, model, title, section_index, run_id, row_id, error, start_time "
+            "FROM results WHERE batch_id = ? AND error IS NOT NULL ORDER BY model, id",
+            (batch_id,)
+        ).fetchall()
+        fields = list(StoredError.model_fields)
+        return [StoredError(**dict(zip(fields, row))) for row in rows]
+
+    def response(self, result_id: int) -> Optional[str]:
+        """Response body of a stored result"""
+        row = self._db.execute(
+            "SELECT b.text FROM results r JOIN bodies b ON b.hash = r.response_hash WHERE r.id = ?",
+            (result_id,)
+        ).fetchone()
+        return row[0] if row else None
@@ -0,0 +1,154 @@
+"""
+Compact in-memory summary of a batch's results, kept instead of the results themselves.
+"""
+import math
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .runner import RunResult
+
+class ResultRecord:
+    """What ran, how long it took and whether it failed, without the prompt and response text"""
+    __slots__ = ("model", "section_index", "title", "duration", "time_to_first_token", "input_tokens", "output_tokens", "ok")
+
+    def __init__(
+        self,
+        model: str,
+        section_index: int,
+        title: str,
+        duration: float,
+        time_to_first_token: Optional[float],
+        input_tokens: int,
+        output_tokens: int,
+        ok: bool
+    ):
+        self.model = model
+        self.section_index = section_index
+        self.title = title
+        self.duration = duration
+        self.time_to_first_token = time_to_first_token
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.ok = ok
+
+class ModelTotals:
+    """Running totals of one model's results"""
+    __slots__ = ("ok", "failed", "seconds", "input_tokens", "output_tokens")
+
+    def __init__(self):
+        self.ok = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+class RunSummary:
+    """
+    Counters and compact records of the results of a batch.
+
+    The results themselves go to the sinks as they arrive. Per result this
+    keeps a row of typed arrays, about 30 bytes with model and section
+    stored as indices, which is enough for success rates and latency
+    percentiles. With `keep_records=False` only the per-model totals are
+    kept, so memory stays the same however many results there are. Results
+    restored from a checkpoint are only counted in `restored`, they were
+    neither run nor timed by this batch.
+    """
+
+    def __init__(self, keep_records: bool = True):
+        self.keep_records = keep_records
+        self.restored = 0
+        self.totals: Dict[str, ModelTotals] = {}
+        self.models: List[str] = []
+        self.titles: Dict[int, str] = {}
+        self._model_ids: Dict[str, int] = {}
+        self._model = array("H")
+        self._section = array("H")
+        self._duration = array("f")
+        self._ttft = array("f")  # NaN without a first token time
+        self._input_tokens = array("I")
+        self._output_tokens = array("I")
+        self._ok = array("b")
+
+    def __len__(self) -> int:
+        return self.ok + self.failed
+
+    @property
+    def ok(self) -> int:
+        return sum(totals.ok for totals in self.totals.values())
+
+    @property
+    def failed(self) -> int:
+        return sum(totals.failed for totals in self.totals.values())
+
+    def add(self, results: Iterable[RunResult]) -> None:
+        """Count results, keeping only their record"""
+        for result in results:
+            if result.restored:
+                self.restored += 1
+                continue
+            totals = self.totals.get(result.model)
+            if totals is None:
+                totals = self.totals[result.model] = ModelTotals()
+            duration = result.duration_seconds.total_seconds()
+            if result.error:
+                totals.failed += 1
+            else:
+                totals.ok += 1
+            totals.seconds += duration
+            totals.input_tokens += result.input_tokens or 0
+            totals.output_tokens += result.output_tokens or 0
+            if not self.keep_records:
+                continue
+            if result.model not in self._model_ids:
+                self._model_ids[result.model] = len(self.models)
+                self.models.append(result.model)
+            self.titles.setdefault(result.section_index, result.title)
+            ttft = result.time_to_first_token
+            self._model.append(self._model_ids[result.model])
+            self._section.append(result.section_index)
+            self._duration.append(duration)
+            self._ttft.append(ttft.total_seconds() if ttft is not None else math.nan)
+            self._input_tokens.append(result.input_tokens or 0)
+            self._output_tokens.append(result.output_tokens or 0)
+            self._ok.append(0 if result.error else 1)
+
+    def records(self) -> Iterator[ResultRecord]:
+        """Records of the results in the order they were added, empty without `keep_records`"""
+        for i in range(len(self._model)):
+            ttft = self._ttft[i]
+            yield ResultRecord(
+                self.models[self._model[i]],
+                self._section[i],
+                self.titles[self._section[i]],
+                self._duration[i],
+                None if math.isnan(ttft) else ttft,
+                self._input_tokens[i],
+                self._output_tokens[i],
+                bool(self._ok[i])
+            )
+
+    def percentile(self, model: str, q: float) -> Optional[float]:
+        """Nearest-rank percentile of a model's successful request durations, None without records"""
+        model_id = self._model_ids.get(model)
+        if model_id is None:
+            return None
+        durations = sorted(
+            self._duration[i] for i in range(len(self._model))
+            if self._model[i] == model_id and self._ok[i]
+        )
+        if not durations:
+            return None
+        rank = math.ceil(len(durations) * q / 100)
+        return durations[min(len(durations), max(1, rank)) - 1]
+
+    def report(self) -> List[str]:
+        """One line of totals per model"""
+        lines = []
+        for model, totals in self.totals.items():
+            line = f"{model}: {totals.ok} ok, {totals.failed} failed, {totals.output_tokens} output tokens"
+            p50, p95 = self.percentile(model, 50), self.percentile(model, 95)
+            if p50 is not None:
+                line += f", p50 {p50:.1f}s, p95 {p95:.1f}s"
+            lines.append(line)
+        return lines
@@ -1,12 +1,20 @@
 """
 Writer module for saving LLM run results to files.
 """
+import re
+import asyncio
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List, Optional, TextIO, Tuple
 from datetime import datetime 
 
 from .runner import RunResult
 
+def run_filename(model: str, run_id: int = 0, row_id: Optional[str] = None) -> str:
+    """Get the markdown filename for one run of a model"""
+    timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+    row = "_row" + re.sub(r'[^\w.-]', '_', row_id) if row_id is not None else ""
+    return f"results_{model.replace('/', '_')}_{timestamp}_run{run_id}{row}.md"
+
 class ResultWriter:
     """Handles writing run results to files"""
     
@@ -14,23 +22,30 @@ class ResultWriter:
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
     
+    def _create_file(self, filename: str) -> TextIO:
+        """Open a new file, adding a counter to the name instead of overwriting an existing one"""
+        path = self.output_dir / filename
+        counter = 1
+        while True:
+            try:
+                return open(path, 'x', encoding='utf-8')
+            except FileExistsError:
+                counter += 1
+                path = self.output_dir / f"{Path(filename).stem}_{counter}.md"
+    
     def write_results(self, results: List[RunResult]) -> None:
         """Write results to markdown files"""
         if not results:
             return
             
-        # Group by model
-        model_results = {}
+        # Group by run, so parallel runs of one model get their own files
+        run_results = {}
         for result in results:
-            model_results.setdefault(result.model, []).append(result)
+            run_results.setdefault((result.model, result.run_id, result.row_id), []).append(result)
         
         # Write files
-        for model, results in model_results.items():
-            timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-            filename = f"results_{model.replace('/', '_')}_{timestamp}.md"
-            filepath = self.output_dir / filename
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
+        for (model, run_id, row_id), results in run_results.items():
+            with self._create_file(run_filename(model, run_id, row_id)) as f:
                 for result in results:
                     f.write(f"# {result.title}\n\n")
                     f.write(f">> user:\n\n```\n{result.content}\n```\n\n")
@@ -41,6 +56,141 @@ class ResultWriter:
                         f.write(f">> ai:\n\n{result.response}\n\n")
                     f.write("---\n\n")
 
+class StreamFile:
+    """
+    Markdown file of a single run, appended to while the response streams in.
+
+    Chunks are buffered and written out `flush_interval` seconds after the
+    first one arrives, once `max_buffered` characters are waiting, and at
+    the end of every section, instead of writing and flushing each chunk on
+    the event loop.
+    """
+    
+    def __init__(self, filepath: Path, flush_interval: float = 0.25, max_buffered: int = 65536):
+        self.filepath = filepath
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._file = open(filepath, 'a', encoding='utf-8')
+        self._buffer: List[str] = []
+        self._buffered = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+    
+    def _append(self, text: str) -> None:
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.max_buffered:
+            self.flush()
+        elif self._timer is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()  # no event loop to wait on
+                return
+            self._timer = loop.call_later(self.flush_interval, self.flush)
+    
+    def flush(self) -> None:
+        """Write out buffered text, so a crash keeps everything streamed so far"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._buffer:
+            self._file.write("".join(self._buffer))
+            self._file.flush()
+            self._buffer.clear()
+            self._buffered = 0
+    
+    def start_section(self, title: str, content: str) -> None:
+        """Write the prompt of a section before its response arrives"""
+        self._append(f"# {title}\n\n>> user:\n\n```\n{content}\n```\n\n---\n\n>> ai:\n\n")
+    
+    def write(self, chunk: str) -> None:
+        """Append a chunk of the streamed response"""
+        self._append(chunk)
+    
+    def end_section(self, error: Optional[str] = None) -> None:
+        """Close the current section, noting the error if it failed"""
+        if error:
+            self._append(f"\n\nerror: {error}")
+        self._append("\n\n---\n\n")
+        self.flush()
+    
+    def sections(self) -> "SectionStream":
+        """Wrap the file for writing sections that run concurrently"""
+        return SectionStream(self)
+    
+    def close(self) -> None:
+        """Write out buffered text and close the underlying file"""
+        self.flush()
+        self._file.close()
+
+class SectionStream:
+    """
+    Sections of one run streamed into its file without interleaving.
+
+    Sections that run concurrently can't all stream into the file at once.
+    One streams live, the others are buffered. A buffered section is written
+    whole once it is done and the file is free. Otherwise it takes over
+    streaming live when the current section ends.
+    """
+    
+    def __init__(self, file: StreamFile):
+        self.file = file
+        self._live: Optional[int] = None
+        self._running: Dict[int, Tuple[str, str, List[str]]] = {}
+        self._finished: List[Tuple[str, str, List[str], Optional[str]]] = []
+    
+    def start_section(self, key: int, title: str, content: str) -> None:
+        """Start a section, streaming it live if no other section is"""
+        if self._live is None:
+            self._live = key
+            self.file.start_section(title, content)
+        else:
+            self._running[key] = (title, content, [])
+    
+    def writer(self, key: int) -> Callable[[str], None]:
+        """Get the chunk callback of a started section"""
+        def write(chunk: str) -> None:
+            if key == self._live:
+                self.file.write(chunk)
+            else:
+                self._running[key][2].append(chunk)
+        return write
+    
+    def end_section(self, key: int, error: Optional[str] = None) -> None:
+        """End a section, writing out buffered ones if the file is free"""
+        if key == self._live:
+            self.file.end_section(error)
+            self._live = None
+        else:
+            title, content, chunks = self._running.pop(key)
+            self._finished.append((title, content, chunks, error))
+        if self._live is None:
+            self._drain()
+    
+    def _drain(self) -> None:
+        for title, content, chunks, error in self._finished:
+            self.file.start_section(title, content)
+            self.file.write("".join(chunks))
+            self.file.end_section(error)
+        self._finished.clear()
+        if self._running:
+            key = min(self._running)
+            title, content, chunks = self._running.pop(key)
+            self._live = key
+            self.file.start_section(title, content)
+            self.file.write("".join(chunks))
+
+class StreamWriter:
+    """Handles writing streamed run results to files as they arrive"""
+    
+    def __init__(self, output_dir: str | Path = "results"):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(exist_ok=True)
+    
+    def open(self, model: str, run_id: int = 0, row_id: Optional[str] = None) -> StreamFile:
+        """Open the results file for one run of a model"""
+        return StreamFile(self.output_dir / run_filename(model, run_id, row_id))
+
 def write_results(results: List[RunResult], output_dir: str | Path = "results") -> None:
     """Write results to markdown files"""
     writer = ResultWriter(output_dir)
@@ -0,0 +1,75 @@
+"""
+Shared fixtures: a stand-in provider, a small sequence file and a result factory.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set
+
+import pytest
+
+from sequencer.config import APIConfig, RunnerConfig
+from sequencer.providers import Completion
+from sequencer.runner import RunResult
+
+MODEL = "gpt-4o-mini-2024-07-18"
+
+def make_result(section_index: int = 1, *, model: str = MODEL, run_id: int = 0, seconds: float = 1.0, **fields) -> RunResult:
+    """Result of a section that took `seconds`, with any other RunResult fields as given"""
+    now = datetime.now()
+    return RunResult(**{
+        "model": model,
+        "title": f"Section {section_index}",
+        "content": f"prompt {section_index}",
+        "response": f"answer {section_index}",
+        "section_index": section_index,
+        "run_id": run_id,
+        "start_time": now,
+        "end_time": now + timedelta(seconds=seconds),
+        **fields
+    })
+
+class StubProvider:
+    """
+    Answers every request right away, except that requests whose prompt
+    contains one of `hang_on` wait until cancelled, like a process killed
+    mid-request.
+    """
+    supports_batch = False
+    supports_n = False
+
+    def __init__(self):
+        self.runner_config = RunnerConfig(model=MODEL)
+        self.api_config = APIConfig(api_key="test", max_retries=0)
+        self.requests: List[List[Dict[str, str]]] = []
+        self.hang_on: Set[str] = set()
+        self.hanging = asyncio.Event()
+
+    async def complete(self, messages: List[Dict[str, str]], on_chunk: Optional[Callable[[str], None]] = None) -> Completion:
+        self.requests.append(messages)
+        prompt = messages[-1]["content"]
+        if any(text in prompt for text in self.hang_on):
+            self.hanging.set()
+            await asyncio.Event().wait()
+        return Completion(text=f"Answer to: {prompt}", input_tokens=10, output_tokens=5)
+
+@pytest.fixture
+def stub_provider(monkeypatch) -> StubProvider:
+    """Provider every SequenceRunner gets, whatever the model"""
+    provider = StubProvider()
+
+    def get_provider(settings, runner_config: RunnerConfig, clients=None) -> StubProvider:
+        provider.runner_config = runner_config
+        return provider
+
+    monkeypatch.setattr("sequencer.runner.get_provider", get_provider)
+    return provider
+
+@pytest.fixture
+def sequence_file(tmp_path) -> Path:
+    """Sequence with a system prompt and three sections"""
+    path = tmp_path / "sequence.md"
+    parts = ["# System Prompt\n```\nYou are a test.\n```"]
+    parts += [f"# Section {i}\n```\nQuestion number {i}?\n```" for i in range(1, 4)]
+    path.write_text("\n\n---\n".join(parts) + "\n")
+    return path
@@ -0,0 +1,39 @@
+"""
+Tests of batch API runs against the benchmarks' mock server.
+"""
+from typing import List
+
+from mock_server import MockLLMServer, mock_settings
+from sequencer.clients import ClientRegistry
+from sequencer.config import BatchConfig
+from sequencer.metrics import Metrics
+from sequencer.runner import RunResult, SequenceRunner
+
+MODELS = ["gpt-4o-mini-2024-07-18", "claude-3-5-sonnet-20241022"]
+
+async def run_batched(server: MockLLMServer, sequence_file, num_runs: int) -> List[RunResult]:
+    settings = mock_settings(server.base_url)
+    settings.batch = BatchConfig(enabled=True, collect_seconds=0.02, poll_interval=0.02, max_poll_interval=0.05)
+    clients = ClientRegistry()
+    runner = SequenceRunner(settings, clients=clients, metrics=Metrics())
+    try:
+        return [result async for results in runner.run_sequence(sequence_file, MODELS, num_runs) for result in results]
+    finally:
+        await runner.batcher.close()
+        await clients.aclose()
+
+async def test_runs_advance_in_lockstep_one_batch_per_section(sequence_file):
+    async with MockLLMServer(batch_seconds=0.05, seed=0) as server:
+        results = await run_batched(server, sequence_file, num_runs=3)
+        stats = server.stats()
+    assert len(results) == 2 * 3 * 3
+    assert [result.error for result in results] == [None] * len(results)
+    assert all(result.response for result in results)
+    # Every section of every run went through a batch, one batch per model and section
+    assert (stats["batches"], stats["batched"]) == (2 * 3, 2 * 3 * 3)
+
+async def test_failed_batch_requests_fail_their_sections(sequence_file):
+    async with MockLLMServer(batch_seconds=0.05, server_error_rate=1.0, seed=0) as server:
+        results = await run_batched(server, sequence_file, num_runs=2)
+    assert len(results) == 2 * 2 * 3
+    assert all(result.error for result in results)
@@ -0,0 +1,127 @@
+"""
+Tests of the response cache and its rw, ro and replay modes.
+"""
+from typing import Callable, Dict, List, Optional
+
+import pytest
+
+from conftest import MODEL
+from sequencer.cache import CacheMissError, ResponseCache
+from sequencer.config import APIConfig, RunnerConfig, Settings
+from sequencer.metrics import Metrics
+from sequencer.providers import Completion
+from sequencer.runner import RunResult, SequenceRunner
+
+MESSAGES = [{"role": "user", "content": "What is 2 + 2?"}]
+
+class StubProvider:
+    """Answers every request with the same text, counting requests"""
+    supports_batch = False
+
+    def __init__(self):
+        self.runner_config = RunnerConfig(model="gpt-4o-mini-2024-07-18", temperature=0.0)
+        self.api_config = APIConfig(api_key="test", max_retries=0)
+        self.requests = 0
+
+    async def complete(self, messages: List[Dict[str, str]], on_chunk: Optional[Callable[[str], None]] = None) -> Completion:
+        self.requests += 1
+        return Completion(text="4", input_tokens=10, output_tokens=1)
+
+def runner(cache: ResponseCache) -> SequenceRunner:
+    return SequenceRunner(Settings(), cache=cache, metrics=Metrics())
+
+def key(provider: StubProvider) -> str:
+    return ResponseCache.key(provider.runner_config, MESSAGES)
+
+def test_key_covers_model_sampling_and_messages():
+    config = RunnerConfig(model="gpt-4o-mini-2024-07-18", temperature=0.0)
+    assert ResponseCache.key(config, MESSAGES) == ResponseCache.key(config, list(MESSAGES))
+    assert ResponseCache.key(config, MESSAGES) != ResponseCache.key(config.model_copy(update={"temperature": 0.5}), MESSAGES)
+    assert ResponseCache.key(config, MESSAGES) != ResponseCache.key(config, [{"role": "user", "content": "2 + 3?"}])
+    assert ResponseCache.key(config, MESSAGES, sample=0) != ResponseCache.key(config, MESSAGES, sample=1)
+    assert ResponseCache.key(config, MESSAGES, sample=0) != ResponseCache.key(config, MESSAGES)
+
+def test_rw_stores_and_reads_across_instances(tmp_path):
+    ResponseCache(tmp_path).put("ab" * 32, "answer")
+    assert ResponseCache(tmp_path).get("ab" * 32) == "answer"
+    assert ResponseCache(tmp_path).get("cd" * 32) is None
+
+def test_ro_never_stores(tmp_path):
+    cache = ResponseCache(tmp_path, mode="ro")
+    cache.put("ab" * 32, "answer")
+    assert cache.get("ab" * 32) is None
+    assert not list(tmp_path.glob("*/*.json"))
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path, max_bytes=40)
+    cache.put("aa" * 32, "first")
+    cache.put("bb" * 32, "second")
+    cache.get("aa" * 32)
+    cache.put("cc" * 32, "third")
+    assert cache.get("bb" * 32) is None
+    assert cache.get("aa" * 32) == "first" and cache.get("cc" * 32) == "third"
+
+def test_unreadable_entry_is_dropped(tmp_path):
+    cache = ResponseCache(tmp_path)
+    cache.put("ab" * 32, "answer")
+    (tmp_path / "ab" / f"{'ab' * 32}.json").write_text("not json")
+    assert cache.get("ab" * 32) is None
+    assert not list(tmp_path.glob("*/*.json"))
+
+async def test_rw_serves_repeated_requests_from_cache(tmp_path):
+    provider = StubProvider()
+    sequence = runner(ResponseCache(tmp_path))
+    first = await sequence._generate(provider, "openai", MESSAGES)
+    second = await sequence._generate(provider, "openai", MESSAGES)
+    assert provider.requests == 1
+    assert (first.text, first.cached) == ("4", False)
+    assert (second.text, second.cached) == ("4", True)
+
+async def test_ro_reads_but_does_not_store(tmp_path):
+    provider = StubProvider()
+    ResponseCache(tmp_path).put(key(provider), "cached 4")
+    other = [{"role": "user", "content": "What is 3 + 3?"}]
+    sequence = runner(ResponseCache(tmp_path, mode="ro"))
+    assert (await sequence._generate(provider, "openai", MESSAGES)).text == "cached 4"
+    await sequence._generate(provider, "openai", other)
+    await sequence._generate(provider, "openai", other)
+    assert provider.requests == 2
+
+async def test_replay_never_calls_the_provider(tmp_path):
+    provider = StubProvider()
+    ResponseCache(tmp_path).put(key(provider), "cached 4")
+    sequence = runner(ResponseCache(tmp_path, mode="replay"))
+    assert (await sequence._generate(provider, "openai", MESSAGES)).text == "cached 4"
+    with pytest.raises(CacheMissError):
+        await sequence._generate(provider, "openai", [{"role": "user", "content": "Something new"}])
+    assert provider.requests == 0
+
+async def test_replay_runs_without_api_keys(tmp_path, monkeypatch, stub_provider, sequence_file):
+    async def run(mode: str) -> List[RunResult]:
+        sequence = runner(ResponseCache(tmp_path / "cache", mode=mode))
+        return [result async for results in sequence.run_sequence(sequence_file, [MODEL], 1) for result in results]
+
+    recorded = await run("rw")
+    # Replay against the real providers, with no key in the environment or a .env file
+    monkeypatch.undo()
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.chdir(tmp_path)
+    replayed = await run("replay")
+    assert [result.error for result in replayed] == [None] * 3
+    assert sorted(result.response for result in replayed) == sorted(result.response for result in recorded)
+
+async def test_runs_of_the_same_prompt_keep_their_own_responses(tmp_path, stub_provider, sequence_file):
+    async def run(num_runs: int) -> None:
+        sequence = runner(ResponseCache(tmp_path / "cache"))
+        async for _ in sequence.run_sequence(sequence_file, [MODEL], num_runs):
+            pass
+
+    await run(2)
+    assert len(stub_provider.requests) == 6
+    assert len(list((tmp_path / "cache").glob("*/*.json"))) == 6
+    # Served from each run's own entries the next time
+    await run(2)
+    assert len(stub_provider.requests) == 6
+    # A single run isn't one of several samples, its responses are cached apart
+    await run(1)
+    assert len(stub_provider.requests) == 9
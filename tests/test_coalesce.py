@@ -0,0 +1,93 @@
+"""
+Tests of request coalescing.
+"""
+import asyncio
+import logging
+
+import pytest
+
+from sequencer.coalesce import Coalescer
+from sequencer.config import CoalesceConfig, RunnerConfig
+from sequencer.metrics import Metrics
+from sequencer.providers import Completion
+
+MODEL = "gpt-4o-mini-2024-07-18"
+
+def coalescer(mode: str, **config) -> Coalescer:
+    return Coalescer(CoalesceConfig(mode=mode, **config), Metrics())
+
+def sampling(temperature: float, top_p: float = 0.1) -> RunnerConfig:
+    return RunnerConfig(model=MODEL, temperature=temperature, top_p=top_p)
+
+def test_off_never_allows():
+    assert not coalescer("off").allows(sampling(0.0))
+
+def test_deterministic_covers_default_sampling():
+    deterministic = coalescer("deterministic")
+    assert deterministic.allows(sampling(0.0))
+    # Every request is sampled with the default runner config
+    assert deterministic.allows(RunnerConfig(model=MODEL))
+    assert deterministic.allows(RunnerConfig(model=MODEL), sampled=True)
+    assert not deterministic.allows(sampling(0.2, top_p=0.0))
+
+def test_warns_when_deterministic_never_applies(caplog):
+    coalescer("deterministic")
+    coalescer("always", max_temperature=0.0)
+    assert not caplog.records
+    with caplog.at_level(logging.WARNING):
+        unusable = coalescer("deterministic", max_temperature=0.0)
+    assert "none will be coalesced" in caplog.text
+    assert not unusable.allows(RunnerConfig(model=MODEL))
+
+def test_deterministic_max_temperature():
+    assert coalescer("deterministic", max_temperature=0.2).allows(sampling(0.2))
+    assert not coalescer("deterministic", max_temperature=0.2).allows(sampling(0.3))
+
+def test_sampled_runs_never_coalesced():
+    for mode in ("deterministic", "always"):
+        assert not coalescer(mode).allows(sampling(0.7), sampled=True)
+        assert coalescer(mode).allows(sampling(0.0), sampled=True)
+    assert coalescer("always").allows(sampling(0.7))
+
+async def test_concurrent_identical_requests_share_one_call():
+    shared = coalescer("always")
+    calls = 0
+
+    async def call() -> Completion:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return Completion(text="answer", input_tokens=10, output_tokens=5)
+
+    key = Coalescer.key("openai", sampling(0.0), [{"role": "user", "content": "hi"}])
+    (first, first_shared), (second, second_shared) = await asyncio.gather(
+        shared.run(key, MODEL, call), shared.run(key, MODEL, call)
+    )
+    assert calls == 1
+    assert (first_shared, second_shared) == (False, True)
+    assert first.output_tokens == 5 and second.output_tokens == 0
+    assert second.text == "answer"
+
+    # Once the request is done, the next one is sent
+    await shared.run(key, MODEL, call)
+    assert calls == 2
+    assert (shared.requests, shared.hits) == (3, 1)
+
+async def test_shared_error_reaches_every_caller():
+    shared = coalescer("always")
+
+    async def call() -> Completion:
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    key = Coalescer.key("openai", sampling(0.0), [])
+    results = await asyncio.gather(shared.run(key, MODEL, call), shared.run(key, MODEL, call), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_key_depends_on_sampling_and_messages():
+    messages = [{"role": "user", "content": "hi"}]
+    key = Coalescer.key("openai", sampling(0.0), messages)
+    assert key == Coalescer.key("openai", sampling(0.0), list(messages))
+    assert key != Coalescer.key("openai", sampling(0.5), messages)
+    assert key != Coalescer.key("together", sampling(0.0), messages)
+    assert key != Coalescer.key("openai", sampling(0.0), [{"role": "user", "content": "hello"}])
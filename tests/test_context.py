@@ -0,0 +1,80 @@
+"""
+Tests of the context window and its compaction policies.
+"""
+import logging
+from typing import Dict, List
+
+import pytest
+
+from sequencer.config import ContextConfig
+from sequencer.context import ContextOverflowError, ContextWindow, count_tokens
+from sequencer.providers import LLMError
+
+SYSTEM = [{"role": "system", "content": "You are a helpful assistant."}]
+PROMPT = {"role": "user", "content": "Next question"}
+
+def window(policy: str, budget: int, summarize=None, **config) -> ContextWindow:
+    window = ContextWindow(SYSTEM, ContextConfig(policy=policy, **config), budget, summarize)
+    # Five turns of roughly 250 tokens each
+    for index in range(1, 6):
+        window.add(index, [{"role": "user", "content": f"question {index} " + "x" * 1000}])
+        window.append(index, {"role": "assistant", "content": f"answer {index}"})
+    return window
+
+def contents(messages: List[Dict[str, str]]) -> List[str]:
+    return [message["content"].split(" ")[0] + " " + message["content"].split(" ")[1] for message in messages[1:-1]]
+
+async def test_request_within_budget_is_sent_whole():
+    for policy in ("none", "drop", "truncate", "summarize"):
+        messages, tokens, compacted = await window(policy, 100_000).build([1, 2, 3, 4, 5], PROMPT)
+        assert len(messages) == 1 + 10 + 1 and compacted == 0
+        assert tokens == count_tokens(messages)
+
+async def test_none_fails_over_budget():
+    with pytest.raises(ContextOverflowError) as error:
+        await window("none", 800).build([1, 2, 3, 4, 5], PROMPT)
+    # A section error, not a crash of the run
+    assert isinstance(error.value, LLMError) and not error.value.retryable
+
+async def test_drop_leaves_out_oldest_and_warns(caplog):
+    with caplog.at_level(logging.WARNING):
+        messages, tokens, compacted = await window("drop", 700).build([1, 2, 3, 4, 5], PROMPT)
+    assert tokens <= 700
+    assert compacted == 3
+    assert contents(messages) == ["question 4", "answer 4", "question 5", "answer 5"]
+    assert "Dropped earlier turns [1, 2, 3]" in caplog.text
+
+async def test_keep_recent_is_never_dropped():
+    messages, tokens, compacted = await window("drop", 300, keep_recent=2).build([1, 2, 3, 4, 5], PROMPT)
+    assert tokens > 300
+    assert contents(messages)[0] == "question 4"
+
+async def test_truncate_shortens_oldest_first():
+    messages, tokens, compacted = await window("truncate", 1100, truncate_tokens=16).build([1, 2, 3, 4, 5], PROMPT)
+    assert tokens <= 1100
+    assert compacted >= 1
+    assert messages[1]["content"].endswith("[...]")
+    assert not messages[-2]["content"].endswith("[...]")
+
+async def test_summarize_replaces_older_turns():
+    calls = []
+
+    async def summarize(messages: List[Dict[str, str]]) -> str:
+        calls.append(messages)
+        return "summary of the conversation"
+
+    context = window("summarize", 1000, summarize)
+    messages, tokens, compacted = await context.build([1, 2, 3, 4, 5], PROMPT)
+    assert len(calls) == 1 and compacted == 3
+    assert messages[2]["content"] == "summary of the conversation"
+    assert contents(messages)[-4:] == ["question 4", "answer 4", "question 5", "answer 5"]
+    # Sections seeing the same turns share the summary
+    await context.build([1, 2, 3, 4, 5], PROMPT)
+    assert len(calls) == 1
+
+async def test_failed_summary_drops_instead():
+    async def summarize(messages: List[Dict[str, str]]) -> str:
+        raise LLMError("bad request", status=400)
+
+    messages, tokens, compacted = await window("summarize", 700, summarize).build([1, 2, 3, 4, 5], PROMPT)
+    assert tokens <= 700 and compacted == 3
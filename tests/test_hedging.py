@@ -0,0 +1,85 @@
+"""
+Tests of the latency tracker and of hedging slow requests.
+"""
+import asyncio
+from typing import List, Optional
+
+from sequencer.config import HedgeConfig
+from sequencer.hedging import Hedger, LatencyTracker
+from sequencer.metrics import Metrics
+from sequencer.providers import Completion
+
+MODEL = "gpt-4o-mini-2024-07-18"
+
+def hedger(**config) -> Hedger:
+    return Hedger(HedgeConfig(**{"enabled": True, "min_samples": 10, "min_delay": 0.0, **config}), Metrics())
+
+def slow_then_fast(seconds: List[float]):
+    """Attempt function whose n-th call takes `seconds[n]`, returning its call number"""
+    calls = []
+
+    async def attempt(sent: Optional[asyncio.Event]) -> Completion:
+        call = len(calls)
+        calls.append(call)
+        if sent:
+            sent.set()
+        await asyncio.sleep(seconds[call])
+        return Completion(text=str(call))
+
+    return attempt, calls
+
+def test_percentile_is_nearest_rank():
+    tracker = LatencyTracker()
+    assert tracker.percentile(MODEL, 50) is None
+    for seconds in range(10, 0, -1):
+        tracker.observe(MODEL, float(seconds))
+    assert tracker.count(MODEL) == 10
+    assert tracker.percentile(MODEL, 50) == 5.0
+    assert tracker.percentile(MODEL, 95) == 10.0
+    assert tracker.percentile(MODEL, 1) == 1.0
+
+def test_window_forgets_oldest_latencies():
+    tracker = LatencyTracker(window=3)
+    for seconds in (9.0, 1.0, 2.0, 3.0):
+        tracker.observe(MODEL, seconds)
+    assert tracker.count(MODEL) == 3
+    assert tracker.percentile(MODEL, 99) == 3.0
+    assert tracker.percentile("other", 50) is None
+
+def test_delay_needs_samples_and_respects_minimum():
+    hedge = hedger(percentile=90, min_samples=5, min_delay=0.5)
+    for _ in range(4):
+        hedge.latencies.observe(MODEL, 2.0)
+    assert hedge.delay(MODEL) is None
+    hedge.latencies.observe(MODEL, 3.0)
+    assert hedge.delay(MODEL) == 3.0
+
+    fast = hedger(percentile=90, min_samples=5, min_delay=0.5)
+    for _ in range(5):
+        fast.latencies.observe(MODEL, 0.1)
+    assert fast.delay(MODEL) == 0.5
+
+async def test_fast_request_is_not_hedged():
+    hedge = hedger(max_rate=1.0)
+    for _ in range(10):
+        hedge.latencies.observe(MODEL, 0.05)
+    attempt, calls = slow_then_fast([0.0])
+    assert (await hedge.run(MODEL, attempt)).text == "0"
+    assert calls == [0] and hedge.hedged == 0
+
+async def test_slow_request_is_hedged_and_hedge_wins():
+    hedge = hedger(max_rate=1.0)
+    for _ in range(10):
+        hedge.latencies.observe(MODEL, 0.01)
+    attempt, calls = slow_then_fast([5.0, 0.0])
+    completion = await asyncio.wait_for(hedge.run(MODEL, attempt), 1)
+    assert completion.text == "1"
+    assert calls == [0, 1] and hedge.hedged == 1
+
+async def test_hedges_stay_within_max_rate():
+    hedge = hedger(max_rate=0.0)
+    for _ in range(10):
+        hedge.latencies.observe(MODEL, 0.01)
+    attempt, calls = slow_then_fast([0.05])
+    assert (await hedge.run(MODEL, attempt)).text == "0"
+    assert calls == [0] and hedge.hedged == 0
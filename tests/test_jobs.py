@@ -0,0 +1,179 @@
+"""
+Tests of the job queue and of workers writing results before completing jobs.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from conftest import MODEL, make_result
+from sequencer.checkpoint import CheckpointStore
+from sequencer.config import Settings
+from sequencer.jobs import JobQueue, Worker
+from sequencer.metrics import Metrics
+from sequencer.runner import RunResult, SequenceRunner
+from sequencer.sinks import JsonlSink, ResultSink, SinkPipeline, SqliteSink
+
+class FakeRunner:
+    """Stands in for SequenceRunner, answers every job with one result"""
+
+    def __init__(self, checkpoints: CheckpointStore):
+        self.checkpoints = checkpoints
+        self.jobs = 0
+
+    async def run_job(self, sequence_file: Path, model: str, run_id: int = 0, **kwargs) -> List[RunResult]:
+        self.jobs += 1
+        return [make_result(model=model, run_id=run_id)]
+
+class BlockingSink(ResultSink):
+    """Sink whose flush hangs until released, like a worker dying mid-flush"""
+
+    def __init__(self):
+        self.flushing = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, results: List[RunResult]) -> None:
+        pass
+
+    def flush(self) -> None:
+        self.flushing.set()
+        self.release.wait(5)
+
+class FailingSink(ResultSink):
+    def write(self, results: List[RunResult]) -> None:
+        raise OSError("disk full")
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(tmp_path / "queue.sqlite", max_attempts=2)
+    yield queue
+    queue.close()
+
+def test_lease_and_complete(queue):
+    batch_id, count = queue.submit("sequence.md", ["a", "b"], num_runs=2)
+    assert (batch_id, count) == (1, 4)
+
+    jobs = queue.lease("w1", limit=3, seconds=60)
+    assert [job.id for job in jobs] == [1, 2, 3]
+    assert all(job.attempts == 1 for job in jobs)
+    assert [job.id for job in queue.lease("w2", limit=3, seconds=60)] == [4]
+    assert queue.lease("w2", limit=3, seconds=60) == []
+
+    assert queue.complete(1, "w1")
+    # Only the lease holder can finish a job, and only once
+    assert not queue.complete(2, "w2")
+    assert not queue.complete(1, "w1")
+    assert queue.counts() == {"done": 1, "leased": 3}
+    assert queue.remaining() == 3
+
+def test_expired_lease_is_taken_over(queue):
+    queue.submit("sequence.md", ["a"], num_runs=1)
+    [job] = queue.lease("w1", limit=1, seconds=0.01)
+    time.sleep(0.02)
+
+    [again] = queue.lease("w2", limit=1, seconds=60)
+    assert again.id == job.id and again.attempts == 2
+    assert queue.renew("w1", [job.id], 60) == []
+    assert not queue.complete(job.id, "w1")
+    assert queue.complete(job.id, "w2")
+
+def test_job_fails_after_max_attempts(queue):
+    queue.submit("sequence.md", ["a"], num_runs=1)
+    [job] = queue.lease("w1", limit=1, seconds=60)
+    assert queue.fail(job.id, "w1", "boom")
+    assert queue.counts() == {"pending": 1}
+
+    [job] = queue.lease("w1", limit=1, seconds=60)
+    assert queue.fail(job.id, "w1", "boom")
+    assert queue.counts() == {"failed": 1}
+    assert queue.remaining() == 0
+
+def test_release_does_not_count_attempt(queue):
+    queue.submit("sequence.md", ["a"], num_runs=1)
+    [job] = queue.lease("w1", limit=1, seconds=60)
+    queue.release("w1", [job.id])
+    [job] = queue.lease("w1", limit=1, seconds=60)
+    assert job.attempts == 1
+
+async def test_results_are_on_disk_before_job_is_done(queue, tmp_path):
+    queue.submit("sequence.md", ["a"], num_runs=3)
+    # Long flush interval, only the worker's durable writes can reach the disk in time
+    pipeline = SinkPipeline([JsonlSink(tmp_path)], flush_interval=3600).start()
+    worker = Worker(queue, FakeRunner, pipeline, concurrency=2, poll_interval=0.01)
+    try:
+        await worker.run(exit_when_empty=True)
+        assert queue.counts() == {"done": 3}
+        lines = (tmp_path / "results.jsonl").read_text().splitlines()
+        assert sorted(json.loads(line)["run_id"] for line in lines) == [0, 1, 2]
+    finally:
+        await pipeline.close()
+
+async def test_worker_killed_before_flush_leaves_job_for_retry(queue, tmp_path):
+    queue.submit("sequence.md", ["a"], num_runs=1)
+    sink = BlockingSink()
+    pipeline = SinkPipeline([sink], flush_interval=3600).start()
+    worker = Worker(queue, FakeRunner, pipeline, poll_interval=0.01)
+    task = asyncio.create_task(worker.run())
+    try:
+        await asyncio.to_thread(sink.flushing.wait, 5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert queue.counts() == {"pending": 1}
+        [job] = queue.lease("w2", limit=1, seconds=60)
+        assert job.attempts == 1
+    finally:
+        sink.release.set()
+        await pipeline.close()
+
+async def test_failed_write_fails_job(queue, tmp_path):
+    queue.submit("sequence.md", ["a"], num_runs=1)
+    pipeline = SinkPipeline([FailingSink()], flush_interval=3600).start()
+    worker = Worker(queue, FakeRunner, pipeline, poll_interval=0.01)
+    try:
+        await worker.run(exit_when_empty=True)
+        assert queue.counts() == {"failed": 1}
+        assert worker.completed == 0 and worker.failed == 2
+    finally:
+        await pipeline.close()
+
+async def test_released_half_finished_job_writes_every_section(queue, tmp_path, stub_provider, sequence_file):
+    queue.submit(sequence_file, [MODEL], num_runs=1)
+    output_dir = tmp_path / "results"
+
+    def make_runner(store: CheckpointStore) -> SequenceRunner:
+        return SequenceRunner(Settings(), checkpoints=store, metrics=Metrics())
+
+    async def work(until_hanging: bool) -> None:
+        pipeline = SinkPipeline([SqliteSink(output_dir)], flush_interval=3600).start()
+        worker = Worker(queue, make_runner, pipeline, poll_interval=0.01)
+        try:
+            if until_hanging:
+                task = asyncio.create_task(worker.run())
+                await asyncio.wait_for(stub_provider.hanging.wait(), 5)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+            else:
+                await worker.run(exit_when_empty=True)
+        finally:
+            await pipeline.close()
+
+    # The first worker dies in section 3, after checkpointing sections 1 and 2
+    stub_provider.hang_on = {"Question number 3"}
+    await work(until_hanging=True)
+    assert queue.counts() == {"pending": 1}
+
+    stub_provider.hang_on = set()
+    await work(until_hanging=False)
+    assert queue.counts() == {"done": 1}
+
+    # A worker that dies between writing the results and marking the job done
+    queue._db.execute("UPDATE jobs SET status = 'pending'")
+    await work(until_hanging=False)
+    assert queue.counts() == {"done": 1}
+    with sqlite3.connect(output_dir / "results.sqlite") as db:
+        assert db.execute("SELECT section_index FROM results ORDER BY section_index").fetchall() == [(1,), (2,), (3,)]
@@ -0,0 +1,48 @@
+"""
+Tests of the prompt cache breakpoints of Anthropic requests.
+"""
+from typing import Dict, List
+
+from sequencer.config import APIConfig, RunnerConfig
+from sequencer.providers import CACHE_CONTROL, AnthropicProvider, _cache_breakpoints
+
+MODEL = "claude-3-5-sonnet-20241022"
+
+def conversation(turns: int) -> List[Dict[str, str]]:
+    """Prompts and answers of `turns` finished turns, followed by a new prompt"""
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"Question {turn}?"})
+        messages.append({"role": "assistant", "content": f"Answer {turn}."})
+    return messages + [{"role": "user", "content": f"Question {turns}?"}]
+
+def breakpoints(messages: List[Dict]) -> List[int]:
+    return [i for i, message in enumerate(messages) if isinstance(message["content"], list)]
+
+def test_first_prompt_is_the_only_breakpoint():
+    marked = _cache_breakpoints(conversation(0))
+    assert breakpoints(marked) == [0]
+    assert marked[0]["content"] == [{"type": "text", "text": "Question 0?", "cache_control": CACHE_CONTROL}]
+
+def test_previous_prompt_and_new_prompt_are_breakpoints():
+    messages = conversation(3)
+    marked = _cache_breakpoints(messages)
+    # The previous request ended with prompt 2 (index 4), the new one ends with prompt 3 (index 6)
+    assert breakpoints(marked) == [4, 6]
+    assert [message["role"] for message in marked] == [message["role"] for message in messages]
+    assert [marked[i]["content"][0]["text"] for i in (4, 6)] == ["Question 2?", "Question 3?"]
+    # Unmarked messages are passed through, the input isn't modified
+    assert marked[5] is messages[5]
+    assert breakpoints(messages) == []
+
+def test_request_marks_the_system_prompt_only_with_prompt_caching():
+    messages = [{"role": "system", "content": "You are a test."}] + conversation(1)
+    cached = AnthropicProvider(APIConfig(api_key="test"), RunnerConfig(model=MODEL), client=object())
+    request = cached._request(messages, stream=False)
+    assert request["system"] == [{"type": "text", "text": "You are a test.", "cache_control": CACHE_CONTROL}]
+    assert breakpoints(request["messages"]) == [0, 2]
+
+    plain = AnthropicProvider(APIConfig(api_key="test"), RunnerConfig(model=MODEL, prompt_caching=False), client=object())
+    request = plain._request(messages, stream=False)
+    assert request["system"] == "You are a test."
+    assert request["messages"] == messages[1:]
@@ -0,0 +1,56 @@
+"""
+Tests of section dependencies and the prompt hashes built on them.
+"""
+from typing import List, Optional
+
+import pytest
+
+from sequencer.reader import PromptSection, prompt_hashes, section_context
+
+def sections(*depends: Optional[List[str]]) -> List[PromptSection]:
+    """System prompt and sections A, B, C, ... declaring the given dependencies"""
+    return [PromptSection(title="System Prompt", content="You are a test.")] + [
+        PromptSection(title=chr(ord("A") + i), content=f"Question {i}?", depends=depends[i])
+        for i in range(len(depends))
+    ]
+
+def test_sections_without_dependencies_see_every_earlier_one():
+    assert section_context(sections(None, None, None)) == [[], [], [1], [1, 2]]
+    assert section_context(sections(None, None, None), transitive=False) == [[], [], [1], [2]]
+
+def test_declared_dependencies_are_followed_transitively():
+    parsed = sections([], ["A"], [], ["B", "C"])
+    assert section_context(parsed) == [[], [], [1], [], [1, 2, 3]]
+    assert section_context(parsed, transitive=False) == [[], [], [1], [], [2, 3]]
+
+def test_dependency_on_repeated_title_is_the_closest_earlier_one():
+    parsed = sections(None, None, ["A"])
+    parsed[2].title = "A"
+    assert section_context(parsed)[3] == [1, 2]
+
+def test_unknown_dependency():
+    with pytest.raises(ValueError, match="unknown section"):
+        section_context(sections(None, ["Z"]))
+
+def test_hash_changes_with_the_sections_it_builds_on():
+    parsed = sections([], [], ["A"])
+    hashes = prompt_hashes(parsed)
+    assert len(set(hashes)) == 4
+    assert prompt_hashes(sections([], [], ["A"])) == hashes
+
+    edited = sections([], [], ["A"])
+    edited[1].content = "Another question?"
+    changed = prompt_hashes(edited)
+    # C depends on A, B doesn't
+    assert [old != new for old, new in zip(hashes, changed)] == [False, True, False, True]
+
+    edited = sections([], [], ["A"])
+    edited[0].content = "You are a different test."
+    assert all(old != new for old, new in zip(hashes, prompt_hashes(edited)))
+
+def test_hashes_follow_the_given_context():
+    parsed = sections(None, None, None)
+    assert prompt_hashes(parsed) == prompt_hashes(parsed, section_context(parsed))
+    # Only C's context differs: A and B, or just B
+    narrow = prompt_hashes(parsed, section_context(parsed, transitive=False))
+    assert [old != new for old, new in zip(prompt_hashes(parsed), narrow)] == [False, False, False, True]
@@ -0,0 +1,61 @@
+"""
+Tests of resuming interrupted runs without losing or repeating results.
+"""
+import asyncio
+import json
+import sqlite3
+from pathlib import Path
+from typing import List, Tuple
+
+from conftest import MODEL
+from sequencer.checkpoint import CheckpointStore, RunManifest
+from sequencer.config import Settings
+from sequencer.main import run_batch
+from sequencer.metrics import Metrics
+from sequencer.runner import SequenceRunner
+from sequencer.sinks import JsonlSink, SinkPipeline, SqliteSink
+
+def runner(store: CheckpointStore) -> SequenceRunner:
+    return SequenceRunner(Settings(), checkpoints=store, metrics=Metrics())
+
+def jsonl_sections(output_dir: Path) -> List[Tuple[int, int]]:
+    path = output_dir / "results.jsonl"
+    lines = path.read_text().splitlines() if path.exists() else []
+    return sorted((row["run_id"], row["section_index"]) for row in map(json.loads, lines))
+
+def sqlite_sections(output_dir: Path) -> List[Tuple[int, int]]:
+    with sqlite3.connect(output_dir / "results.sqlite") as db:
+        return sorted(db.execute("SELECT run_id, section_index FROM results").fetchall())
+
+async def invoke(store: CheckpointStore, sequence_file: Path, output_dir: Path, num_runs: int) -> None:
+    """One sequencer invocation, stopped like Ctrl-C if a request hangs"""
+    pipeline = SinkPipeline([JsonlSink(output_dir), SqliteSink(output_dir)]).start()
+    try:
+        await run_batch(runner(store), pipeline, sequence_file, [MODEL], num_runs, None, 8)
+    finally:
+        await pipeline.close()
+
+async def test_resume_writes_every_section_exactly_once(tmp_path, stub_provider, sequence_file):
+    output_dir = tmp_path / "results"
+    store = CheckpointStore.create(output_dir, RunManifest(sequence_file=str(sequence_file), models=[MODEL], num_runs=1))
+
+    # Interrupted at section 3, after sections 1 and 2 were checkpointed
+    stub_provider.hang_on = {"Question number 3"}
+    task = asyncio.create_task(invoke(store, sequence_file, output_dir, 1))
+    await asyncio.wait_for(stub_provider.hanging.wait(), 5)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert jsonl_sections(output_dir) == []
+
+    stub_provider.hang_on = set()
+    await invoke(CheckpointStore(store.run_dir), sequence_file, output_dir, 1)
+    expected = [(0, 1), (0, 2), (0, 3)]
+    assert jsonl_sections(output_dir) == expected
+    assert sqlite_sections(output_dir) == expected
+
+    # Resuming a finished run writes nothing again
+    requests = len(stub_provider.requests)
+    await invoke(CheckpointStore(store.run_dir), sequence_file, output_dir, 1)
+    assert len(stub_provider.requests) == requests
+    assert jsonl_sections(output_dir) == expected
+    assert sqlite_sections(output_dir) == expected
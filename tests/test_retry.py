@@ -0,0 +1,154 @@
+"""
+Tests of the retry engine and the per-provider circuit breakers.
+"""
+import asyncio
+
+import pytest
+
+from sequencer import retry
+from sequencer.config import RetryConfig
+from sequencer.metrics import Metrics
+from sequencer.providers import LLMError, RateLimitError, TransientError
+from sequencer.retry import CircuitBreaker, CircuitOpenError, RetryEngine
+
+class Clock:
+    """Stands in for time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retry.time, "monotonic", clock)
+    return clock
+
+def engine(**config) -> RetryEngine:
+    return RetryEngine(RetryConfig(**{"base_delay": 0.001, "max_delay": 0.01, **config}), Metrics())
+
+def flaky(*outcomes):
+    """Attempt function failing with the given errors in turn, then succeeding"""
+    attempts = []
+
+    async def attempt() -> str:
+        attempts.append(len(attempts))
+        if len(attempts) <= len(outcomes):
+            raise outcomes[len(attempts) - 1]
+        return "ok"
+
+    return attempt, attempts
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker("openai", failure_threshold=3, reset_timeout=30)
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("openai", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    assert not breaker.record_failure()
+    assert breaker.state == "closed"
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("openai", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == "half-open"
+    breaker.before_call()
+    # Only the probe, until it's done
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("openai", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()
+    assert breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 29
+    assert breaker.state == "open"
+
+def test_released_probe_lets_next_one_through(clock):
+    breaker = CircuitBreaker("openai", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+
+async def test_retries_transient_errors():
+    attempt, attempts = flaky(TransientError("overloaded", status=529), TransientError("timeout"))
+    assert await engine().call("openai", attempt, max_retries=3) == "ok"
+    assert len(attempts) == 3
+
+async def test_gives_up_after_max_retries():
+    attempt, attempts = flaky(*[TransientError("down", status=503)] * 5)
+    with pytest.raises(TransientError):
+        await engine().call("openai", attempt, max_retries=2)
+    assert len(attempts) == 3
+
+async def test_non_retryable_error_is_raised_at_once():
+    attempt, attempts = flaky(LLMError("bad request", status=400))
+    with pytest.raises(LLMError):
+        await engine().call("openai", attempt, max_retries=3)
+    assert len(attempts) == 1
+
+async def test_can_retry_stops_retries():
+    attempt, attempts = flaky(TransientError("dropped"))
+    with pytest.raises(TransientError):
+        await engine().call("openai", attempt, max_retries=3, can_retry=lambda: False)
+    assert len(attempts) == 1
+
+async def test_retry_after_beyond_max_delay_is_not_waited_for():
+    attempt, attempts = flaky(RateLimitError("slow down", status=429, retry_after=120))
+    with pytest.raises(RateLimitError):
+        await engine().call("openai", attempt, max_retries=3)
+    assert len(attempts) == 1
+
+async def test_rate_limits_do_not_open_the_breaker():
+    retries = engine(failure_threshold=1)
+    attempt, _ = flaky(RateLimitError("slow down", status=429, retry_after=0), RateLimitError("slow down", status=429))
+    assert await retries.call("openai", attempt, max_retries=3) == "ok"
+    assert retries.breaker("openai").state == "closed"
+
+async def test_open_breaker_fails_fast_per_provider():
+    retries = engine(failure_threshold=2, reset_timeout=60)
+    attempt, attempts = flaky(*[TransientError("down", status=503)] * 5)
+    with pytest.raises(CircuitOpenError):
+        await retries.call("together", attempt, max_retries=3)
+    assert len(attempts) == 2
+    assert retries.breaker("together").state == "open"
+    with pytest.raises(CircuitOpenError):
+        await retries.call("together", attempt)
+    # Other providers are unaffected
+    attempt, _ = flaky()
+    assert await retries.call("openai", attempt) == "ok"
+
+async def test_cancelled_probe_releases_breaker(clock):
+    retries = engine(failure_threshold=1, reset_timeout=30)
+    retries.breaker("openai").record_failure()
+    clock.now += 30
+
+    async def hang() -> str:
+        await asyncio.sleep(10)
+        return "late"
+
+    task = asyncio.create_task(retries.call("openai", hang))
+    await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    attempt, _ = flaky()
+    assert await retries.call("openai", attempt) == "ok"
@@ -0,0 +1,71 @@
+"""
+Tests of routing model aliases across their endpoints.
+"""
+import random
+from collections import Counter
+
+import pytest
+
+from sequencer.config import RetryConfig
+from sequencer.metrics import Metrics
+from sequencer.retry import RetryEngine
+from sequencer.router import Router
+from sequencer.scheduler import Scheduler
+
+TOGETHER = "meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo"
+SAMBANOVA = "Meta-Llama-3.1-405B-Instruct"
+ALIAS = "llama-3.1-405b"
+
+def router() -> Router:
+    metrics = Metrics()
+    router = Router({ALIAS: [TOGETHER, SAMBANOVA]}, Scheduler(), RetryEngine(RetryConfig(), metrics), metrics)
+    router._random = random.Random(0)
+    return router
+
+def picks(router: Router, count: int = 1000) -> Counter:
+    return Counter(router.choose(ALIAS) for _ in range(count))
+
+def test_aliases_and_endpoints():
+    routes = router()
+    assert routes.is_alias(ALIAS) and not routes.is_alias(TOGETHER)
+    assert routes.endpoints(ALIAS) == [TOGETHER, SAMBANOVA]
+    assert routes.endpoints(TOGETHER) == [TOGETHER]
+
+def test_unknown_endpoints_share_traffic():
+    counts = picks(router())
+    assert 400 < counts[TOGETHER] < 600
+
+def test_failing_endpoint_loses_traffic():
+    routes = router()
+    for _ in range(5):
+        routes.record(TOGETHER, 1.0)
+        routes.record(SAMBANOVA, 1.0)
+    for _ in range(3):
+        routes.record(TOGETHER, ok=False)
+    assert routes.stats[TOGETHER].error_rate > 0.4
+    counts = picks(routes)
+    assert counts[SAMBANOVA] > 2 * counts[TOGETHER] > 0
+
+    # Successes bring the failed endpoint back
+    for _ in range(20):
+        routes.record(TOGETHER, 1.0)
+    assert 400 < picks(routes)[TOGETHER] < 600
+
+def test_faster_endpoint_gets_more_traffic():
+    routes = router()
+    routes.record(TOGETHER, 0.5)
+    routes.record(SAMBANOVA, 2.0)
+    counts = picks(routes)
+    assert 750 < counts[TOGETHER] < 850
+
+def test_open_breaker_is_skipped_while_others_remain():
+    routes = router()
+    for _ in range(RetryConfig().failure_threshold):
+        routes.retries.breaker("together").record_failure()
+    assert picks(routes, 100) == Counter({SAMBANOVA: 100})
+    # Excluding the healthy endpoint leaves only the open one, which is tried anyway
+    assert routes.choose(ALIAS, exclude=[SAMBANOVA]) == TOGETHER
+
+def test_every_endpoint_excluded():
+    with pytest.raises(ValueError):
+        router().choose(ALIAS, exclude=[TOGETHER, SAMBANOVA])
@@ -0,0 +1,54 @@
+"""
+Tests of sharing one n-choice request between runs.
+"""
+import asyncio
+from typing import List
+
+import pytest
+
+from sequencer.providers import Completion, LLMError, TransientError
+from sequencer.sampling import SampleGroup
+
+def choices(count: int) -> List[Completion]:
+    return [Completion(text=f"choice {i}") for i in range(count)]
+
+async def test_runs_take_one_choice_each():
+    group = SampleGroup(3)
+    requests = []
+
+    async def fetch(n: int) -> List[Completion]:
+        requests.append(n)
+        await asyncio.sleep(0.01)
+        return choices(n)
+
+    taken = await asyncio.gather(*(group.take(1, fetch) for _ in range(3)))
+    assert requests == [3]
+    assert [completion.text for completion, _ in taken] == ["choice 0", "choice 1", "choice 2"]
+    assert [shared for _, shared in taken] == [False, True, True]
+
+async def test_leftover_runs_get_none_when_fewer_choices():
+    group = SampleGroup(3)
+
+    async def fetch(n: int) -> List[Completion]:
+        return choices(1)
+
+    taken = await asyncio.gather(*(group.take(1, fetch) for _ in range(3)))
+    assert taken[0][0].text == "choice 0"
+    assert taken[1:] == [(None, False), (None, False)]
+
+async def test_rejected_request_falls_back_to_one_request_per_run():
+    group = SampleGroup(2)
+
+    async def fetch(n: int) -> List[Completion]:
+        raise LLMError("n must be 1", status=400)
+
+    assert await asyncio.gather(group.take(1, fetch), group.take(1, fetch)) == [(None, False), (None, False)]
+
+async def test_retryable_error_is_raised():
+    group = SampleGroup(2)
+
+    async def fetch(n: int) -> List[Completion]:
+        raise TransientError("overloaded", status=529)
+
+    with pytest.raises(TransientError):
+        await group.take(1, fetch)
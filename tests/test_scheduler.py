@@ -0,0 +1,104 @@
+"""
+Tests of the token buckets and per-provider limits of the scheduler.
+"""
+import asyncio
+from typing import List
+
+import pytest
+
+from sequencer import scheduler
+from sequencer.config import ProviderLimits
+from sequencer.scheduler import ProviderScheduler, Scheduler, TokenBucket
+
+class Clock:
+    """Stands in for time.monotonic, and for asyncio.sleep by moving the time on"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps: List[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, "monotonic", clock)
+    monkeypatch.setattr(scheduler.asyncio, "sleep", clock.sleep)
+    return clock
+
+async def test_bucket_starts_full_then_waits_for_refill(clock):
+    bucket = TokenBucket(per_minute=60)
+    for _ in range(60):
+        await bucket.acquire()
+    assert clock.sleeps == []
+    await bucket.acquire()
+    # One token per second
+    assert clock.sleeps == [pytest.approx(1.0)]
+    await bucket.acquire(3)
+    assert clock.sleeps[1:] == [pytest.approx(3.0)]
+
+async def test_bucket_refills_continuously_up_to_capacity(clock):
+    bucket = TokenBucket(per_minute=120)
+    await bucket.acquire(120)
+    assert bucket.available() == 0.0
+    clock.now += 15
+    assert bucket.available() == pytest.approx(0.25)
+    clock.now += 3600
+    assert bucket.available() == 1.0
+
+async def test_oversized_request_takes_the_whole_bucket(clock):
+    bucket = TokenBucket(per_minute=100)
+    assert await bucket.acquire(500) == 100.0
+    assert clock.sleeps == []
+    await bucket.acquire(50)
+    assert clock.sleeps == [pytest.approx(30.0)]
+
+async def test_refund_settles_with_actual_usage(clock):
+    bucket = TokenBucket(per_minute=1000)
+    await bucket.acquire(800)
+    bucket.refund(600)
+    assert bucket.available() == pytest.approx(0.8)
+    bucket.refund(-300)
+    assert bucket.available() == pytest.approx(0.5)
+    bucket.refund(5000)
+    assert bucket.available() == 1.0
+
+async def test_slot_reserves_tokens_and_refunds_the_unused(clock):
+    provider = ProviderScheduler("openai", ProviderLimits(tokens_per_minute=1000))
+    async with provider.slot(400) as reservation:
+        assert reservation.reserved == 400
+        assert provider.headroom() == pytest.approx(0.6)
+        reservation.used = 100
+    assert provider.headroom() == pytest.approx(0.9)
+
+async def test_concurrency_limit_holds_back_requests():
+    provider = ProviderScheduler("openai", ProviderLimits(max_concurrency=2))
+    release = asyncio.Event()
+    running = 0
+    peak = 0
+
+    async def request() -> None:
+        nonlocal running, peak
+        async with provider.slot():
+            running += 1
+            peak = max(peak, running)
+            await release.wait()
+            running -= 1
+
+    tasks = [asyncio.create_task(request()) for _ in range(5)]
+    await asyncio.sleep(0.01)
+    assert (running, provider.pending, provider.headroom()) == (2, 5, 0.0)
+    release.set()
+    await asyncio.gather(*tasks)
+    assert (peak, provider.pending, provider.headroom()) == (2, 0, 1.0)
+
+def test_providers_get_their_own_limits():
+    limits = Scheduler({"openai": ProviderLimits(max_concurrency=3)}, default_limits=ProviderLimits(max_concurrency=1))
+    assert limits.for_provider("openai").limits.max_concurrency == 3
+    assert limits.for_provider("anthropic").limits.max_concurrency == 1
+    assert limits.for_provider("openai") is limits.for_provider("openai")
@@ -0,0 +1,55 @@
+"""
+Tests of which sequence files the service may read and of its warm start.
+"""
+import pytest
+
+from sequencer.clients import ClientRegistry
+from sequencer.config import PoolConfig, Settings
+from sequencer.providers import warm_clients
+from sequencer.service import BLUEPRINT_DIR, SequenceService
+
+def service(*roots) -> SequenceService:
+    # Finding sequence files doesn't touch the runner
+    return SequenceService(runner=None, roots=roots)
+
+def test_blueprints_by_name_and_path():
+    assert service()._find_sequence("sequence.md") == (BLUEPRINT_DIR / "sequence.md").resolve()
+    assert service()._find_sequence(str(BLUEPRINT_DIR / "sequence.md")) == (BLUEPRINT_DIR / "sequence.md").resolve()
+
+def test_paths_outside_roots_are_refused(tmp_path):
+    sequence = tmp_path / "sequence.md"
+    sequence.write_text("# System Prompt\n")
+    with pytest.raises(PermissionError):
+        service()._find_sequence(str(sequence))
+    with pytest.raises(PermissionError):
+        service()._find_sequence("../../../../../../../../etc/passwd")
+    assert service(tmp_path)._find_sequence(str(sequence)) == sequence.resolve()
+
+def test_symlinks_out_of_a_root_are_refused(tmp_path):
+    root, outside = tmp_path / "root", tmp_path / "outside"
+    root.mkdir()
+    outside.mkdir()
+    (outside / "secret.md").write_text("secret")
+    (root / "link.md").symlink_to(outside / "secret.md")
+    with pytest.raises(PermissionError):
+        service(root)._find_sequence(str(root / "link.md"))
+
+def test_missing_file_within_roots(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        service(tmp_path)._find_sequence(str(tmp_path / "missing.md"))
+    with pytest.raises(FileNotFoundError):
+        service()._find_sequence("missing.md")
+
+async def test_warm_start_creates_clients_of_providers_with_keys():
+    keys = {f"{name}_api_key": None for name in ("openai", "anthropic", "together", "hf", "cerebras", "sambanova")}
+    settings = Settings(**keys | {"openai_api_key": "test", "cerebras_api_key": "test"})
+    clients = ClientRegistry(PoolConfig(shards=2))
+    try:
+        assert warm_clients(settings, clients) == ["openai", "cerebras"]
+        assert {provider for provider, _ in clients._clients} == {"openai"}
+        assert all(len(shards) == 2 for shards in clients._clients.values())
+        # Requests get the clients created at startup
+        created = [client for shards in clients._clients.values() for client in shards]
+        assert clients.openai(settings.openai_config) in created
+    finally:
+        await clients.aclose()
@@ -0,0 +1,74 @@
+"""
+Tests of the result sinks and the pipeline writing to them.
+"""
+import json
+import asyncio
+import sqlite3
+from typing import List
+
+from conftest import make_result
+from sequencer.runner import RunResult
+from sequencer.sinks import JsonlSink, MarkdownSink, ResultSink, SinkPipeline, SqliteSink
+
+class CountingSink(ResultSink):
+    """Counts writes and flushes"""
+
+    def __init__(self):
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, results: List[RunResult]) -> None:
+        self.writes += 1
+
+    def flush(self) -> None:
+        self.flushes += 1
+
+def results() -> List[RunResult]:
+    # Only restored results that were written before are skipped
+    return [make_result(1, restored=True, recorded=True), make_result(2, restored=True), make_result(3)]
+
+def test_jsonl_skips_recorded_results(tmp_path):
+    sink = JsonlSink(tmp_path)
+    sink.write(results())
+    sink.close()
+    lines = (tmp_path / "results.jsonl").read_text().splitlines()
+    assert [json.loads(line)["section_index"] for line in lines] == [2, 3]
+
+def test_sqlite_skips_recorded_results(tmp_path):
+    sink = SqliteSink(tmp_path)
+    sink.write(results())
+    sink.close()
+    with sqlite3.connect(tmp_path / "results.sqlite") as db:
+        assert db.execute("SELECT section_index FROM results").fetchall() == [(2,), (3,)]
+
+def test_markdown_renders_recorded_results(tmp_path):
+    sink = MarkdownSink(tmp_path)
+    sink.write(results())
+    sink.close()
+    [path] = tmp_path.glob("**/*.md")
+    text = path.read_text()
+    assert "answer 1" in text and "answer 2" in text
+
+async def test_pipeline_writes_everything_on_close(tmp_path):
+    pipeline = SinkPipeline([JsonlSink(tmp_path)], batch_size=2, flush_interval=3600).start()
+    for index in range(5):
+        await pipeline.put([make_result(index)])
+    await pipeline.close()
+    lines = (tmp_path / "results.jsonl").read_text().splitlines()
+    assert [json.loads(line)["section_index"] for line in lines] == [0, 1, 2, 3, 4]
+
+async def test_pipeline_flushes_only_after_writes():
+    sink = CountingSink()
+    pipeline = SinkPipeline([sink], flush_interval=0.01).start()
+    await asyncio.sleep(0.05)
+    assert sink.flushes == 0
+    await pipeline.put([make_result(1)])
+    await asyncio.sleep(0.05)
+    assert (sink.writes, sink.flushes) == (1, 1)
+    # Idle intervals and a durable write of nothing don't flush again
+    await asyncio.sleep(0.05)
+    await pipeline.write_durable([])
+    assert sink.flushes == 1
+    await pipeline.write_durable([make_result(2)])
+    assert (sink.writes, sink.flushes) == (2, 2)
+    await pipeline.close()
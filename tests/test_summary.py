@@ -0,0 +1,19 @@
+"""
+Tests of the in-memory batch summary.
+"""
+from conftest import MODEL, make_result
+from sequencer.summary import RunSummary
+
+def test_counts_and_percentiles():
+    summary = RunSummary()
+    summary.add([make_result(seconds=seconds) for seconds in (1, 2, 3, 4)] + [make_result(seconds=9, error="boom")])
+    assert (summary.ok, summary.failed, len(summary)) == (4, 1, 5)
+    assert summary.percentile(MODEL, 50) == 2
+    assert summary.percentile(MODEL, 95) == 4
+
+def test_restored_results_only_counted_as_restored():
+    summary = RunSummary()
+    summary.add([make_result(seconds=1), make_result(seconds=100, restored=True), make_result(seconds=100, error="old", restored=True)])
+    assert (summary.ok, summary.failed, summary.restored) == (1, 0, 2)
+    assert summary.percentile(MODEL, 95) == 1
+    assert len(list(summary.records())) == 1
@@ -0,0 +1,51 @@
+"""
+Tests of streaming responses into markdown files.
+"""
+import asyncio
+
+from sequencer.writer import StreamFile
+
+async def test_chunks_are_buffered_until_the_timer(tmp_path):
+    file = StreamFile(tmp_path / "run.md", flush_interval=0.05)
+    file.start_section("Section", "prompt")
+    file.write("Hello")
+    file.write(", world")
+    assert file.filepath.read_text() == ""
+    await asyncio.sleep(0.1)
+    assert file.filepath.read_text().endswith(">> ai:\n\nHello, world")
+    file.close()
+
+async def test_section_end_and_close_flush(tmp_path):
+    file = StreamFile(tmp_path / "run.md", flush_interval=3600)
+    file.start_section("Section", "prompt")
+    file.write("answer")
+    file.end_section()
+    assert file.filepath.read_text().endswith("answer\n\n---\n\n")
+    file.start_section("Next", "prompt")
+    file.close()
+    assert file.filepath.read_text().endswith("# Next\n\n>> user:\n\n```\nprompt\n```\n\n---\n\n>> ai:\n\n")
+
+async def test_large_buffer_is_written_right_away(tmp_path):
+    file = StreamFile(tmp_path / "run.md", flush_interval=3600, max_buffered=10)
+    file.write("x" * 10)
+    assert file.filepath.read_text() == "x" * 10
+    file.close()
+
+def test_writes_through_without_event_loop(tmp_path):
+    file = StreamFile(tmp_path / "run.md")
+    file.write("chunk")
+    assert file.filepath.read_text() == "chunk"
+    file.close()
+
+async def test_concurrent_sections_do_not_interleave(tmp_path):
+    file = StreamFile(tmp_path / "run.md")
+    stream = file.sections()
+    stream.start_section(1, "One", "first")
+    stream.start_section(2, "Two", "second")
+    stream.writer(2)("two")
+    stream.writer(1)("one")
+    stream.end_section(2)
+    stream.end_section(1)
+    file.close()
+    text = file.filepath.read_text()
+    assert text.index("# One") < text.index("one") < text.index("# Two") < text.index("two")